@@ -1,50 +1,379 @@
 import base64
 import json
-
-from flask import Flask, request, Response
+import time
+from itertools import islice
+from json.encoder import encode_basestring_ascii
+from time import perf_counter
+from urllib.parse import parse_qsl, quote
 
 from instance.settings import app_config
+from shared.cache import ExpiringLRUCache, SharedMemoryCacheTier
+from shared.metrics import REGISTRY, stage_seconds
+from shared.request_object import InvalidRequestObject
 from shared.response_object import ResponseFailure, ResponseSuccess
-from use_cases.generate_secure_link_use_cases import GenerateSecureLinkUseCase
-from use_cases.request_objects import GenerateSecureLinkRequestObject
+from use_cases.generate_secure_link_use_cases import (GenerateSecureLinkBatchUseCase, GenerateSecureLinkUseCase,
+                                                      GenerateSignedPlaylistUseCase)
+from use_cases.request_objects import (GenerateSecureLinkBatchRequestObject, GenerateSecureLinkRequestObject,
+                                      GenerateSignedPlaylistRequestObject)
+from use_cases.secure_link_md5 import DEFAULT_PROFILE, compile_secure_link_profiles
 
 STATUS_CODES = {
     ResponseSuccess.SUCCESS: 200,
     ResponseFailure.RESOURCE_ERROR: 404,
     ResponseFailure.PARAMETERS_ERROR: 400,
-    ResponseFailure.SYSTEM_ERROR: 500
+    ResponseFailure.SYSTEM_ERROR: 500,
+    ResponseFailure.RATE_LIMIT_ERROR: 429,
+    ResponseFailure.OVERLOAD_ERROR: 503
+}
+REDIRECT_STATUS_CODE = 302
+# "/" responses: the legacy body is the json string without quotes, text is the bare link or error message
+RESPONSE_FORMATS = {
+    'legacy': 'text/html; charset=utf-8',
+    'text': 'text/plain; charset=utf-8',
+    'json': 'application/json',
 }
+MEDIA_TYPE_FORMATS = {'*/*': 'legacy', 'text/*': 'legacy', 'text/html': 'legacy', 'text/plain': 'text',
+                      'application/json': 'json'}
+# Accept headers, which clients usually send, are looked up without parsing
+ACCEPT_FORMATS = dict(MEDIA_TYPE_FORMATS, **{'': 'legacy'})
+# characters, which are kept in Location headers, the rest of the signed link is percent-encoded
+LOCATION_SAFE_CHARACTERS = "/?&=:;,+$-_.!~*'()#%@"
+# bytes of a /stream line besides the base64 encoded url (keys, expiration time, ip-address, password and profile)
+# and of a /playlist line besides the url (tag and other attributes)
+LINE_OVERHEAD = 1024
+
+
+def _get_request_args(query_string: bytes):
+    """Parse the raw query string like Flask request.args does: the first value of every argument wins."""
+    request_args = {}
+    for key, value in parse_qsl(query_string.decode('utf-8', 'replace'), keep_blank_values=True, errors='replace'):
+        request_args.setdefault(key, value)
+    return request_args
 
 
-def _create_request_object_from_request_args(request_args: dict):
+def _get_request_params(request_args: dict, url_max_length: int=GenerateSecureLinkRequestObject.URL_MAX_LENGTH):
     expires = request_args.get('t')
-    if expires:
+    # only strings of the query string are converted, json numbers of batch items are validated as they are
+    if isinstance(expires, str):
         try:
             expires = int(expires)
         except ValueError:
             pass
     url = request_args.get('u')
-    if url:
-        url = base64.b64decode(url).decode('utf-8')
+    # json values of batch items can be of any type
+    if not isinstance(url, str) or len(url) > (url_max_length + 2) // 3 * 4:
+        url = None
+    else:
+        try:
+            url = base64.b64decode(url).decode('utf-8')
+        except (TypeError, ValueError):
+            url = None
     params = {
         'expires': expires,
         'url': url,
         'ip_address': request_args.get('ip'),
-        'password': request_args.get('p')
+        'password': request_args.get('p'),
+        'profile': request_args.get('profile', DEFAULT_PROFILE)
     }
-    return GenerateSecureLinkRequestObject(**params)
+    return params
+
+
+def _negotiate_response_format(accept: str):
+    """Return the format of "/" response preferred by the Accept header, the legacy one if none is acceptable."""
+    response_format = ACCEPT_FORMATS.get(accept)
+    if response_format is not None:
+        return response_format
+    response_format, best_quality = 'legacy', 0.0
+    for media_range in accept.split(','):
+        media_type, *media_params = media_range.split(';')
+        media_type_format = MEDIA_TYPE_FORMATS.get(media_type.strip().lower())
+        if media_type_format is None:
+            continue
+        quality = 1.0
+        for media_param in media_params:
+            name, _, value = media_param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > best_quality:
+            response_format, best_quality = media_type_format, quality
+    return response_format
+
+
+def _serialize_link_response(response, response_format: str):
+    """Return the body and the content type of "/" response in the format."""
+    if response_format == 'text':
+        body = response.value if response else response.value['message']
+    else:
+        # links are strings, which are encoded the same as by json.dumps without its dispatch by type
+        body = encode_basestring_ascii(response.value) if response else json.dumps(response.value)
+        if response_format == 'legacy':
+            body = body.strip('"')
+    return body.encode('utf-8'), RESPONSE_FORMATS[response_format]
+
+
+def _get_redirect_location(link: str, base_url: str=''):
+    return base_url + quote(link, safe=LOCATION_SAFE_CHARACTERS)
+
+
+def _create_request_object_from_request_args(request_args: dict,
+                                             url_max_length: int=GenerateSecureLinkRequestObject.URL_MAX_LENGTH,
+                                             profiles=GenerateSecureLinkRequestObject.PROFILES,
+                                             expires_bucket_seconds: int=0):
+    params = _get_request_params(request_args, url_max_length)
+    return GenerateSecureLinkRequestObject(url_max_length=url_max_length, profiles=profiles,
+                                           expires_bucket_seconds=expires_bucket_seconds, **params)
+
+
+def _create_request_object_from_batch_item(item,
+                                           url_max_length: int=GenerateSecureLinkRequestObject.URL_MAX_LENGTH,
+                                           profiles=GenerateSecureLinkRequestObject.PROFILES,
+                                           expires_bucket_seconds: int=0):
+    if not isinstance(item, dict):
+        invalid_request = InvalidRequestObject()
+        invalid_request.add_error('item', 'Is not object')
+        return invalid_request
+    return _create_request_object_from_request_args(item, url_max_length, profiles, expires_bucket_seconds)
+
+
+def _read_lines(stream, max_line_length: int):
+    """Lazily yield lines of the stream, None instead of lines longer than max_line_length."""
+    while True:
+        line = stream.readline(max_line_length)
+        if not line:
+            return
+        if len(line) == max_line_length and not line.endswith(b'\n'):
+            # the rest of the line is skipped without keeping it in memory
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(max_line_length)
+            line = None
+        yield line
+
+
+def _create_request_objects_from_ndjson(stream,
+                                        url_max_length: int=GenerateSecureLinkRequestObject.URL_MAX_LENGTH,
+                                        profiles=GenerateSecureLinkRequestObject.PROFILES,
+                                        expires_bucket_seconds: int=0):
+    for line in _read_lines(stream, (url_max_length + 2) // 3 * 4 + LINE_OVERHEAD):
+        if line is None:
+            invalid_request = InvalidRequestObject()
+            invalid_request.add_error('item', 'Is too long')
+            yield invalid_request
+            continue
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line.decode('utf-8'))
+        except ValueError:
+            invalid_request = InvalidRequestObject()
+            invalid_request.add_error('item', 'Is not correct json')
+            yield invalid_request
+            continue
+        yield _create_request_object_from_batch_item(item, url_max_length, profiles, expires_bucket_seconds)
+
+
+def _serialize_ndjson(responses, chunk_size: int):
+    responses = iter(responses)
+    while True:
+        chunk = ''.join(json.dumps(response.value) + '\n' for response in islice(responses, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _join_lines(lines, chunk_size: int):
+    lines = iter(lines)
+    while True:
+        chunk = ''.join(islice(lines, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _load_config(config_name):
+    """Return the configuration as a dict, the same way Flask app.config.from_object does."""
+    config_object = app_config[config_name]
+    return {key: getattr(config_object, key) for key in dir(config_object) if key.isupper()}
+
+
+def _create_cache(config):
+    if not config['CACHE_SIZE']:
+        return None
+    shared_tier = None
+    if config['CACHE_SHARED_SLOTS']:
+        shared_tier = SharedMemoryCacheTier(slots=config['CACHE_SHARED_SLOTS'], path=config['CACHE_SHARED_PATH'])
+    return ExpiringLRUCache(max_size=config['CACHE_SIZE'], shared_tier=shared_tier)
+
+
+def _create_admission_controller(config):
+    if not config['ADMISSION_RATE'] and not config['ADMISSION_MAX_CONCURRENCY']:
+        return None
+    # imported only here, because multiprocessing slows down the start
+    from shared.admission import AdmissionController, SharedTokenBuckets
+    buckets = None
+    if config['ADMISSION_RATE']:
+        buckets = SharedTokenBuckets(rate=config['ADMISSION_RATE'], burst=config['ADMISSION_BURST'],
+                                     slots=config['ADMISSION_CLIENT_SLOTS'])
+    return AdmissionController(buckets=buckets, max_concurrency=config['ADMISSION_MAX_CONCURRENCY'])
+
+
+def _create_access_log(config):
+    if not config['ACCESS_LOG_PATH']:
+        return None
+    # imported only here, so the writer thread is not involved unless the access log is enabled
+    from api.access_log import AccessLog
+    return AccessLog(path=config['ACCESS_LOG_PATH'], sample_rate=config['ACCESS_LOG_SAMPLE_RATE'],
+                     max_queue_size=config['ACCESS_LOG_QUEUE_SIZE'], max_bytes=config['ACCESS_LOG_MAX_BYTES'],
+                     backup_count=config['ACCESS_LOG_BACKUP_COUNT'])
+
+
+def _create_presign_scheduler(config, profiles: dict):
+    if not config['PRESIGN_CATALOG_PATH']:
+        return None
+    # imported only here, so the scheduler thread is not involved unless pre-signing is enabled
+    from api.presign import PresignScheduler, load_catalog
+    catalog = load_catalog(config['PRESIGN_CATALOG_PATH'], expressions=config['SECURE_LINK_PROFILES'],
+                           expires_in=config['PRESIGN_EXPIRES_IN'], max_entries=config['PRESIGN_MAX_ENTRIES'],
+                           url_max_length=config['URL_MAX_LENGTH'])
+    return PresignScheduler(catalog, expires_bucket_seconds=config['EXPIRES_BUCKET_SECONDS'], profiles=profiles,
+                            expressions=config['SECURE_LINK_PROFILES'], ahead_seconds=config['PRESIGN_AHEAD_SECONDS'],
+                            interval=config['PRESIGN_INTERVAL'], cpu_share=config['PRESIGN_CPU_SHARE'])
+
+
+def create_wsgi_application(config_name):
+    """Return the WSGI application selected by the WSGI_APP setting: the Flask one or the lean one."""
+    if app_config[config_name].WSGI_APP == 'lean':
+        from api.wsgi import create_lean_wsgi_app
+        return create_lean_wsgi_app(config_name)
+    return create_app(config_name)
 
 
 def create_app(config_name):
+    # Flask is imported only here, so the lean WSGI and the ASGI applications start without it
+    from flask import Flask, request, Response, stream_with_context
+
     app = Flask(__name__, instance_relative_config=True)
     app.config.from_object(app_config[config_name])
     app.config.from_pyfile('settings.py')
+    cache = app.extensions['secure_link_cache'] = _create_cache(app.config)
+    profiles = compile_secure_link_profiles(app.config['SECURE_LINK_PROFILES'])
+    url_max_length = app.config['URL_MAX_LENGTH']
+    expires_bucket_seconds = app.config['EXPIRES_BUCKET_SECONDS']
+    presigned = app.extensions['secure_link_presign'] = _create_presign_scheduler(app.config, profiles)
+    admission = app.extensions['secure_link_admission'] = _create_admission_controller(app.config)
+    access_log = app.extensions['secure_link_access_log'] = _create_access_log(app.config)
+    client_header = app.config['ADMISSION_CLIENT_HEADER']
+    redirect_base_url = app.config['REDIRECT_BASE_URL']
+
+    def get_client():
+        return request.headers.get(client_header, '') if client_header else request.remote_addr or ''
+
+    def log_access(started, params, response_type, status):
+        # the password is left out on purpose
+        access_log.log(get_client(), params['url'], params['ip_address'], params['expires'], params['profile'],
+                       response_type, status, perf_counter() - started)
 
     @app.route('/')
     def index():
-        request_object = _create_request_object_from_request_args(request.args)
-        use_case = GenerateSecureLinkUseCase()
+        if admission is None:
+            return sign()
+        started = perf_counter()
+        rejection = admission.admit(get_client())
+        if rejection is not None:
+            if access_log is not None:
+                log_access(started, _get_request_params(request.args, url_max_length), rejection.type,
+                           STATUS_CODES[rejection.type])
+            http_response = Response(json.dumps(rejection.value), status=STATUS_CODES[rejection.type])
+            http_response.headers['Retry-After'] = str(admission.retry_after)
+            return http_response
+        try:
+            return sign()
+        finally:
+            admission.release()
+
+    def sign():
+        started = perf_counter()
+        params = _get_request_params(request.args, url_max_length)
+        parsed = perf_counter()
+        request_object = GenerateSecureLinkRequestObject(url_max_length=url_max_length, profiles=profiles,
+                                                         expires_bucket_seconds=expires_bucket_seconds, **params)
+        validated = perf_counter()
+        use_case = GenerateSecureLinkUseCase(cache=cache, profiles=profiles, presigned=presigned)
+        response = use_case.execute(request_object)
+        executed = perf_counter()
+        redirect = bool(response) and request.args.get('redirect') == '1'
+        if redirect:
+            # the client follows the link right away instead of parsing the body first
+            http_response = Response(status=REDIRECT_STATUS_CODE)
+            http_response.headers['Location'] = _get_redirect_location(response.value, redirect_base_url)
+        else:
+            body, content_type = _serialize_link_response(
+                response, _negotiate_response_format(request.headers.get('Accept', '')))
+            http_response = Response(body, status=STATUS_CODES[response.type], content_type=content_type)
+        if expires_bucket_seconds and response:
+            # the link depends on the query only, so caches in front of the api may serve it until it expires
+            http_response.cache_control.public = True
+            http_response.cache_control.max_age = max(0, request_object.expires - int(time.time()))
+            if not redirect:
+                http_response.vary.add('Accept')
+                http_response.add_etag()
+                http_response.make_conditional(request)
+        stage_seconds.observe('parse', parsed - started)
+        stage_seconds.observe('validate', validated - parsed)
+        stage_seconds.observe('serialize', perf_counter() - executed)
+        if access_log is not None:
+            log_access(started, params, response.type, http_response.status_code)
+        return http_response
+
+    @app.route('/batch', methods=['POST'])
+    def batch():
+        items = request.get_json(force=True, silent=True)
+        if isinstance(items, list):
+            items = [_create_request_object_from_batch_item(item, url_max_length, profiles, expires_bucket_seconds)
+                     for item in items]
+        request_object = GenerateSecureLinkBatchRequestObject(items=items, max_size=app.config['BATCH_MAX_SIZE'])
+        item_use_case = GenerateSecureLinkUseCase(cache=cache, profiles=profiles, presigned=presigned)
+        use_case = GenerateSecureLinkBatchUseCase(item_use_case=item_use_case)
         response = use_case.execute(request_object)
-        return Response(json.dumps(response.value).strip('"'), status=STATUS_CODES[response.type])
+        return Response(json.dumps(response.value), status=STATUS_CODES[response.type], mimetype='application/json')
+
+    @app.route('/stream', methods=['POST'])
+    def stream():
+        request_objects = _create_request_objects_from_ndjson(request.stream, url_max_length, profiles,
+                                                              expires_bucket_seconds)
+        item_use_case = GenerateSecureLinkUseCase(cache=cache, profiles=profiles, presigned=presigned)
+        use_case = GenerateSecureLinkBatchUseCase(item_use_case=item_use_case)
+        responses = use_case.process_items(request_objects)
+        body = _serialize_ndjson(responses, chunk_size=app.config['STREAM_CHUNK_SIZE'])
+        return Response(stream_with_context(body), mimetype='application/x-ndjson')
+
+    @app.route('/playlist', methods=['POST'])
+    def playlist():
+        params = _get_request_params(request.args, url_max_length)
+        lines = ('# line: Is too long\n' if line is None else line.decode('utf-8', 'replace')
+                 for line in _read_lines(request.stream, url_max_length + LINE_OVERHEAD))
+        request_object = GenerateSignedPlaylistRequestObject(lines=lines, url_max_length=url_max_length,
+                                                             profiles=profiles,
+                                                             expires_bucket_seconds=expires_bucket_seconds, **params)
+        use_case = GenerateSignedPlaylistUseCase(expressions=app.config['SECURE_LINK_PROFILES'],
+                                                 url_max_length=url_max_length)
+        response = use_case.execute(request_object)
+        if not response:
+            return Response(json.dumps(response.value), status=STATUS_CODES[response.type])
+        body = _join_lines(response.value, chunk_size=app.config['STREAM_CHUNK_SIZE'])
+        return Response(stream_with_context(body), mimetype=request.mimetype or 'text/plain')
+
+    if app.config['PROFILING_ENABLED']:
+        from api.profiling import init_profiling
+        init_profiling(app)
+
+    if app.config['METRICS_ENABLED']:
+        REGISTRY.configure(directory=app.config['METRICS_DIR'])
+
+        @app.route('/metrics')
+        def metrics():
+            return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
     return app
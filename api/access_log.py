@@ -0,0 +1,131 @@
+"""Structured access log written off the request path.
+
+Request handlers only put compact tuples to a bounded queue, a background thread of every process formats them
+as json lines and writes them in batches. Successful requests can be sampled, failures are always logged.
+When the queue is full records are dropped and counted instead of blocking requests.
+Passwords are never logged.
+"""
+import json
+import os
+import queue
+import random
+import threading
+import time
+
+from shared.background import ProcessThreadStarter
+from shared.metrics import access_log_dropped_total
+from shared.response_object import ResponseSuccess
+
+FIELDS = ('time', 'client', 'url', 'ip', 'expires', 'profile', 'outcome', 'status', 'latency')
+
+
+class AccessLog(object):
+    """Appends json lines to the file, which is rotated after max_bytes (0 never rotates) keeping backup_count
+    files. Every pre-forked worker starts its own writer thread on its first record and appends whole batches,
+    so workers can share the file; a file rotated by another worker or by logrotate is reopened.
+    """
+
+    def __init__(self, path: str, sample_rate: float=1.0, max_queue_size: int=10000, batch_size: int=256,
+                 max_bytes: int=0, backup_count: int=5):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.dropped = 0
+        self._queue = None
+        self._thread = None
+        self._file = None
+        self._starter = ProcessThreadStarter(self._start)
+
+    def log(self, client: str, url: str, ip_address: str, expires, profile: str, outcome: str, status: int,
+            latency: float):
+        """Put the record to the queue without blocking, successful requests are sampled."""
+        if outcome == ResponseSuccess.SUCCESS and self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        self._starter.start_once()
+        try:
+            self._queue.put_nowait((time.time(), client, url, ip_address, expires, profile, outcome, status,
+                                    latency))
+        except queue.Full:
+            self.dropped += 1
+            access_log_dropped_total.inc('queue_full')
+
+    def _start(self):
+        self._queue = queue.Queue(self.max_queue_size)
+        self._thread = threading.Thread(target=self._run, args=(self._queue,), name='access-log', daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Write the queued records and stop the writer thread of this process."""
+        if not self._starter.started:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._starter.stopped()
+
+    def _run(self, records: queue.Queue):
+        while True:
+            # records queued while the previous batch was written make the next batch
+            batch = [records.get()]
+            while batch[-1] is not None and len(batch) < self.batch_size:
+                try:
+                    batch.append(records.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = batch[-1] is None
+            if stopping:
+                batch.pop()
+            if batch:
+                self._write(''.join(json.dumps(dict(zip(FIELDS, record)), separators=(',', ':')) + '\n'
+                                    for record in batch).encode('utf-8'))
+            if stopping:
+                self._close_file()
+                return
+
+    def _write(self, data: bytes):
+        try:
+            if self._file is None or self._is_file_replaced():
+                self._open_file()
+            # one write per batch, so batches of workers appending to the same file are not interleaved
+            self._file.write(data)
+            if self.max_bytes and self._file.tell() >= self.max_bytes:
+                self._rotate()
+        except OSError:
+            self.dropped += data.count(b'\n')
+            access_log_dropped_total.inc('write_error', data.count(b'\n'))
+            self._close_file()
+
+    def _is_file_replaced(self):
+        try:
+            return os.stat(self.path).st_ino != os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    def _open_file(self):
+        self._close_file()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, 'ab', buffering=0)
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _rotate(self):
+        self._close_file()
+        try:
+            if not self.backup_count:
+                os.truncate(self.path, 0)
+                return
+            for number in range(self.backup_count - 1, 0, -1):
+                source = '{}.{}'.format(self.path, number)
+                if os.path.exists(source):
+                    os.replace(source, '{}.{}'.format(self.path, number + 1))
+            os.replace(self.path, self.path + '.1')
+        except FileNotFoundError:
+            # rotated by another worker at the same time
+            pass
@@ -0,0 +1,58 @@
+"""Asyncio-native ASGI application with the same "/" contract as the Flask application."""
+from api import (REDIRECT_STATUS_CODE, STATUS_CODES, _create_cache, _create_request_object_from_request_args,
+                 _get_redirect_location, _get_request_args, _load_config, _negotiate_response_format,
+                 _serialize_link_response)
+from use_cases.generate_secure_link_use_cases import GenerateSecureLinkUseCase
+from use_cases.secure_link_md5 import compile_secure_link_profiles
+
+CONTENT_TYPE_HEADER = (b'content-type', b'text/html; charset=utf-8')
+
+
+async def _send_response(send, status: int, body: bytes, method: str='GET', headers: list=None):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': (headers or [CONTENT_TYPE_HEADER]) + [(b'content-length', str(len(body)).encode())],
+    })
+    await send({'type': 'http.response.body', 'body': b'' if method == 'HEAD' else body})
+
+
+async def _serve_lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+def create_asgi_app(config_name):
+    config = _load_config(config_name)
+    cache = _create_cache(config)
+    profiles = compile_secure_link_profiles(config['SECURE_LINK_PROFILES'])
+
+    async def app(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await _serve_lifespan(receive, send)
+        if scope['path'] != '/':
+            return await _send_response(send, 404, b'Not Found')
+        if scope['method'] not in ('GET', 'HEAD'):
+            return await _send_response(send, 405, b'Method Not Allowed')
+
+        request_args = _get_request_args(scope['query_string'])
+        request_object = _create_request_object_from_request_args(request_args, config['URL_MAX_LENGTH'], profiles,
+                                                                  config['EXPIRES_BUCKET_SECONDS'])
+        use_case = GenerateSecureLinkUseCase(cache=cache, profiles=profiles)
+        response = use_case.execute(request_object)
+        if response and request_args.get('redirect') == '1':
+            location = _get_redirect_location(response.value, config['REDIRECT_BASE_URL'])
+            return await _send_response(send, REDIRECT_STATUS_CODE, b'', method=scope['method'],
+                                        headers=[(b'location', location.encode('latin-1'))])
+        accept = next((value for name, value in scope.get('headers', ()) if name == b'accept'), b'')
+        body, content_type = _serialize_link_response(response,
+                                                      _negotiate_response_format(accept.decode('latin-1')))
+        await _send_response(send, STATUS_CODES[response.type], body, method=scope['method'],
+                             headers=[(b'content-type', content_type.encode('latin-1'))])
+
+    return app
@@ -0,0 +1,179 @@
+"""Pre-signing of a catalog of hot links ahead of demand.
+
+With expiration time buckets all requests within a bucket get the same link, so links of hot urls can be signed
+for the coming buckets before their requests arrive, and matching requests are answered by a table lookup.
+A background thread of every process refreshes the table incrementally: only links of windows, which became
+due since the last refresh, are signed, and passed windows are dropped. Memory is bounded by the catalog size
+and the count of windows ahead, signing sleeps between batches to stay within the cpu share.
+"""
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+
+from shared.background import ProcessThreadStarter
+from use_cases.generate_secure_link_use_cases import GenerateSecureLinkUseCase
+from use_cases.request_objects import round_up_expires
+from use_cases.secure_link_md5 import DEFAULT_EXPRESSION, DEFAULT_PROFILE
+from use_cases.validators import is_correct_ip_address, is_correct_url
+
+logger = logging.getLogger(__name__)
+
+CatalogEntry = namedtuple('CatalogEntry', ('url', 'password', 'ip_address', 'profile', 'expires_in'))
+
+
+def _get_ip_independent_profiles(expressions: dict):
+    """Return profiles, whose links are the same for every ip-address."""
+    return frozenset(profile for profile, expression in expressions.items()
+                     if '$remote_addr' not in expression and '${remote_addr}' not in expression)
+
+
+def _parse_catalog_entry(item, expressions: dict, ip_independent_profiles: frozenset, expires_in: int,
+                         url_max_length: int):
+    """Return CatalogEntry for a catalog object or an error message."""
+    if not isinstance(item, dict):
+        return 'Is not object'
+    url, password, ip_address = item.get('url'), item.get('password'), item.get('ip_address')
+    profile, entry_expires_in = item.get('profile', DEFAULT_PROFILE), item.get('expires_in', expires_in)
+    if not is_correct_url(url, url_max_length):
+        return 'url: Is not correct url or path'
+    if not isinstance(password, str):
+        return 'password: Is not string'
+    if not isinstance(profile, str) or profile not in expressions:
+        return 'profile: Is not configured profile'
+    if not isinstance(entry_expires_in, int) or entry_expires_in < 0:
+        return 'expires_in: Is not positive integer'
+    if profile in ip_independent_profiles:
+        # one link serves every ip-address
+        ip_address = None
+    elif not is_correct_ip_address(ip_address):
+        return 'ip_address: Is not correct ip-address (required by the profile)'
+    return CatalogEntry(url, password, ip_address, profile, entry_expires_in)
+
+
+def load_catalog(path: str, expressions: dict=None, expires_in: int=3600, max_entries: int=10000,
+                 url_max_length: int=4096):
+    """Return entries of the ndjson catalog with url, password and optional ip_address, profile and expires_in.
+
+    Incorrect entries are logged and skipped, entries over max_entries are ignored.
+    """
+    expressions = dict({DEFAULT_PROFILE: DEFAULT_EXPRESSION}, **(expressions or {}))
+    ip_independent_profiles = _get_ip_independent_profiles(expressions)
+    entries = []
+    with open(path, encoding='utf-8') as file:
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            if len(entries) == max_entries:
+                logger.warning('Pre-sign catalog %s has more than %s entries, the rest is ignored', path,
+                               max_entries)
+                break
+            try:
+                entry = _parse_catalog_entry(json.loads(line), expressions, ip_independent_profiles, expires_in,
+                                             url_max_length)
+            except ValueError:
+                entry = 'Is not correct json'
+            if isinstance(entry, str):
+                logger.warning('Pre-sign catalog %s line %s is skipped: %s', path, number, entry)
+            else:
+                entries.append(entry)
+    return entries
+
+
+class PresignScheduler(object):
+    """Table of links of the catalog entries, signed for the buckets requested within the next ahead_seconds.
+
+    A request of an entry with expires_in seconds is expected at most ahead_seconds from now, so its expiration
+    time is in one of the buckets between now + expires_in and now + expires_in + ahead_seconds.
+    Every pre-forked worker starts its own thread on its first lookup.
+    """
+
+    def __init__(self, catalog: list, expires_bucket_seconds: int, profiles: dict=None, expressions: dict=None,
+                 ahead_seconds: int=600, interval: float=10, cpu_share: float=0.1, batch_size: int=100,
+                 clock=time.time):
+        """Profiles map names to functions from compile_secure_link_md5 and expressions to their
+        secure_link_md5 expressions like the SECURE_LINK_PROFILES setting."""
+        if not expires_bucket_seconds:
+            raise ValueError('Links can be pre-signed only with expiration time buckets')
+        self.catalog = catalog
+        self.expires_bucket_seconds = expires_bucket_seconds
+        self.ip_independent_profiles = _get_ip_independent_profiles(
+            dict({DEFAULT_PROFILE: DEFAULT_EXPRESSION}, **(expressions or {})))
+        self.ahead_seconds = ahead_seconds
+        self.interval = interval
+        self.cpu_share = cpu_share
+        self.batch_size = batch_size
+        # links are signed off the request path, so they stay out of the request stage histograms
+        self.use_case = GenerateSecureLinkUseCase(profiles=profiles, record_stages=False)
+        self._clock = clock
+        # expiration time -> {(profile, url, ip_address, password): link}, replaced as a whole on refresh
+        self._windows = {}
+        self._stopped = None
+        self._starter = ProcessThreadStarter(self._start)
+
+    def get(self, profile: str, expires: int, url: str, ip_address: str, password: str):
+        """Return the pre-signed link or None."""
+        self._starter.start_once()
+        window = self._windows.get(expires)
+        if window is None:
+            return None
+        if profile in self.ip_independent_profiles:
+            ip_address = None
+        return window.get((profile, url, ip_address, password))
+
+    def __len__(self):
+        return sum(len(window) for window in self._windows.values())
+
+    def _get_expiration_times(self, expires_in: int, now: float):
+        bucket = self.expires_bucket_seconds
+        first = round_up_expires(int(now) + expires_in, bucket)
+        last = round_up_expires(int(now) + expires_in + self.ahead_seconds, bucket)
+        return range(first, last + 1, bucket)
+
+    def refresh(self):
+        """Drop passed windows and sign the missing links of the coming ones, return the count of signed links."""
+        now = self._clock()
+        windows = {}
+        pending = []
+        for entry in self.catalog:
+            key = (entry.profile, entry.url, entry.ip_address, entry.password)
+            for expires in self._get_expiration_times(entry.expires_in, now):
+                window = windows.get(expires)
+                if window is None:
+                    window = windows[expires] = self._windows.get(expires, {})
+                if key not in window:
+                    pending.append((window, key, expires, entry))
+        self._windows = windows
+        for start in range(0, len(pending), self.batch_size):
+            started = time.perf_counter()
+            for window, key, expires, entry in pending[start:start + self.batch_size]:
+                # the profile does not depend on the ip-address of ip-less entries
+                window[key] = self.use_case._build_secure_url(expires, entry.url, entry.ip_address or '',
+                                                              entry.password, entry.profile)
+            if self.cpu_share < 1 and self._stopped is not None:
+                pause = (time.perf_counter() - started) * (1 - self.cpu_share) / self.cpu_share
+                if self._stopped.wait(pause):
+                    break
+        return len(pending)
+
+    def _start(self):
+        self._stopped = threading.Event()
+        threading.Thread(target=self._run, args=(self._stopped,), name='presign', daemon=True).start()
+
+    def close(self):
+        """Stop the thread of this process."""
+        if self._starter.started:
+            self._stopped.set()
+            self._starter.stopped()
+
+    def _run(self, stopped: threading.Event):
+        while not stopped.is_set():
+            try:
+                signed = self.refresh()
+            except Exception:
+                logger.exception('Pre-signing failed')
+            else:
+                if signed:
+                    logger.debug('Pre-signed %s links', signed)
+            stopped.wait(self.interval)
@@ -0,0 +1,168 @@
+"""On-demand profiler for live workers.
+
+Requests are profiled with cProfile either with a fixed sample rate or all of them during a window started
+by a signal or an admin request. While profiled requests run, a sampler thread records their stacks.
+Aggregated results are dumped to the directory as a pstats file and a collapsed stacks file, which
+flamegraph tools can read. When nothing is profiled a request costs one comparison and the sampler thread
+is stopped.
+"""
+import cProfile
+import os
+import pstats
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+
+class RequestProfiler(object):
+
+    def __init__(self, directory: str, sample_rate: float=0.0, dump_every: int=100, sampling_interval: float=0.005):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.dump_every = dump_every
+        self.sampling_interval = sampling_interval
+        self.active_until = 0
+        self.dumps = []
+        self._lock = threading.Lock()
+        self._profiled_threads = set()
+        self._sampler = None
+        self._reset()
+
+    def _reset(self):
+        self._stats = None
+        self._stacks = Counter()
+        self._profiled_requests = 0
+
+    def start(self, seconds: float):
+        """Profile all requests during the next seconds."""
+        self.active_until = time.time() + seconds
+
+    def should_profile(self):
+        if self.active_until:
+            if time.time() < self.active_until:
+                return True
+            self._finish_window()
+        return bool(self.sample_rate) and random.random() < self.sample_rate
+
+    def _finish_window(self):
+        with self._lock:
+            if self.active_until and time.time() >= self.active_until:
+                self.active_until = 0
+                self._dump()
+
+    def start_request(self):
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiled_threads.add(threading.get_ident())
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample_stacks, daemon=True)
+                self._sampler.start()
+        profile.enable()
+        return profile
+
+    def finish_request(self, profile: cProfile.Profile):
+        profile.disable()
+        with self._lock:
+            self._profiled_threads.discard(threading.get_ident())
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+            self._profiled_requests += 1
+            if not self.active_until and self.dump_every and self._profiled_requests >= self.dump_every:
+                self._dump()
+
+    def dump(self):
+        with self._lock:
+            return self._dump()
+
+    def _dump(self):
+        if self._stats is None:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, 'profile_{}_{}'.format(os.getpid(), int(time.time() * 1000)))
+        self._stats.dump_stats(path + '.pstats')
+        with open(path + '.collapsed', 'w') as file:
+            file.writelines('{} {}\n'.format(stack, count) for stack, count in self._stacks.most_common())
+        self._reset()
+        self.dumps.append(path)
+        return path
+
+    def _sample_stacks(self):
+        sampler_ident = threading.get_ident()
+        while True:
+            time.sleep(self.sampling_interval)
+            if self.active_until and time.time() >= self.active_until and not self._profiled_threads:
+                self._finish_window()
+            with self._lock:
+                if not self._profiled_threads:
+                    if not self.active_until:
+                        # nothing to sample, the next profiled request starts the sampler again
+                        self._sampler = None
+                        return
+                    continue
+                frames = sys._current_frames()
+                for ident in self._profiled_threads:
+                    if ident != sampler_ident and ident in frames:
+                        self._stacks[self._collapse_stack(frames[ident])] += 1
+
+    @classmethod
+    def _collapse_stack(cls, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append('{}:{}'.format(os.path.basename(code.co_filename), code.co_name))
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
+
+
+def init_profiling(app):
+    """Install the profiler hooks, the admin route and the signal handler into the Flask application."""
+    import hmac
+    import json
+    import signal
+
+    from flask import Response, g, request
+
+    from api import STATUS_CODES
+    from shared.response_object import ResponseFailure
+
+    directory = app.config['PROFILING_DIR'] or os.path.join(tempfile.gettempdir(), 'secure_link_profiles')
+    profiler = app.extensions['profiler'] = RequestProfiler(directory=directory,
+                                                            sample_rate=app.config['PROFILING_SAMPLE_RATE'],
+                                                            dump_every=app.config['PROFILING_DUMP_EVERY'])
+
+    @app.before_request
+    def start_profiling():
+        if profiler.should_profile():
+            g.profile = profiler.start_request()
+
+    @app.teardown_request
+    def finish_profiling(exc=None):
+        profile = g.pop('profile', None)
+        if profile is not None:
+            profiler.finish_request(profile)
+
+    if app.config['SECRET']:
+        @app.route('/admin/profile', methods=['POST'])
+        def start_profiling_window():
+            if not hmac.compare_digest(request.headers.get('X-Secret', ''), app.config['SECRET']):
+                response = ResponseFailure.build_resource_error('Not found')
+                return Response(json.dumps(response.value), status=STATUS_CODES[response.type],
+                                mimetype='application/json')
+            seconds = request.args.get('seconds', app.config['PROFILING_SECONDS'], type=float)
+            profiler.start(seconds)
+            return Response(json.dumps({'pid': os.getpid(), 'until': profiler.active_until,
+                                        'directory': profiler.directory}), mimetype='application/json')
+
+    if app.config['PROFILING_SIGNAL']:
+        try:
+            signal.signal(getattr(signal, app.config['PROFILING_SIGNAL']),
+                          lambda signum, frame: profiler.start(app.config['PROFILING_SECONDS']))
+        except ValueError:
+            app.logger.warning('Profiling signal handler can be installed only from the main thread')
+
+    return profiler
@@ -0,0 +1,502 @@
+"""Pre-forking production server.
+
+The application is created once in the master process and inherited by the forked workers. Every worker binds
+its own listening socket to the same address with SO_REUSEPORT, so the kernel balances connections between them,
+and serves HTTP/1.1 keep-alive connections from a thread pool.
+
+With a Unix socket path the workers also serve the binary signing protocol of api.unix_socket: its socket is
+created by the master process, so all workers accept connections from it.
+
+Signals of the master process:
+    SIGHUP - graceful restart: new workers are started, then the old ones finish their requests and exit
+    SIGTERM, SIGINT - graceful shutdown
+"""
+import argparse
+import io
+import logging
+import os
+import select
+import shutil
+import signal
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import unquote
+
+from api import _load_config, create_wsgi_application
+from shared.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkedInput(io.RawIOBase):
+    """Request body sent with Transfer-Encoding: chunked."""
+
+    def __init__(self, rfile, max_line: int=1024):
+        self.rfile = rfile
+        self.max_line = max_line
+        self.chunk_left = 0
+        self.done = False
+
+    def readable(self):
+        return True
+
+    def _readline(self):
+        line = self.rfile.readline(self.max_line + 1)
+        if len(line) > self.max_line or not line.endswith(b'\n'):
+            raise OSError('Invalid chunked request body')
+        return line
+
+    def readinto(self, buffer):
+        if self.done:
+            return 0
+        if not self.chunk_left:
+            try:
+                self.chunk_left = int(self._readline().split(b';', 1)[0], 16)
+            except ValueError:
+                raise OSError('Invalid chunk size')
+            if self.chunk_left <= 0:
+                self.done = True
+                while self._readline().strip():
+                    pass
+                return 0
+        data = self.rfile.read(min(len(buffer), self.chunk_left))
+        if not data:
+            raise OSError('Incomplete chunked request body')
+        buffer[:len(data)] = data
+        self.chunk_left -= len(data)
+        if not self.chunk_left:
+            self._readline()
+        return len(data)
+
+
+class LimitedInput(io.RawIOBase):
+    """Request body of Content-Length bytes, which is never read past."""
+
+    def __init__(self, rfile, length: int):
+        self.rfile = rfile
+        self.left = length
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.left:
+            return 0
+        data = self.rfile.read(min(len(buffer), self.left))
+        if not data:
+            raise OSError('Incomplete request body')
+        buffer[:len(data)] = data
+        self.left -= len(data)
+        return len(data)
+
+
+class KeepAliveWSGIRequestHandler(BaseHTTPRequestHandler):
+    """Serves a WSGI application over HTTP/1.1 connections, which are kept alive between requests.
+
+    Bodies of responses without Content-Length are sent chunked, unread request bodies are drained
+    before the next request (the connection is closed if there is more than MAX_DRAIN bytes left).
+    """
+    protocol_version = 'HTTP/1.1'
+    server_version = 'secure-link'
+    # small responses are sent with the headers in one write, chunks of streamed responses are flushed at once
+    wbufsize = io.DEFAULT_BUFFER_SIZE
+    MAX_DRAIN = 1 << 20
+
+    @property
+    def timeout(self):
+        """Idle keep-alive connections are closed after this time."""
+        return self.server.keep_alive_timeout
+
+    def handle_one_request(self):
+        self.raw_requestline = self.rfile.readline(65537)
+        if not self.raw_requestline:
+            self.close_connection = True
+            return
+        if len(self.raw_requestline) > 65536:
+            self.send_error(414)
+            return
+        if not self.parse_request():
+            return
+        if self.request_version != 'HTTP/1.1' or self.server.stopping:
+            self.close_connection = True
+        self.run_wsgi()
+        self.wfile.flush()
+
+    def _get_input(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            return io.BufferedReader(ChunkedInput(self.rfile))
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise ValueError('Invalid Content-Length')
+        return io.BufferedReader(LimitedInput(self.rfile, length))
+
+    def _make_environ(self, wsgi_input):
+        path, _, query = self.path.partition('?')
+        environ = {
+            'REQUEST_METHOD': self.command,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote(path, 'latin-1'),
+            'QUERY_STRING': query,
+            'REQUEST_URI': self.path,
+            'SERVER_NAME': self.server.server_name,
+            'SERVER_PORT': str(self.server.server_port),
+            'SERVER_PROTOCOL': self.request_version,
+            'REMOTE_ADDR': self.client_address[0],
+            'REMOTE_PORT': str(self.client_address[1]),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': wsgi_input,
+            'wsgi.input_terminated': True,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for key, value in self.headers.items():
+            key = key.upper().replace('-', '_')
+            if key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                environ[key] = value
+            elif key != 'TRANSFER_ENCODING':
+                key = 'HTTP_' + key
+                environ[key] = '{},{}'.format(environ[key], value) if key in environ else value
+        return environ
+
+    def run_wsgi(self):
+        try:
+            wsgi_input = self._get_input()
+        except ValueError:
+            self.send_error(400)
+            return
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response.get('headers_sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['status'], response['headers'] = status, headers
+            return write
+
+        def write(data: bytes):
+            if not response.get('headers_sent'):
+                self._send_headers(response)
+                response['headers_sent'] = True
+            if not data or self.command == 'HEAD':
+                return
+            if response['chunked']:
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+                self.wfile.flush()
+            else:
+                self.wfile.write(data)
+
+        try:
+            result = self.server.app(self._make_environ(wsgi_input), start_response)
+            try:
+                for data in result:
+                    write(data)
+                if not response.get('headers_sent'):
+                    write(b'')
+                if response['chunked']:
+                    self.wfile.write(b'0\r\n\r\n')
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        except (ConnectionError, socket.timeout):
+            self.close_connection = True
+            return
+        except Exception:
+            logger.exception('Error on request %s %s', self.command, self.path)
+            self.close_connection = True
+            if not response.get('headers_sent'):
+                self.send_error(500)
+            return
+        self._drain(wsgi_input)
+
+    def _send_headers(self, response: dict):
+        code = int(response['status'].split(' ', 1)[0])
+        header_names = {name.lower() for name, _ in response['headers']}
+        response['chunked'] = not ('content-length' in header_names or self.command == 'HEAD' or
+                                   code < 200 or code in (204, 304))
+        if response['chunked'] and self.request_version != 'HTTP/1.1':
+            response['chunked'] = False
+            self.close_connection = True
+        self.send_response_only(code, response['status'].split(' ', 1)[1])
+        for name, value in response['headers']:
+            self.send_header(name, value)
+        self.send_header('Date', self.date_time_string())
+        if response['chunked']:
+            self.send_header('Transfer-Encoding', 'chunked')
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+
+    def _drain(self, wsgi_input):
+        """Skip the unread request body, so the next request can be read from the connection."""
+        try:
+            drained = 0
+            while drained <= self.MAX_DRAIN:
+                data = wsgi_input.read(65536)
+                if not data:
+                    return
+                drained += len(data)
+        except OSError:
+            pass
+        self.close_connection = True
+
+    def log_message(self, format, *args):
+        # access logging of every request is too expensive for production
+        logger.debug(format, *args)
+
+
+class ConnectionCountingMixIn(object):
+    """Counts connections served by threads, so a stopping worker can wait for them to finish."""
+
+    def __init__(self, *args, **kwargs):
+        self.stopping = False
+        self.active_connections = 0
+        self.active_connections_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def process_request(self, request, client_address):
+        # counted before the thread starts, so a stopping worker can't miss just accepted connections
+        with self.active_connections_lock:
+            self.active_connections += 1
+        super().process_request(request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            with self.active_connections_lock:
+                self.active_connections -= 1
+
+
+class ReusePortWSGIServer(ConnectionCountingMixIn, socketserver.ThreadingMixIn, HTTPServer):
+    """Threaded server, which binds its socket with SO_REUSEPORT, so every worker process can have its own."""
+    # http.server.ThreadingHTTPServer is the same, but it is missing before python 3.7 of the docker image
+    daemon_threads = True
+    request_queue_size = socket.SOMAXCONN
+
+    def __init__(self, host: str, port: int, app, keep_alive_timeout: float=5, parent_pid: int=None):
+        self.app = app
+        self.keep_alive_timeout = keep_alive_timeout
+        self.parent_pid = parent_pid
+        super().__init__((host, port), KeepAliveWSGIRequestHandler)
+
+    def server_bind(self):
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+    def accept_pending_requests(self):
+        """Serve connections already queued on the socket, closing it would reset them."""
+        self.socket.setblocking(False)
+        while True:
+            try:
+                request, client_address = self.get_request()
+            except OSError:
+                return
+            self.process_request(request, client_address)
+
+    def service_actions(self):
+        if self.parent_pid and os.getppid() != self.parent_pid:
+            # the master process is gone, so nobody would ever stop the worker
+            self.parent_pid = None
+            threading.Thread(target=self.shutdown).start()
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], (ConnectionError, socket.timeout)):
+            logger.exception('Error on connection from %s', client_address[0])
+
+
+class PreforkServer(object):
+    def __init__(self, app, host: str='0.0.0.0', port: int=80, workers: int=None, graceful_timeout: float=30,
+                 keep_alive_timeout: float=5, unix_server=None):
+        self.app = app
+        self.unix_server = unix_server
+        self.host = host
+        self.port = port
+        self.workers_count = workers or os.cpu_count() or 1
+        self.graceful_timeout = graceful_timeout
+        self.keep_alive_timeout = keep_alive_timeout
+        self.workers = set()
+        self.retiring_workers = set()
+        self._reload = False
+        self._stopping = False
+        self._metrics_directory = None
+
+    def run(self):
+        self._check_address()
+        if REGISTRY.enabled and not REGISTRY.directory:
+            # without a shared directory every worker would export only its own metrics
+            self._metrics_directory = tempfile.mkdtemp(prefix='secure_link_metrics_')
+            REGISTRY.configure(directory=self._metrics_directory)
+        signal.signal(signal.SIGHUP, self._handle_reload)
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        logger.info('Serving on %s:%s with %s workers', self.host, self.port, self.workers_count)
+        if self.unix_server:
+            logger.info('Serving the binary signing protocol on %s', self.unix_server.server_address)
+        self._spawn_workers()
+        while not self._stopping:
+            if self._reload:
+                self._reload = False
+                self._restart_workers()
+            self._reap_workers()
+            self._spawn_workers()
+            time.sleep(0.1)
+        self._stop_workers()
+        if self.unix_server:
+            self.unix_server.remove()
+        if self._metrics_directory:
+            shutil.rmtree(self._metrics_directory, ignore_errors=True)
+
+    def _check_address(self):
+        """Fail in the master process, if workers will not be able to bind the address."""
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+            probe.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            probe.bind((self.host, self.port))
+
+    def _handle_reload(self, signum, frame):
+        self._reload = True
+
+    def _handle_stop(self, signum, frame):
+        self._stopping = True
+
+    def _spawn_workers(self, ready_timeout: float=10):
+        """Start missing workers and wait, until they listen."""
+        if len(self.workers) >= self.workers_count:
+            return
+        ready_reader, ready_writer = os.pipe()
+        spawned = 0
+        while len(self.workers) < self.workers_count:
+            pid = os.fork()
+            if not pid:
+                self._run_worker(ready_reader, ready_writer)
+            self.workers.add(pid)
+            spawned += 1
+        os.close(ready_writer)
+        deadline = time.monotonic() + ready_timeout
+        while spawned and time.monotonic() < deadline:
+            if select.select([ready_reader], [], [], deadline - time.monotonic())[0]:
+                ready = len(os.read(ready_reader, spawned))
+                if not ready:
+                    break
+                spawned -= ready
+        os.close(ready_reader)
+
+    def _restart_workers(self):
+        logger.info('Restarting workers')
+        old_workers, self.workers = self.workers, set()
+        self._spawn_workers()
+        for pid in old_workers:
+            self._kill(pid, signal.SIGTERM)
+        self.retiring_workers |= old_workers
+
+    def _reap_workers(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            REGISTRY.retire(pid)
+            self.retiring_workers.discard(pid)
+            if pid in self.workers:
+                self.workers.discard(pid)
+                if not self._stopping:
+                    logger.warning('Worker %s exited with status %s, starting a new one', pid, status)
+
+    def _stop_workers(self):
+        workers = self.workers | self.retiring_workers
+        for pid in workers:
+            self._kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout + 1
+        while workers and time.monotonic() < deadline:
+            self._reap_workers()
+            workers = self.workers | self.retiring_workers
+            time.sleep(0.05)
+        for pid in workers:
+            self._kill(pid, signal.SIGKILL)
+        logger.info('Stopped')
+
+    @staticmethod
+    def _kill(pid: int, signum: int):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def _run_worker(self, ready_reader: int, ready_writer: int):
+        """Serve until SIGTERM, then wait for the active requests and exit. Never returns."""
+        status = 0
+        try:
+            os.close(ready_reader)
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            server = ReusePortWSGIServer(self.host, self.port, self.app, keep_alive_timeout=self.keep_alive_timeout,
+                                         parent_pid=os.getppid())
+            # shutdown() waits for serve_forever() to return, so it can't be called in its thread
+            signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+            if self.unix_server:
+                threading.Thread(target=self.unix_server.serve_forever, daemon=True).start()
+            os.write(ready_writer, b'.')
+            os.close(ready_writer)
+            server.serve_forever()
+            server.stopping = True
+            server.accept_pending_requests()
+            server.server_close()
+            servers = [server]
+            if self.unix_server:
+                # connections queued on the shared socket are left to the other workers
+                self.unix_server.stopping = True
+                self.unix_server.shutdown()
+                self.unix_server.server_close()
+                servers.append(self.unix_server)
+            # connections get "Connection: close" with their next response or are closed after keep-alive timeout,
+            # binary protocol connections are closed once their requests are answered
+            deadline = time.monotonic() + self.graceful_timeout
+            while any(listener.active_connections for listener in servers) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            # os._exit() below would lose the records still queued to the access log
+            access_log = getattr(self.app, 'extensions', {}).get('secure_link_access_log')
+            if access_log is not None:
+                access_log.close()
+        except Exception:
+            logger.exception('Worker %s failed', os.getpid())
+            status = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+
+
+def main(argv=None):
+    config_name = os.getenv('APP_SETTINGS')
+    config = _load_config(config_name)
+    parser = argparse.ArgumentParser(description='Serve the api with pre-forked workers.')
+    parser.add_argument('--host', default=config['SERVER_HOST'], help='address to listen on')
+    parser.add_argument('--port', type=int, default=config['SERVER_PORT'], help='port to listen on')
+    parser.add_argument('-w', '--workers', type=int, default=config['SERVER_WORKERS'],
+                        help='worker processes count (cpu count by default)')
+    parser.add_argument('--unix-socket', default=config['UNIX_SOCKET_PATH'],
+                        help='also serve the binary signing protocol on this Unix socket path')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(process)d %(levelname)s %(message)s')
+    unix_server = None
+    if args.unix_socket:
+        # imported here, because api.unix_socket builds on this module
+        from api.unix_socket import create_unix_socket_server
+        unix_server = create_unix_socket_server(config_name, args.unix_socket)
+    server = PreforkServer(create_wsgi_application(config_name), host=args.host, port=args.port,
+                           workers=args.workers, graceful_timeout=config['SERVER_GRACEFUL_TIMEOUT'],
+                           keep_alive_timeout=config['SERVER_KEEP_ALIVE_TIMEOUT'], unix_server=unix_server)
+    server.run()
+    return 0
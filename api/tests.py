@@ -1,7 +1,38 @@
+import asyncio
+import base64
+import http.client
+import json
+import os
+import pstats
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
+from urllib.parse import quote
 
-from api import _create_request_object_from_request_args
-from run import app
+from flask import Flask
+from werkzeug.http import HTTP_STATUS_CODES
+from werkzeug.test import Client
+
+from api import (STATUS_CODES, _create_request_object_from_request_args, _negotiate_response_format,
+                 _serialize_link_response, create_app, create_wsgi_application)
+from api.access_log import AccessLog
+from api.asgi import create_asgi_app
+from api.presign import CatalogEntry, PresignScheduler, load_catalog
+from api.unix_socket import (MAX_REQUEST_SIZE, UnixSocketSigningClient, create_unix_socket_server,
+                              encode_request)
+from api.wsgi import STATUS_LINES, create_lean_wsgi_app
+from instance.settings import app_config
+from shared.metrics import REGISTRY
+from shared.response_object import ResponseSuccess
+from run import app, config_name
+from use_cases.generate_secure_link_use_cases import GenerateSecureLinkUseCase
+from use_cases.secure_link_md5 import compile_secure_link_profiles
 
 
 class IndexTestCase(unittest.TestCase):
@@ -16,6 +47,99 @@ class IndexTestCase(unittest.TestCase):
         self.assertEqual(response.data,
                          b'/s/link?md5=FbRZ_kL2P7SJMI6hCxS11Q&expires=2147483647')
 
+    def test_with_secure_link_profile(self):
+        profiles = {'no_ip': '$secure_link_expires$uri=$p'}
+        with mock.patch.object(app_config[config_name], 'SECURE_LINK_PROFILES', profiles):
+            test_client = create_app(config_name).test_client(self)
+
+        response = test_client.get('/?t=2147483647&u=L3MvbGluaw==&ip=127.0.0.1&p=password&profile=no_ip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, b'/s/link?md5=m3Ks5Qbl5pzCa0zRKcWsbQ&expires=2147483647')
+        response = test_client.get('/?t=2147483647&u=L3MvbGluaw==&ip=127.0.0.1&p=password&profile=unknown')
+        self.assertEqual(response.status_code, 400)
+
+    def test_without_expires_bucket_response_has_no_cache_headers(self):
+        response = self.test_client.get('/?t=2147483647&u=L3MvbGluaw==&ip=127.0.0.1&p=password')
+        self.assertNotIn('Cache-Control', response.headers)
+        self.assertNotIn('ETag', response.headers)
+
+    def test_with_expires_bucket(self):
+        with mock.patch.object(app_config[config_name], 'EXPIRES_BUCKET_SECONDS', 300):
+            test_client = create_app(config_name).test_client(self)
+        expires = int(time.time()) // 300 * 300 + 600
+
+        response = test_client.get('/?t={}&u=L3MvbGluaw==&ip=127.0.0.1&p=password'.format(expires - 299))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data.endswith('&expires={}'.format(expires).encode()))
+        self.assertTrue(response.cache_control.public)
+        self.assertTrue(300 < response.cache_control.max_age <= 600)
+        response = test_client.get('/?t={}&u=L3MvbGluaw==&ip=127.0.0.1&p=password'.format(expires),
+                                   headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+        response = test_client.get('/?t={}&u=L3MvbGluaw==&ip=1270.0.1&p=password'.format(expires))
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn('ETag', response.headers)
+
+    def test_redirect(self):
+        response = self.test_client.get('/?t=2147483647&u=L3MvbGluaw==&ip=127.0.0.1&p=password&redirect=1')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.headers['Location'], '/s/link?md5=FbRZ_kL2P7SJMI6hCxS11Q&expires=2147483647')
+        self.assertEqual(response.data, b'')
+
+    def test_redirect_with_base_url(self):
+        with mock.patch.object(app_config[config_name], 'REDIRECT_BASE_URL', 'https://cdn.example.com'):
+            test_client = create_app(config_name).test_client(self)
+        url = base64.b64encode('/s/ссылка'.encode('utf-8')).decode()
+
+        response = test_client.get('/?t=2147483647&ip=127.0.0.1&p=password&redirect=1&u=' + quote(url))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.headers['Location'].startswith(
+            'https://cdn.example.com/s/%D1%81%D1%81%D1%8B%D0%BB%D0%BA%D0%B0?md5='))
+
+    def test_failures_are_not_redirected(self):
+        response = self.test_client.get('/?t=2147483647&u=L3MvbGluaw==&ip=1270.0.1&p=password&redirect=1')
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn('Location', response.headers)
+
+    def test_content_negotiation(self):
+        path = '/?t=2147483647&u=L3MvbGluaw==&ip=127.0.0.1&p=password'
+        link = '/s/link?md5=FbRZ_kL2P7SJMI6hCxS11Q&expires=2147483647'
+
+        response = self.test_client.get(path, headers={'Accept': 'application/json'})
+        self.assertEqual(response.mimetype, 'application/json')
+        self.assertEqual(response.get_json(), link)
+        response = self.test_client.get(path, headers={'Accept': 'text/plain'})
+        self.assertEqual(response.mimetype, 'text/plain')
+        self.assertEqual(response.data, link.encode())
+        response = self.test_client.get(path, headers={'Accept': 'text/html,*/*;q=0.8'})
+        self.assertEqual(response.mimetype, 'text/html')
+        self.assertEqual(response.data, link.encode())
+        response = self.test_client.get('/?t=2147483647&u=L3MvbGluaw==&ip=1270.0.1&p=password',
+                                        headers={'Accept': 'application/json'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()['type'], 'PARAMETERS_ERROR')
+        response = self.test_client.get('/?t=2147483647&u=L3MvbGluaw==&ip=1270.0.1&p=password',
+                                        headers={'Accept': 'text/plain'})
+        self.assertEqual(response.data, b'ip_address: Is not correct ip-address')
+
+    def test_non_ascii_link_formats(self):
+        url = quote(base64.b64encode('/s/ссылка'.encode('utf-8')).decode())
+        path = '/?t=2147483647&ip=127.0.0.1&p=password&u=' + url
+
+        self.assertTrue(self.test_client.get(path).data.startswith(b'/s/\\u0441'))
+        self.assertTrue(self.test_client.get(path, headers={'Accept': 'text/plain'}).data.decode('utf-8')
+                        .startswith('/s/ссылка?md5='))
+        self.assertTrue(self.test_client.get(path, headers={'Accept': 'application/json'}).get_json()
+                        .startswith('/s/ссылка?md5='))
+
+    def test_expires_over_int64_with_shared_cache(self):
+        with mock.patch.multiple(app_config[config_name], CACHE_SIZE=10, CACHE_SHARED_SLOTS=16):
+            test_client = create_app(config_name).test_client(self)
+
+        response = test_client.get('/?t=99999999999999999999&u=L3MvbGluaw==&ip=127.0.0.1&p=password')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data.endswith(b'&expires=99999999999999999999'))
+
     def test_without_params(self):
         response = self.test_client.get('/', content_type='html/text')
         self.assertEqual(response.status_code, 400)
@@ -57,6 +181,730 @@ class IndexTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 400)
 
 
+class BatchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_client = app.test_client(self)
+        self.correct_item = {'t': 2147483647, 'u': 'L3MvbGluaw==', 'ip': '127.0.0.1', 'p': 'password'}
+
+    def test_with_correct_and_incorrect_items(self):
+        items = [self.correct_item, dict(self.correct_item, ip='1270.0.1'), 'item', self.correct_item]
+        response = self.test_client.post('/batch', data=json.dumps(items), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data.decode()), [
+            '/s/link?md5=FbRZ_kL2P7SJMI6hCxS11Q&expires=2147483647',
+            {'type': 'PARAMETERS_ERROR', 'message': 'ip_address: Is not correct ip-address'},
+            {'type': 'PARAMETERS_ERROR', 'message': 'item: Is not object'},
+            '/s/link?md5=FbRZ_kL2P7SJMI6hCxS11Q&expires=2147483647',
+        ])
+
+    def test_expires_must_be_integer(self):
+        items = [dict(self.correct_item, t=True), dict(self.correct_item, t=1.9), dict(self.correct_item, t='1')]
+        response = self.test_client.post('/batch', data=json.dumps(items), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        error = {'type': 'PARAMETERS_ERROR', 'message': 'expires: Is not correct timestamp (positive integer)'}
+        values = json.loads(response.data.decode())
+        self.assertEqual(values[:2], [error, error])
+        self.assertTrue(values[2].endswith('&expires=1'))
+
+    def test_url_must_be_string(self):
+        items = [dict(self.correct_item, u=5), dict(self.correct_item, u=['L3MvbGluaw==']), self.correct_item]
+        response = self.test_client.post('/batch', data=json.dumps(items), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        error = {'type': 'PARAMETERS_ERROR', 'message': 'url: Is not correct url or path'}
+        self.assertEqual(json.loads(response.data.decode()),
+                         [error, error, '/s/link?md5=FbRZ_kL2P7SJMI6hCxS11Q&expires=2147483647'])
+
+    def test_items_must_be_list(self):
+        response = self.test_client.post('/batch', data=json.dumps(self.correct_item),
+                                         content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_items_must_be_json(self):
+        response = self.test_client.post('/batch', data='qwerty', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_items_count_is_limited(self):
+        items = [self.correct_item] * (app.config['BATCH_MAX_SIZE'] + 1)
+        response = self.test_client.post('/batch', data=json.dumps(items), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class StreamTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_client = app.test_client(self)
+        self.correct_line = json.dumps({'t': 2147483647, 'u': 'L3MvbGluaw==', 'ip': '127.0.0.1', 'p': 'password'})
+
+    def test_with_correct_and_incorrect_lines(self):
+        lines = [self.correct_line, '', 'qwerty', '[]'] + [self.correct_line] * (app.config['STREAM_CHUNK_SIZE'] + 1)
+        response = self.test_client.post('/stream', data='\n'.join(lines), content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        values = [json.loads(line) for line in response.data.decode().splitlines()]
+        self.assertEqual(len(values), app.config['STREAM_CHUNK_SIZE'] + 4)
+        self.assertEqual(values[0], '/s/link?md5=FbRZ_kL2P7SJMI6hCxS11Q&expires=2147483647')
+        self.assertEqual(values[1], {'type': 'PARAMETERS_ERROR', 'message': 'item: Is not correct json'})
+        self.assertEqual(values[2], {'type': 'PARAMETERS_ERROR', 'message': 'item: Is not object'})
+        self.assertEqual(values[-1], values[0])
+
+    def test_too_long_lines(self):
+        too_long_line = json.dumps({'t': 2147483647, 'u': 'L3MvbGluaw==', 'p': 'x' * 2 * app.config['URL_MAX_LENGTH']})
+        lines = [too_long_line, self.correct_line, too_long_line]
+        response = self.test_client.post('/stream', data='\n'.join(lines), content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        values = [json.loads(line) for line in response.data.decode().splitlines()]
+        error = {'type': 'PARAMETERS_ERROR', 'message': 'item: Is too long'}
+        self.assertEqual(values, [error, '/s/link?md5=FbRZ_kL2P7SJMI6hCxS11Q&expires=2147483647', error])
+
+    def test_url_must_be_string(self):
+        lines = [json.dumps({'t': 2147483647, 'u': 5, 'ip': '127.0.0.1', 'p': 'password'}), self.correct_line]
+        response = self.test_client.post('/stream', data='\n'.join(lines), content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        values = [json.loads(line) for line in response.data.decode().splitlines()]
+        self.assertEqual(values, [{'type': 'PARAMETERS_ERROR', 'message': 'url: Is not correct url or path'},
+                                  '/s/link?md5=FbRZ_kL2P7SJMI6hCxS11Q&expires=2147483647'])
+
+    def test_without_lines(self):
+        response = self.test_client.post('/stream', data='', content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, b'')
+
+
+class PlaylistTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_client = app.test_client(self)
+
+    def test_segments_are_signed(self):
+        response = self.test_client.post('/playlist?t=2147483647&u=L3MvaW5kZXgubTN1OA==&ip=127.0.0.1&p=password',
+                                         data=b'#EXTM3U\n#EXTINF:4.0,\nlink\n',
+                                         content_type='application/vnd.apple.mpegurl')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/vnd.apple.mpegurl')
+        self.assertEqual(response.data,
+                         b'#EXTM3U\n#EXTINF:4.0,\n/s/link?md5=FbRZ_kL2P7SJMI6hCxS11Q&expires=2147483647\n')
+
+    def test_too_long_lines(self):
+        too_long_line = b'x' * 2 * app.config['URL_MAX_LENGTH']
+        response = self.test_client.post('/playlist?t=2147483647&u=L3MvaW5kZXgubTN1OA==&ip=127.0.0.1&p=password',
+                                         data=b'#EXTM3U\n' + too_long_line + b'\nlink\n' + too_long_line)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, b'#EXTM3U\n# line: Is too long\n'
+                                        b'/s/link?md5=FbRZ_kL2P7SJMI6hCxS11Q&expires=2147483647\n'
+                                        b'# line: Is too long\n')
+
+    def test_playlist_url_is_required(self):
+        response = self.test_client.post('/playlist?t=2147483647&ip=127.0.0.1&p=password', data=b'link\n')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.data.decode('utf-8'))['message'], 'url: Is not correct url or path')
+
+
+class AsgiAppTestCase(unittest.TestCase):
+    def setUp(self):
+        self.asgi_app = create_asgi_app(config_name)
+        self.test_client = app.test_client(self)
+
+    def _request(self, path: str='/', query_string: str='', method: str='GET', headers: list=()):
+        scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query_string.encode(),
+                 'headers': list(headers)}
+        messages = self.messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.get_event_loop().run_until_complete(self.asgi_app(scope, receive, send))
+        return messages[0]['status'], messages[1]['body']
+
+    def test_responses_match_flask_app(self):
+        for query_string in ['t=2147483647&u=L3MvbGluaw==&ip=127.0.0.1&p=password', '',
+                             't=qwerty&u=L3MvbGluaw==&ip=127.0.0.1&p=password',
+                             't=2147483647&u=L3MvbGluaw==&ip=1270.0.1&p=password']:
+            flask_response = self.test_client.get('/?' + query_string)
+            self.assertEqual(self._request(query_string=query_string),
+                             (flask_response.status_code, flask_response.data), query_string)
+
+    def test_negotiated_and_redirect_responses(self):
+        query_string = 't=2147483647&u=L3MvbGluaw==&ip=127.0.0.1&p=password'
+        link = b'/s/link?md5=FbRZ_kL2P7SJMI6hCxS11Q&expires=2147483647'
+
+        self.assertEqual(self._request(query_string=query_string, headers=[(b'accept', b'application/json')]),
+                         (200, b'"' + link + b'"'))
+        self.assertEqual(self._request(query_string=query_string + '&redirect=1'), (302, b''))
+        self.assertIn((b'location', link), self.messages[0]['headers'])
+
+    def test_unknown_path(self):
+        self.assertEqual(self._request(path='/unknown')[0], 404)
+
+    def test_head_request_has_no_body(self):
+        self.assertEqual(self._request(query_string='t=2147483647&u=L3MvbGluaw==&ip=127.0.0.1&p=password',
+                                       method='HEAD'), (200, b''))
+
+    def test_lifespan(self):
+        messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        asyncio.get_event_loop().run_until_complete(self.asgi_app({'type': 'lifespan'}, receive, send))
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+
+
+class PreforkServerTestCase(unittest.TestCase):
+    def setUp(self):
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            self.port = probe.getsockname()[1]
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.unix_socket_path = os.path.join(directory.name, 'sign.sock')
+        self.server = subprocess.Popen([sys.executable, 'serve.py', '--host', '127.0.0.1', '--port', str(self.port),
+                                        '--workers', '2', '--unix-socket', self.unix_socket_path],
+                                       env=dict(os.environ, APP_SETTINGS=config_name), stderr=subprocess.DEVNULL)
+        self.addCleanup(self.server.wait)
+        self.addCleanup(self.server.kill)
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', self.port)).close()
+                break
+            except ConnectionRefusedError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+
+    def _get(self, connection: http.client.HTTPConnection):
+        connection.request('GET', '/?t=2147483647&u=L3MvbGluaw==&ip=127.0.0.1&p=password')
+        response = connection.getresponse()
+        return response.status, response.read()
+
+    def test_connection_is_kept_alive(self):
+        connection = http.client.HTTPConnection('127.0.0.1', self.port)
+        self.addCleanup(connection.close)
+
+        self.assertEqual(self._get(connection), (200, b'/s/link?md5=FbRZ_kL2P7SJMI6hCxS11Q&expires=2147483647'))
+        sock = connection.sock
+        connection.request('POST', '/batch', body=iter([b'[{"t": 2147483647, "u": "L3MvbGluaw==", ',
+                                                        b'"ip": "127.0.0.1", "p": "password"}]']),
+                           encode_chunked=True)
+        response = connection.getresponse()
+        self.assertEqual(response.read(), b'["/s/link?md5=FbRZ_kL2P7SJMI6hCxS11Q&expires=2147483647"]')
+        connection.request('POST', '/unknown', body=b'x' * 100000)
+        self.assertEqual(connection.getresponse().read()[:1], b'<')
+        self.assertEqual(self._get(connection)[0], 200)
+        self.assertIs(connection.sock, sock)
+
+    def test_unix_socket_is_served_by_workers(self):
+        with UnixSocketSigningClient(self.unix_socket_path, timeout=10) as client:
+            self.assertEqual(client.sign(2147483647, '/s/link', '127.0.0.1', 'password'),
+                             ('SUCCESS', '/s/link?md5=FbRZ_kL2P7SJMI6hCxS11Q&expires=2147483647'))
+
+        self.server.send_signal(signal.SIGTERM)
+        self.assertEqual(self.server.wait(timeout=10), 0)
+        self.assertFalse(os.path.exists(self.unix_socket_path))
+
+    def test_graceful_restart_and_shutdown(self):
+        self.server.send_signal(signal.SIGHUP)
+        deadline = time.monotonic() + 1
+        while time.monotonic() < deadline:
+            connection = http.client.HTTPConnection('127.0.0.1', self.port)
+            self.assertEqual(self._get(connection)[0], 200)
+            connection.close()
+
+        self.server.send_signal(signal.SIGTERM)
+        self.assertEqual(self.server.wait(timeout=10), 0)
+
+
+class PreforkServerMetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            self.port = probe.getsockname()[1]
+        environ = {key: value for key, value in os.environ.items() if key != 'METRICS_DIR'}
+        self.server = subprocess.Popen([sys.executable, 'serve.py', '--host', '127.0.0.1', '--port', str(self.port),
+                                        '--workers', '2'], env=dict(environ, APP_SETTINGS='production'),
+                                       stderr=subprocess.DEVNULL)
+        self.addCleanup(self.server.wait)
+        self.addCleanup(self.server.kill)
+        self._wait_for_server()
+
+    def _wait_for_server(self):
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', self.port)).close()
+                return
+            except ConnectionRefusedError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+
+    def _get(self, path: str):
+        # every request on a new connection, so the workers answer them in turn
+        connection = http.client.HTTPConnection('127.0.0.1', self.port)
+        self.addCleanup(connection.close)
+        connection.request('GET', path)
+        return connection.getresponse().read().decode('utf-8')
+
+    def _get_successful_responses(self):
+        metrics = self._get('/metrics')
+        return int(metrics.split('secure_link_responses_total{type="SUCCESS"} ')[1].split('\n')[0])
+
+    def test_metrics_are_summed_over_workers_and_restarts(self):
+        for _ in range(10):
+            self._get('/?t=2147483647&u=L3MvbGluaw==&ip=127.0.0.1&p=password')
+
+        self.assertEqual({self._get_successful_responses() for _ in range(6)}, {10})
+        self.server.send_signal(signal.SIGHUP)
+        time.sleep(1)
+        self.assertEqual({self._get_successful_responses() for _ in range(6)}, {10})
+        self.server.send_signal(signal.SIGTERM)
+        self.assertEqual(self.server.wait(timeout=10), 0)
+
+
+class UnixSocketTestCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.server = create_unix_socket_server(config_name, os.path.join(directory.name, 'sign.sock'))
+        self.addCleanup(self.server.remove)
+        self.addCleanup(self.server.shutdown)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = UnixSocketSigningClient(self.server.server_address, timeout=10)
+        self.addCleanup(self.client.close)
+        self.flask_client = app.test_client()
+
+    def test_pipelined_responses_match_flask_app(self):
+        responses = self.client.sign_many([
+            (2147483647, '/s/link', '127.0.0.1', 'password'),
+            (-1, '/s/link', '127.0.0.1', 'password'),
+            (2147483647, '/s/link', '127.0.0.1', 'password', 'unknown'),
+            (2147483647, '/s/l\u00efnk?a=1', '127.0.0.1', ''),
+        ])
+
+        self.assertEqual([response_type for response_type, _ in responses],
+                         ['SUCCESS', 'PARAMETERS_ERROR', 'PARAMETERS_ERROR', 'SUCCESS'])
+        self.assertEqual(responses[0][1], self.flask_client.get(
+            '/?t=2147483647&u=L3MvbGluaw==&ip=127.0.0.1&p=password').data.decode('utf-8'))
+        self.assertEqual(responses[1][1], 'expires: Is not correct timestamp (positive integer)')
+        self.assertEqual(responses[2][1], 'profile: Is not configured profile')
+        # the Flask application escapes non-ascii links like json strings
+        flask_body = self.flask_client.get('/?t=2147483647&u=L3MvbMOvbms/YT0x&ip=127.0.0.1&p=').data.decode('utf-8')
+        self.assertEqual(responses[3][1], json.loads('"{}"'.format(flask_body)))
+
+    def test_incorrect_frame(self):
+        frame = encode_request(2147483647, '/s/link', '127.0.0.1', 'password')
+        self.client.socket.sendall(frame[:3] + bytes([frame[3] - 1]) + frame[4:-1])
+
+        self.assertEqual(self.client.read_response(), ('PARAMETERS_ERROR', 'frame: Is not correct request frame'))
+        self.assertEqual(self.client.sign(2147483647, '/s/link', '127.0.0.1', 'password')[0], 'SUCCESS')
+
+    def test_batch_larger_than_socket_buffers(self):
+        requests = [(2147483647, '/s/link/{}'.format(number), '127.0.0.1', 'password') for number in range(20000)]
+
+        responses = self.client.sign_many(requests)
+        self.assertEqual(len(responses), len(requests))
+        self.assertEqual(responses[-1], self.client.sign(*requests[-1]))
+
+    def test_slow_reader_keeps_connection(self):
+        frames = b''.join(encode_request(2147483647, '/s/link', '127.0.0.1', 'password') for _ in range(20000))
+        sender = threading.Thread(target=self.client.socket.sendall, args=(frames,))
+        sender.start()
+        # responses fill the socket buffers, while the client does not read them for longer than the poll interval
+        time.sleep(1)
+
+        responses = [self.client.read_response() for _ in range(20000)]
+        sender.join()
+        self.assertEqual({response_type for response_type, _ in responses}, {'SUCCESS'})
+
+    def test_too_long_frame_closes_connection(self):
+        self.client.socket.sendall((MAX_REQUEST_SIZE + 1).to_bytes(4, 'big'))
+
+        with self.assertRaises(ConnectionError):
+            self.client.read_response()
+
+
+class NegotiateResponseFormatTestCase(unittest.TestCase):
+    def test_formats(self):
+        for accept, response_format in [('', 'legacy'), ('*/*', 'legacy'), ('text/plain', 'text'),
+                                        ('application/json', 'json'), ('Application/JSON; charset=utf-8', 'json'),
+                                        ('text/html,application/xhtml+xml,*/*;q=0.8', 'legacy'),
+                                        ('text/plain;q=0.5, application/json', 'json'),
+                                        ('application/json;q=0.1, text/plain;q=0.9', 'text'),
+                                        ('image/png', 'legacy'), ('application/json;q=x', 'legacy')]:
+            self.assertEqual(_negotiate_response_format(accept), response_format, accept)
+
+
+class SerializeLinkResponseTestCase(unittest.TestCase):
+    def test_bodies_match_json_dumps(self):
+        links = ['/s/link?md5=FbRZ_kL2P7SJMI6hCxS11Q&expires=2147483647', '/s/\u043f.ts?md5=x&expires=1',
+                 '/s/"link"?md5=x&expires=1', '/s/a\\b?md5=x&expires=1', '/s/a\x7fb?md5=x&expires=1', '']
+        for link in links:
+            response = ResponseSuccess(link)
+            self.assertEqual(_serialize_link_response(response, 'json')[0], json.dumps(link).encode('utf-8'))
+            self.assertEqual(_serialize_link_response(response, 'legacy')[0],
+                             json.dumps(link).strip('"').encode('utf-8'))
+            self.assertEqual(_serialize_link_response(response, 'text')[0], link.encode('utf-8'))
+
+
+class LeanWsgiAppTestCase(unittest.TestCase):
+    def setUp(self):
+        self.lean_client = Client(create_lean_wsgi_app(config_name))
+        self.test_client = app.test_client(self)
+
+    def test_responses_match_flask_app(self):
+        for query_string in ['t=2147483647&u=L3MvbGluaw==&ip=127.0.0.1&p=password', '',
+                             't=2147483647&t=1&u=L3MvbGluaw==&ip=127.0.0.1&p=password&p=',
+                             't=qwerty&u=L3MvbGluaw==&ip=127.0.0.1&p=password',
+                             't=2147483647&u=L3MvbGluaw==&ip=1270.0.1&p=password']:
+            flask_response = self.test_client.get('/?' + query_string)
+            lean_response = self.lean_client.get('/?' + query_string)
+            self.assertEqual(lean_response.status, flask_response.status, query_string)
+            self.assertEqual(lean_response.data, flask_response.data, query_string)
+            self.assertEqual(lean_response.headers['Content-Type'], flask_response.headers['Content-Type'])
+
+    def test_negotiated_and_redirect_responses_match_flask_app(self):
+        path = '/?t=2147483647&u=L3MvbGluaw==&ip=127.0.0.1&p=password'
+        for query_string, accept in [('', 'application/json'), ('', 'text/plain'), ('&redirect=1', '*/*')]:
+            flask_response = self.test_client.get(path + query_string, headers={'Accept': accept})
+            lean_response = self.lean_client.get(path + query_string, headers={'Accept': accept})
+            self.assertEqual(lean_response.status, flask_response.status, accept)
+            self.assertEqual(lean_response.data, flask_response.data, accept)
+            self.assertEqual(lean_response.headers['Content-Type'], flask_response.headers['Content-Type'])
+            self.assertEqual(lean_response.headers.get('Location'), flask_response.headers.get('Location'))
+
+    def test_status_lines_match_flask_app(self):
+        for status in STATUS_CODES.values():
+            self.assertEqual(STATUS_LINES[status], '{} {}'.format(status, HTTP_STATUS_CODES[status].upper()))
+
+    def test_unknown_path(self):
+        self.assertEqual(self.lean_client.get('/unknown').status_code, 404)
+
+    def test_post_is_not_allowed(self):
+        self.assertEqual(self.lean_client.post('/').status_code, 405)
+
+    def test_application_is_selected_by_config(self):
+        self.assertIsInstance(create_wsgi_application(config_name), Flask)
+        with mock.patch.object(app_config[config_name], 'WSGI_APP', 'lean'):
+            self.assertNotIsInstance(create_wsgi_application(config_name), Flask)
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        with mock.patch.object(app_config[config_name], 'METRICS_ENABLED', True):
+            self.test_client = create_app(config_name).test_client(self)
+        self.addCleanup(REGISTRY.configure, enabled=False)
+
+    def test_metrics_are_not_exposed_by_default(self):
+        self.assertEqual(app.test_client(self).get('/metrics').status_code, 404)
+
+    def test_requests_are_counted(self):
+        self.test_client.get('/?t=2147483647&u=L3MvbGluaw==&ip=127.0.0.1&p=password')
+        self.test_client.get('/')
+
+        response = self.test_client.get('/metrics')
+
+        self.assertEqual(response.status_code, 200)
+        metrics = response.data.decode()
+        self.assertIn('secure_link_responses_total{type="SUCCESS"} 1\n', metrics)
+        self.assertIn('secure_link_responses_total{type="PARAMETERS_ERROR"} 1\n', metrics)
+        for stage in ('parse', 'validate', 'serialize'):
+            self.assertIn('secure_link_stage_seconds_count{{stage="{}"}} 2\n'.format(stage), metrics)
+        for stage in ('hash', 'url_rebuild'):
+            self.assertIn('secure_link_stage_seconds_count{{stage="{}"}} 1\n'.format(stage), metrics)
+
+    def test_batch_items_are_counted_once(self):
+        item = {'t': 2147483647, 'u': 'L3MvbGluaw==', 'ip': '127.0.0.1', 'p': 'password'}
+        self.test_client.post('/batch', data=json.dumps([item, item, dict(item, ip='1270.0.1')]))
+        self.test_client.post('/batch', data='{}')
+
+        metrics = self.test_client.get('/metrics').data.decode()
+        self.assertIn('secure_link_responses_total{type="SUCCESS"} 2\n', metrics)
+        self.assertIn('secure_link_responses_total{type="PARAMETERS_ERROR"} 2\n', metrics)
+
+
+class AdmissionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = '/?t=2147483647&u=L3MvbGluaw==&ip=127.0.0.1&p=password'
+
+    def _create_client(self, **config):
+        with mock.patch.multiple(app_config[config_name], **config):
+            self.app = create_app(config_name)
+        return self.app.test_client()
+
+    def test_admission_is_disabled_by_default(self):
+        self.assertIsNone(create_app(config_name).extensions['secure_link_admission'])
+
+    def test_clients_over_rate_are_rejected_before_validation(self):
+        test_client = self._create_client(ADMISSION_RATE=0.5, ADMISSION_BURST=2, ADMISSION_CLIENT_HEADER='X-Real-IP')
+        headers = {'X-Real-IP': '10.0.0.1'}
+
+        self.assertEqual([test_client.get(self.path, headers=headers).status_code for _ in range(2)], [200, 200])
+        with mock.patch('api.GenerateSecureLinkRequestObject') as request_object_class:
+            response = test_client.get('/', headers=headers)
+        self.assertFalse(request_object_class.called)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '2')
+        self.assertEqual(json.loads(response.data.decode('utf-8'))['type'], 'RATE_LIMIT_ERROR')
+        self.assertEqual(test_client.get(self.path, headers={'X-Real-IP': '10.0.0.2'}).status_code, 200)
+
+    def test_requests_over_concurrency_are_rejected(self):
+        test_client = self._create_client(ADMISSION_MAX_CONCURRENCY=1)
+        admission = self.app.extensions['secure_link_admission']
+
+        self.assertIsNone(admission.admit('10.0.0.1'))
+        self.assertEqual(test_client.get(self.path).status_code, 503)
+        admission.release()
+        self.assertEqual(test_client.get(self.path).status_code, 200)
+
+
+class AccessLogTestCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.log_path = os.path.join(directory.name, 'logs', 'access.log')
+        self.path = '/?t=2147483647&u=L3MvbGluaw==&ip=127.0.0.1&p=password'
+
+    def _create_client(self, **config):
+        with mock.patch.multiple(app_config[config_name], ACCESS_LOG_PATH=self.log_path, **config):
+            self.app = create_app(config_name)
+        self.access_log = self.app.extensions['secure_link_access_log']
+        return self.app.test_client()
+
+    def _read_records(self, path=None):
+        self.access_log.close()
+        with open(path or self.log_path) as file:
+            return [json.loads(line) for line in file]
+
+    def test_access_log_is_disabled_by_default(self):
+        self.assertIsNone(create_app(config_name).extensions['secure_link_access_log'])
+
+    def test_requests_are_logged_without_passwords(self):
+        test_client = self._create_client()
+
+        test_client.get(self.path)
+        test_client.get('/?t=2147483647&u=L3MvbGluaw==&p=password')
+        records = self._read_records()
+
+        self.assertEqual([(record['url'], record['ip'], record['expires'], record['outcome'], record['status'])
+                          for record in records],
+                         [('/s/link', '127.0.0.1', 2147483647, 'SUCCESS', 200),
+                          ('/s/link', None, 2147483647, 'PARAMETERS_ERROR', 400)])
+        self.assertEqual(records[0]['client'], '127.0.0.1')
+        self.assertGreater(records[0]['latency'], 0)
+        with open(self.log_path) as file:
+            self.assertNotIn('password', file.read())
+
+    def test_successful_requests_are_sampled_and_failures_are_always_logged(self):
+        test_client = self._create_client(ACCESS_LOG_SAMPLE_RATE=0, ADMISSION_MAX_CONCURRENCY=1)
+        admission = self.app.extensions['secure_link_admission']
+
+        test_client.get(self.path)
+        test_client.get('/?t=2147483647&u=L3MvbGluaw==')
+        admission.admit('10.0.0.1')
+        test_client.get(self.path)
+        admission.release()
+
+        self.assertEqual([record['outcome'] for record in self._read_records()],
+                         ['PARAMETERS_ERROR', 'OVERLOAD_ERROR'])
+
+    def test_records_over_queue_size_are_dropped_and_counted(self):
+        access_log = AccessLog(self.log_path, max_queue_size=2)
+        writing = threading.Event()
+        blocked = threading.Event()
+
+        def write(data):
+            writing.set()
+            blocked.wait()
+
+        with mock.patch.object(access_log, '_write', side_effect=write), \
+                mock.patch('api.access_log.access_log_dropped_total') as dropped_total:
+            access_log.log('client', '/s/link', None, 1, 'default', 'SUCCESS', 200, 0.001)
+            writing.wait(5)
+            for _ in range(5):
+                access_log.log('client', '/s/link', None, 1, 'default', 'SUCCESS', 200, 0.001)
+            blocked.set()
+            access_log.close()
+
+        self.assertEqual(access_log.dropped, 3)
+        self.assertEqual(dropped_total.inc.call_args_list, [mock.call('queue_full')] * 3)
+
+    def test_file_is_rotated(self):
+        # records are about 150 bytes long, so files are rotated after every two records
+        self.access_log = AccessLog(self.log_path, batch_size=1, max_bytes=200, backup_count=2)
+
+        for expires in range(1, 8):
+            self.access_log.log('client', '/s/link', None, expires, 'default', 'SUCCESS', 200, 0.001)
+
+        self.assertEqual([record['expires'] for record in self._read_records()], [7])
+        self.assertEqual([record['expires'] for record in self._read_records(self.log_path + '.1')], [5, 6])
+        self.assertEqual([record['expires'] for record in self._read_records(self.log_path + '.2')], [3, 4])
+        self.assertFalse(os.path.exists(self.log_path + '.3'))
+
+
+class PresignTestCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.catalog_path = os.path.join(directory.name, 'catalog.ndjson')
+        self.expressions = {'public': '$secure_link_expires$uri=$p'}
+        items = [{'url': '/s/link', 'password': 'password', 'ip_address': '127.0.0.1'},
+                 {'url': '/s/public', 'password': 'password', 'profile': 'public', 'expires_in': 600},
+                 {'url': '/s/link', 'password': 'password'},
+                 {'url': '/s/link', 'password': 'password', 'ip_address': '127.0.0.1', 'profile': 'unknown'},
+                 'not object']
+        with open(self.catalog_path, 'w') as file:
+            file.write(''.join(json.dumps(item) + '\n' for item in items) + 'not json\n')
+
+    def _create_scheduler(self, clock):
+        scheduler = PresignScheduler(load_catalog(self.catalog_path, self.expressions), expires_bucket_seconds=300,
+                                     profiles=compile_secure_link_profiles(self.expressions),
+                                     expressions=self.expressions, ahead_seconds=300, cpu_share=1, clock=clock)
+        self.addCleanup(scheduler.close)
+        return scheduler
+
+    def test_load_catalog(self):
+        with self.assertLogs('api.presign', 'WARNING') as logs:
+            catalog = load_catalog(self.catalog_path, self.expressions)
+
+        self.assertEqual(catalog, [CatalogEntry('/s/link', 'password', '127.0.0.1', 'default', 3600),
+                                   CatalogEntry('/s/public', 'password', None, 'public', 600)])
+        self.assertEqual(len(logs.output), 4)
+        self.assertEqual(len(load_catalog(self.catalog_path, self.expressions, max_entries=1)), 1)
+
+    def test_coming_windows_are_signed_incrementally(self):
+        now = [1000000]
+        scheduler = self._create_scheduler(clock=lambda: now[0])
+
+        self.assertEqual(scheduler.refresh(), 4)
+        self.assertEqual(scheduler.refresh(), 0)
+        now[0] += 300
+        self.assertEqual(scheduler.refresh(), 2)
+        self.assertEqual(len(scheduler), 4)
+
+        self.assertIsNone(scheduler.get('default', 1003800, '/s/link', '127.0.0.1', 'password'))
+        self.assertEqual(scheduler.get('default', 1004400, '/s/link', '127.0.0.1', 'password'),
+                         GenerateSecureLinkUseCase()._build_secure_url(1004400, '/s/link', '127.0.0.1', 'password',
+                                                                       'default'))
+        self.assertIsNone(scheduler.get('default', 1004400, '/s/link', '10.0.0.1', 'password'))
+        self.assertEqual(scheduler.get('public', 1001100, '/s/public', '10.0.0.1', 'password'),
+                         scheduler.get('public', 1001100, '/s/public', '10.0.0.2', 'password'))
+        self.assertIsNotNone(scheduler.get('public', 1001100, '/s/public', '10.0.0.1', 'password'))
+
+    def test_refresh_is_not_observed_in_request_stages(self):
+        REGISTRY.configure()
+        self.addCleanup(REGISTRY.configure, enabled=False)
+        scheduler = self._create_scheduler(clock=lambda: 1000000)
+
+        self.assertEqual(scheduler.refresh(), 4)
+        self.assertIn('secure_link_stage_seconds_count{stage="hash"} 0\n', REGISTRY.render())
+
+    def test_requests_are_served_from_presigned_links(self):
+        config = {'PRESIGN_CATALOG_PATH': self.catalog_path, 'EXPIRES_BUCKET_SECONDS': 300,
+                  'SECURE_LINK_PROFILES': self.expressions}
+        with mock.patch.multiple(app_config[config_name], **config):
+            test_client = create_app(config_name).test_client(self)
+        scheduler = test_client.application.extensions['secure_link_presign']
+        self.addCleanup(scheduler.close)
+        expires = int(time.time()) + 3600
+
+        scheduler.refresh()
+        bucket_expires = -(-expires // 300) * 300
+        scheduler._windows[bucket_expires][('default', '/s/link', '127.0.0.1', 'password')] = '/presigned'
+        response = test_client.get('/?t={}&u=L3MvbGluaw==&ip=127.0.0.1&p=password'.format(expires))
+        self.assertEqual(response.data, b'/presigned')
+        response = test_client.get('/?t={}&u=L3MvbGluaw==&ip=10.0.0.1&p=password'.format(expires))
+        self.assertTrue(response.data.startswith(b'/s/link?md5='))
+
+    def test_presigning_needs_expires_buckets(self):
+        with mock.patch.object(app_config[config_name], 'PRESIGN_CATALOG_PATH', self.catalog_path):
+            self.assertRaises(ValueError, create_app, config_name)
+
+
+class ProfilingTestCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        config = {'PROFILING_ENABLED': True, 'PROFILING_DIR': directory.name, 'PROFILING_SIGNAL': None,
+                  'PROFILING_DUMP_EVERY': 2, 'SECRET': 'secret'}
+        with mock.patch.multiple(app_config[config_name], **config):
+            self.app = create_app(config_name)
+        self.profiler = self.app.extensions['profiler']
+        self.test_client = self.app.test_client(self)
+        self.path = '/?t=2147483647&u=L3MvbGluaw==&ip=127.0.0.1&p=password'
+
+    def _assert_dumped(self, path: str):
+        self.assertTrue(os.path.exists(path + '.pstats'))
+        self.assertTrue(any(function_name == 'process_request'
+                            for _, _, function_name in pstats.Stats(path + '.pstats').stats))
+        with open(path + '.collapsed') as file:
+            for line in file:
+                _, count = line.rsplit(' ', 1)
+                self.assertGreater(int(count), 0)
+
+    def test_requests_are_not_profiled_by_default(self):
+        self.test_client.get(self.path)
+
+        self.assertFalse(self.profiler.should_profile())
+        self.assertEqual(self.profiler.dumps, [])
+
+    def test_sampled_requests_are_dumped(self):
+        self.profiler.sample_rate = 1.0
+
+        self.test_client.get(self.path)
+        self.test_client.get(self.path)
+
+        self.assertEqual(len(self.profiler.dumps), 1)
+        self._assert_dumped(self.profiler.dumps[0])
+
+    def test_admin_request_starts_profiling_window(self):
+        self.assertEqual(self.test_client.post('/admin/profile?seconds=60').status_code, 404)
+        response = self.test_client.post('/admin/profile?seconds=60', headers={'X-Secret': 'secret'})
+        self.assertEqual(response.status_code, 200)
+        self.test_client.get(self.path)
+        self.test_client.get(self.path)
+        self.test_client.get(self.path)
+        self.assertEqual(self.profiler.dumps, [])
+
+        self.profiler.active_until = 1
+        self.test_client.get(self.path)
+
+        self.assertEqual(len(self.profiler.dumps), 1)
+        self._assert_dumped(self.profiler.dumps[0])
+
+    def _wait_for_sampler_to_stop(self, sampler: threading.Thread):
+        sampler.join(timeout=5)
+        self.assertFalse(sampler.is_alive())
+        self.assertIsNone(self.profiler._sampler)
+
+    def test_sampler_stops_when_nothing_is_profiled(self):
+        # the sampler checks for profiled requests after the interval, so it is alive right after the request
+        self.profiler.sampling_interval = 0.5
+        self.profiler.sample_rate = 1.0
+        self.test_client.get(self.path)
+        self._wait_for_sampler_to_stop(self.profiler._sampler)
+
+        self.test_client.get(self.path)
+        self.assertIsNotNone(self.profiler._sampler)
+        self._wait_for_sampler_to_stop(self.profiler._sampler)
+
+    def test_sampler_stops_after_window(self):
+        self.profiler.sampling_interval = 0.05
+        self.profiler.start(0.5)
+        self.test_client.get(self.path)
+        sampler = self.profiler._sampler
+
+        self.assertTrue(sampler.is_alive())
+        self._wait_for_sampler_to_stop(sampler)
+        self.assertEqual(len(self.profiler.dumps), 1)
+
+
 class CreateRequestObjectFromRequestArgsTestCase(unittest.TestCase):
     def setUp(self):
         self.request_args = {
@@ -73,6 +921,12 @@ class CreateRequestObjectFromRequestArgsTestCase(unittest.TestCase):
         self.assertEqual('127.0.0.1', request_object.ip_address)
         self.assertEqual('password', request_object.password)
 
+    def test_with_incorrect_base64_url(self):
+        self.request_args['u'] = 'L3MvbGluaw'
+        request_object = _create_request_object_from_request_args(self.request_args)
+        self.assertFalse(request_object)
+        self.assertEqual(request_object.errors[0]['parameter'], 'url')
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,223 @@
+"""Binary signing protocol over a Unix domain socket for application servers on the same host.
+
+Every frame is its body length as a big-endian uint32 followed by the body. A request body is
+
+    int64 expires, uint16 url length, uint8 ip length, uint16 password length, uint8 profile length
+
+followed by the utf-8 url, ip address, password and profile. A response body is a status byte of RESPONSE_STATUSES
+followed by the utf-8 secure link or error message. Clients can pipeline any number of requests on one connection,
+responses are sent in the order of requests.
+"""
+import os
+import selectors
+import socket
+import socketserver
+import stat
+import struct
+
+from api import _create_cache, _load_config
+from api.server import ConnectionCountingMixIn
+from shared.request_object import InvalidRequestObject
+from shared.response_object import ResponseFailure, ResponseSuccess
+from use_cases.generate_secure_link_use_cases import GenerateSecureLinkUseCase
+from use_cases.request_objects import GenerateSecureLinkRequestObject
+from use_cases.secure_link_md5 import DEFAULT_PROFILE, compile_secure_link_profiles
+
+FRAME_HEADER = struct.Struct('!I')
+REQUEST_HEADER = struct.Struct('!qHBHB')
+RESPONSE_HEADER = struct.Struct('!IB')
+MAX_REQUEST_SIZE = REQUEST_HEADER.size + 0xFFFF + 0xFF + 0xFFFF + 0xFF
+
+RESPONSE_STATUSES = {
+    ResponseSuccess.SUCCESS: 0,
+    ResponseFailure.PARAMETERS_ERROR: 1,
+    ResponseFailure.RESOURCE_ERROR: 2,
+    ResponseFailure.SYSTEM_ERROR: 3,
+    ResponseFailure.RATE_LIMIT_ERROR: 4,
+    ResponseFailure.OVERLOAD_ERROR: 5
+}
+RESPONSE_TYPES = {status: response_type for response_type, status in RESPONSE_STATUSES.items()}
+
+
+def encode_request(expires: int, url: str, ip_address: str, password: str, profile: str=DEFAULT_PROFILE):
+    fields = [value.encode('utf-8') for value in (url, ip_address, password, profile)]
+    header = REQUEST_HEADER.pack(expires, *map(len, fields))
+    return FRAME_HEADER.pack(len(header) + sum(map(len, fields))) + header + b''.join(fields)
+
+
+def decode_request(body: bytes, url_max_length: int=GenerateSecureLinkRequestObject.URL_MAX_LENGTH,
+                   profiles=GenerateSecureLinkRequestObject.PROFILES, expires_bucket_seconds: int=0):
+    try:
+        expires, *lengths = REQUEST_HEADER.unpack_from(body)
+        if REQUEST_HEADER.size + sum(lengths) != len(body):
+            raise ValueError('Fields lengths do not match the frame length')
+        fields = []
+        offset = REQUEST_HEADER.size
+        for length in lengths:
+            fields.append(body[offset:offset + length].decode('utf-8'))
+            offset += length
+    except (struct.error, ValueError):
+        invalid_request = InvalidRequestObject()
+        invalid_request.add_error('frame', 'Is not correct request frame')
+        return invalid_request
+    url, ip_address, password, profile = fields
+    return GenerateSecureLinkRequestObject(expires=expires, url=url, ip_address=ip_address, password=password,
+                                           profile=profile, url_max_length=url_max_length, profiles=profiles,
+                                           expires_bucket_seconds=expires_bucket_seconds)
+
+
+def encode_response(response):
+    payload = (response.value if response else response.message or '').encode('utf-8')
+    return RESPONSE_HEADER.pack(len(payload) + 1, RESPONSE_STATUSES[response.type]) + payload
+
+
+class BinarySigningRequestHandler(socketserver.BaseRequestHandler):
+    """Answers every complete request frame received, so pipelined requests are answered with one write.
+
+    The connection is closed on a frame longer than MAX_REQUEST_SIZE and, when the server is stopping,
+    as soon as there are no unanswered requests.
+    """
+    RECV_SIZE = 65536
+    # how often an idle connection checks if the server is stopping
+    POLL_INTERVAL = 0.5
+
+    def handle(self):
+        # a socket timeout would apply to sendall() too and drop clients, which are slow to read responses
+        self.request.settimeout(None)
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.request, selectors.EVENT_READ)
+            self._serve(selector)
+
+    def _serve(self, selector: selectors.BaseSelector):
+        buffer = bytearray()
+        while True:
+            if not selector.select(self.POLL_INTERVAL):
+                if self.server.stopping and not buffer:
+                    return
+                continue
+            data = self.request.recv(self.RECV_SIZE)
+            if not data:
+                return
+            buffer += data
+            responses = []
+            offset = 0
+            while len(buffer) - offset >= FRAME_HEADER.size:
+                length, = FRAME_HEADER.unpack_from(buffer, offset)
+                if length > MAX_REQUEST_SIZE:
+                    return
+                end = offset + FRAME_HEADER.size + length
+                if end > len(buffer):
+                    break
+                responses.append(self.server.sign(buffer[offset + FRAME_HEADER.size:end]))
+                offset = end
+            del buffer[:offset]
+            if responses:
+                self.request.sendall(b''.join(responses))
+            if self.server.stopping and not buffer:
+                return
+
+
+class UnixSocketSigningServer(ConnectionCountingMixIn, socketserver.ThreadingUnixStreamServer):
+    """Threaded server of the binary protocol.
+
+    It can be created before workers are forked, then all of them accept connections from the one socket.
+    """
+    daemon_threads = True
+    request_queue_size = socket.SOMAXCONN
+
+    def __init__(self, path: str, use_case: GenerateSecureLinkUseCase,
+                 url_max_length: int=GenerateSecureLinkRequestObject.URL_MAX_LENGTH,
+                 profiles=GenerateSecureLinkRequestObject.PROFILES, expires_bucket_seconds: int=0):
+        self.use_case = use_case
+        self.url_max_length = url_max_length
+        self.profiles = profiles
+        self.expires_bucket_seconds = expires_bucket_seconds
+        super().__init__(path, BinarySigningRequestHandler)
+
+    def server_bind(self):
+        # the socket file of a previous run is left after a crash and would fail the bind
+        try:
+            if stat.S_ISSOCK(os.stat(self.server_address).st_mode):
+                os.unlink(self.server_address)
+        except FileNotFoundError:
+            pass
+        super().server_bind()
+
+    def sign(self, body: bytes):
+        request_object = decode_request(body, self.url_max_length, self.profiles, self.expires_bucket_seconds)
+        return encode_response(self.use_case.execute(request_object))
+
+    def remove(self):
+        """Close the socket and remove its file."""
+        self.server_close()
+        try:
+            os.unlink(self.server_address)
+        except FileNotFoundError:
+            pass
+
+
+def create_unix_socket_server(config_name, path: str=None):
+    config = _load_config(config_name)
+    profiles = compile_secure_link_profiles(config['SECURE_LINK_PROFILES'])
+    use_case = GenerateSecureLinkUseCase(cache=_create_cache(config), profiles=profiles)
+    return UnixSocketSigningServer(path or config['UNIX_SOCKET_PATH'], use_case,
+                                   url_max_length=config['URL_MAX_LENGTH'], profiles=profiles,
+                                   expires_bucket_seconds=config['EXPIRES_BUCKET_SECONDS'])
+
+
+class UnixSocketSigningClient(object):
+    """Blocking client of the binary protocol, sign_many() pipelines requests on the connection in windows."""
+    # bytes of requests sent before their responses are read: responses of a window fit into the socket buffers,
+    # otherwise both sides could block in sendall() on full buffers
+    WINDOW_SIZE = 65536
+
+    def __init__(self, path: str, timeout: float=None):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.settimeout(timeout)
+        self.socket.connect(path)
+        self.rfile = self.socket.makefile('rb')
+
+    def sign(self, expires: int, url: str, ip_address: str, password: str, profile: str=DEFAULT_PROFILE):
+        return self.sign_many([(expires, url, ip_address, password, profile)])[0]
+
+    def sign_many(self, requests):
+        """Return (response type, secure link or error message) for every request of
+        (expires, url, ip_address, password[, profile]) tuples."""
+        responses = []
+        frames = []
+        window_size = 0
+        for request in requests:
+            frame = encode_request(*request)
+            frames.append(frame)
+            window_size += len(frame)
+            if window_size >= self.WINDOW_SIZE:
+                responses += self._send_window(frames)
+                frames = []
+                window_size = 0
+        if frames:
+            responses += self._send_window(frames)
+        return responses
+
+    def _send_window(self, frames: list):
+        self.socket.sendall(b''.join(frames))
+        return [self.read_response() for _ in frames]
+
+    def read_response(self):
+        header = self.rfile.read(RESPONSE_HEADER.size)
+        if len(header) < RESPONSE_HEADER.size:
+            raise ConnectionError('Connection closed by the server')
+        length, status = RESPONSE_HEADER.unpack(header)
+        payload = self.rfile.read(length - 1)
+        if len(payload) < length - 1:
+            raise ConnectionError('Connection closed by the server')
+        return RESPONSE_TYPES[status], payload.decode('utf-8')
+
+    def close(self):
+        self.rfile.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,47 @@
+"""Framework-free WSGI application serving "/" with the same behavior as the Flask application."""
+from http import HTTPStatus
+
+from api import (REDIRECT_STATUS_CODE, STATUS_CODES, _create_cache, _create_request_object_from_request_args,
+                 _get_redirect_location, _get_request_args, _load_config, _negotiate_response_format,
+                 _serialize_link_response)
+from use_cases.generate_secure_link_use_cases import GenerateSecureLinkUseCase
+from use_cases.secure_link_md5 import compile_secure_link_profiles
+
+# reason phrases are upper case like the ones of the Flask application
+STATUS_LINES = {status: '{} {}'.format(status, HTTPStatus(status).phrase.upper())
+                for status in set(STATUS_CODES.values()) | {REDIRECT_STATUS_CODE, 404, 405}}
+CONTENT_TYPE = 'text/html; charset=utf-8'
+
+
+def create_lean_wsgi_app(config_name):
+    config = _load_config(config_name)
+    cache = _create_cache(config)
+    profiles = compile_secure_link_profiles(config['SECURE_LINK_PROFILES'])
+
+    def app(environ, start_response):
+        method = environ['REQUEST_METHOD']
+        content_type = CONTENT_TYPE
+        headers = []
+        if environ.get('PATH_INFO') not in ('', '/'):
+            status, body = 404, b'Not Found'
+        elif method not in ('GET', 'HEAD'):
+            status, body = 405, b'Method Not Allowed'
+        else:
+            query_string = environ.get('QUERY_STRING', '').encode('latin-1')
+            request_args = _get_request_args(query_string)
+            request_object = _create_request_object_from_request_args(request_args, config['URL_MAX_LENGTH'],
+                                                                      profiles, config['EXPIRES_BUCKET_SECONDS'])
+            use_case = GenerateSecureLinkUseCase(cache=cache, profiles=profiles)
+            response = use_case.execute(request_object)
+            if response and request_args.get('redirect') == '1':
+                status, body = REDIRECT_STATUS_CODE, b''
+                headers.append(('Location', _get_redirect_location(response.value, config['REDIRECT_BASE_URL'])))
+            else:
+                status = STATUS_CODES[response.type]
+                body, content_type = _serialize_link_response(
+                    response, _negotiate_response_format(environ.get('HTTP_ACCEPT', '')))
+        headers += [('Content-Type', content_type), ('Content-Length', str(len(body)))]
+        start_response(STATUS_LINES[status], headers)
+        return [b''] if method == 'HEAD' else [body]
+
+    return app
@@ -0,0 +1,6 @@
+import os
+
+from api.asgi import create_asgi_app
+
+config_name = os.getenv('APP_SETTINGS')
+app = create_asgi_app(config_name)
@@ -0,0 +1,25 @@
+"""Performance benchmarks. Every module can be run separately, e.g. `python -m benchmarks.fan_out`."""
+import io
+import timeit
+
+QUERY_STRING = 't=2147483647&u=L3MvbGluaw==&ip=127.0.0.1&p=password'
+
+
+def measure(func, number: int=1000, repeat: int=5):
+    """Return the best time of one func call in seconds."""
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def format_time(seconds: float):
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return '{:.2f}{}'.format(seconds / scale, unit)
+    return '{:.0f}ns'.format(seconds / 1e-9)
+
+
+def call_wsgi(wsgi_app, query_string: str=QUERY_STRING, path: str='/'):
+    """Call the WSGI application in-process and return the response body."""
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query_string, 'SERVER_NAME': 'localhost',
+               'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.url_scheme': 'http',
+               'wsgi.input': io.BytesIO(), 'wsgi.errors': io.StringIO()}
+    return b''.join(wsgi_app(environ, lambda status, headers, exc_info=None: None))
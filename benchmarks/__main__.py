@@ -0,0 +1,126 @@
+"""Times every stage of the signing pipeline separately.
+
+    python -m benchmarks -o results.json             # run and save results
+    python -m benchmarks -b baseline.json            # fail if any stage got slower than the baseline
+
+Exits with status 1 when a stage is slower than in the baseline by more than the tolerance.
+"""
+import argparse
+import base64
+import json
+import platform
+import sys
+
+from benchmarks import format_time, measure
+from shared.response_object import ResponseSuccess
+from shared.use_case import UseCase
+from use_cases.generate_secure_link_use_cases import GenerateSecureLinkUseCase
+from use_cases.request_objects import GenerateSecureLinkRequestObject
+
+URL_LENGTHS = (16, 256, 2048)
+INVALID_PARAMS = {'expires': 'qwerty', 'url': '//dfds', 'ip_address': '1270.0.1', 'password': None}
+
+
+def _get_params(url_length: int):
+    return {'expires': 2147483647, 'url': '/s/' + 'a' * (url_length - 3), 'ip_address': '127.0.0.1',
+            'password': 'password'}
+
+
+def _get_query_string(params: dict):
+    return 't={}&u={}&ip={}&p={}'.format(params['expires'], base64.b64encode(params['url'].encode()).decode(),
+                                         params['ip_address'], params['password'])
+
+
+class _ConstantUseCase(UseCase):
+    def process_request(self, request_object):
+        return ResponseSuccess(request_object)
+
+
+class _FailingUseCase(UseCase):
+    def process_request(self, request_object):
+        raise ValueError('error')
+
+
+def _iter_stage_benchmarks(test_client):
+    """Yield benchmark names with functions to measure."""
+    for url_length in URL_LENGTHS:
+        params = _get_params(url_length)
+        encoded_url = base64.b64encode(params['url'].encode())
+        yield 'decode/url_{}'.format(url_length), lambda: base64.b64decode(encoded_url).decode('utf-8')
+        yield 'validate/valid/url_{}'.format(url_length), lambda: GenerateSecureLinkRequestObject(**params)
+        yield 'hash/url_{}'.format(url_length), lambda: GenerateSecureLinkUseCase._generate_hash_for_secure_link(
+            **params)
+        query_dict = {'md5': 'FbRZ_kL2P7SJMI6hCxS11Q', 'expires': params['expires']}
+        yield 'add_query/url_{}'.format(url_length), lambda: GenerateSecureLinkUseCase._add_query_to_url(
+            url=params['url'], query_dict=query_dict)
+        yield 'add_query/url_{}_with_query'.format(url_length), lambda: GenerateSecureLinkUseCase._add_query_to_url(
+            url=params['url'] + '?lang=en', query_dict=query_dict)
+        path = '/?' + _get_query_string(params)
+        yield 'round_trip/valid/url_{}'.format(url_length), lambda: test_client.get(path)
+
+    yield 'validate/invalid', lambda: GenerateSecureLinkRequestObject(**INVALID_PARAMS)
+    valid_request_object = GenerateSecureLinkRequestObject(**_get_params(16))
+    invalid_request_object = GenerateSecureLinkRequestObject(**INVALID_PARAMS)
+    yield 'execute/success', lambda: _ConstantUseCase().execute(valid_request_object)
+    yield 'execute/invalid_request', lambda: _ConstantUseCase().execute(invalid_request_object)
+    yield 'execute/exception', lambda: _FailingUseCase().execute(valid_request_object)
+
+    valid_path = '/?' + _get_query_string(_get_params(256))
+    invalid_path = '/?t=qwerty&u=L3MvbGluaw==&ip=1270.0.1'
+
+    def round_trip_mix():
+        test_client.get(valid_path)
+        test_client.get(invalid_path)
+
+    yield 'round_trip/invalid', lambda: test_client.get(invalid_path)
+    yield 'round_trip/half_invalid', round_trip_mix
+
+
+def run_benchmarks(test_client, number: int=1000, repeat: int=5):
+    return {name: measure(func, number=number if not name.startswith('round_trip') else number // 10, repeat=repeat)
+            for name, func in _iter_stage_benchmarks(test_client)}
+
+
+def compare_with_baseline(results: dict, baseline: dict, tolerance: float):
+    """Return names of benchmarks slower than in the baseline by more than the tolerance."""
+    return [name for name, seconds in sorted(results.items())
+            if name in baseline and seconds > baseline[name] * (1 + tolerance)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time every stage of the signing pipeline.')
+    parser.add_argument('-o', '--output', help='save results to the json file')
+    parser.add_argument('-b', '--baseline', help='compare results with the json file saved before')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.25,
+                        help='allowed slowdown against the baseline (0.25 by default)')
+    parser.add_argument('-n', '--number', type=int, default=1000, help='calls per measurement')
+    args = parser.parse_args(argv)
+
+    from api import create_app
+    test_client = create_app('testing').test_client()
+    results = run_benchmarks(test_client, number=args.number)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)['results']
+
+    for name, seconds in sorted(results.items()):
+        line = '{:<40} {:>10}'.format(name, format_time(seconds))
+        if name in baseline:
+            line += ' {:>+7.1%}'.format(seconds / baseline[name] - 1)
+        print(line)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'python': platform.python_version(), 'results': results}, file, indent=2, sort_keys=True)
+
+    regressions = compare_with_baseline(results, baseline, args.tolerance)
+    if regressions:
+        print('\nPERFORMANCE REGRESSION: {} slower than the baseline by more than {:.0%}'.format(
+            ', '.join(regressions), args.tolerance), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
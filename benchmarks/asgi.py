@@ -0,0 +1,85 @@
+"""Compares the asyncio ASGI application with the Flask WSGI application.
+
+Both applications are called in-process, so the numbers show the per-request cost of each serving path
+without network and server overhead, and the cost of holding many idle keep-alive clients:
+a blocked thread per client for the threaded WSGI server and a suspended task per client for asyncio.
+"""
+import asyncio
+import threading
+import time
+import tracemalloc
+
+from benchmarks import QUERY_STRING, call_wsgi, format_time, measure
+from api import create_app
+from api.asgi import create_asgi_app
+
+IDLE_CLIENTS = 2000
+
+
+async def _call_asgi(asgi_app, requests: int):
+    scope = {'type': 'http', 'method': 'GET', 'path': '/', 'query_string': QUERY_STRING.encode()}
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        pass
+
+    for _ in range(requests):
+        await asgi_app(scope, receive, send)
+
+
+def _hold_idle_threads(clients: int):
+    release = threading.Event()
+    threads = [threading.Thread(target=release.wait) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    elapsed = time.perf_counter() - started
+    release.set()
+    for thread in threads:
+        thread.join()
+    return elapsed
+
+
+async def _hold_idle_tasks(clients: int):
+    release = asyncio.Event()
+    started = time.perf_counter()
+    tasks = [asyncio.ensure_future(release.wait()) for _ in range(clients)]
+    await asyncio.sleep(0)
+    elapsed = time.perf_counter() - started
+    release.set()
+    await asyncio.gather(*tasks)
+    return elapsed
+
+
+def _traced(func):
+    tracemalloc.start()
+    try:
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak
+
+
+def main():
+    flask_app = create_app('production').wsgi_app
+    asgi_app = create_asgi_app('production')
+    loop = asyncio.new_event_loop()
+
+    flask_time = measure(lambda: call_wsgi(flask_app), number=2000)
+    asgi_time = measure(lambda: loop.run_until_complete(_call_asgi(asgi_app, 100)), number=20) / 100
+    print('per request: flask {}, asgi {} ({:.1f}x)'.format(format_time(flask_time), format_time(asgi_time),
+                                                            flask_time / asgi_time))
+
+    threads_time, threads_memory = _traced(lambda: _hold_idle_threads(IDLE_CLIENTS))
+    tasks_time, tasks_memory = _traced(lambda: loop.run_until_complete(_hold_idle_tasks(IDLE_CLIENTS)))
+    print('{} idle clients: threads {} / {:.0f}KB python heap (plus a native stack per thread), '
+          'asyncio tasks {} / {:.0f}KB'.format(IDLE_CLIENTS, format_time(threads_time), threads_memory / 1024,
+                                               format_time(tasks_time), tasks_memory / 1024))
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
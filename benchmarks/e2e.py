@@ -0,0 +1,196 @@
+"""End-to-end load test: links are generated by the api and fetched from a local stand-in of nginx.
+
+The stand-in answers like the secure_link location of integration_test/nginx.conf (200 for valid links, 403 for
+bad and 410 for expired ones) and runs in its own process. The api is served in-process (--workers 0) or by
+`serve.py` with pre-forked workers. Client processes send generate-then-fetch round trips over keep-alive
+connections for the given time, then throughput, latency percentiles and the verification failure rate
+are reported. The exit status is 1 if failures exceed --max-failure-rate, so it also works as a check:
+
+    python -m benchmarks.e2e --workers 4 --clients 8 --duration 10
+"""
+import argparse
+import base64
+import http.client
+import json
+import multiprocessing
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from urllib.parse import quote
+
+from benchmarks import format_time
+from benchmarks.server import _get_free_port, _wait_for_server
+from api import create_wsgi_application
+from api.server import ReusePortWSGIServer
+from use_cases.request_objects import VerifySecureLinkRequestObject
+from use_cases.secure_link_md5 import compile_secure_link_md5
+from use_cases.verify_secure_link_use_cases import VerifySecureLinkUseCase
+
+NGINX_CONF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'integration_test',
+                          'nginx.conf')
+STAND_IN_RESPONSES = {
+    VerifySecureLinkUseCase.VALID: ('200 OK', b'OK!'),
+    VerifySecureLinkUseCase.EXPIRED: ('410 Gone', b''),
+    VerifySecureLinkUseCase.BAD: ('403 Forbidden', b''),
+}
+
+
+def parse_nginx_conf(text: str):
+    """Return the location prefix, the secure_link_md5 expression and the variables set in the config."""
+    location = re.search(r'\blocation\s+(\S+)\s*\{', text)
+    expression = re.search(r'\bsecure_link_md5\s+"([^"]*)"\s*;', text)
+    if location is None or expression is None:
+        raise ValueError('There is no location with secure_link_md5 in the config')
+    variables = dict(re.findall(r'\bset\s+\$(\w+)\s+"([^"]*)"\s*;', text))
+    return location.group(1), expression.group(1), variables
+
+
+def create_nginx_stand_in(conf_text: str):
+    """Return the WSGI application, which checks secure links like the location of the nginx config."""
+    location, expression, variables = parse_nginx_conf(conf_text)
+    use_case = VerifySecureLinkUseCase(build_string_for_md5=compile_secure_link_md5(expression, constants=variables))
+
+    def app(environ, start_response):
+        if not environ['PATH_INFO'].startswith(location):
+            status, body = '404 Not Found', b''
+        else:
+            url = environ.get('REQUEST_URI') or '{}?{}'.format(quote(environ['PATH_INFO']), environ['QUERY_STRING'])
+            request_object = VerifySecureLinkRequestObject(url=url, ip_address=environ['REMOTE_ADDR'],
+                                                           password=variables.get('p', ''))
+            response = use_case.execute(request_object)
+            status, body = STAND_IN_RESPONSES.get(response.value, ('500 Internal Server Error', b''))
+        start_response(status, [('Content-Type', 'text/plain'), ('Content-Length', str(len(body)))])
+        return [body]
+
+    return app
+
+
+def _serve_stand_in(conf_text: str, port: int):
+    ReusePortWSGIServer('127.0.0.1', port, create_nginx_stand_in(conf_text)).serve_forever()
+
+
+def _run_client(client: int, api_port: int, stand_in_port: int, duration: float, expires_in: int,
+                query_every: int):
+    api = http.client.HTTPConnection('127.0.0.1', api_port)
+    stand_in = http.client.HTTPConnection('127.0.0.1', stand_in_port)
+    latencies = {'generate': [], 'fetch': [], 'round_trip': []}
+    statuses = Counter()
+    api_errors = 0
+    deadline = time.monotonic() + duration
+    number = 0
+    while time.monotonic() < deadline:
+        number += 1
+        url = '/s/e2e/{}/{}.ts'.format(client, number)
+        if query_every and number % query_every == 0:
+            url += '?lang=en'
+        started = time.perf_counter()
+        api.request('GET', '/?t={}&u={}&ip=127.0.0.1&p=password'.format(
+            int(time.time()) + expires_in, quote(base64.b64encode(url.encode()).decode())))
+        response = api.getresponse()
+        body = response.read().decode('utf-8')
+        generated = time.perf_counter()
+        if response.status != 200:
+            api_errors += 1
+            continue
+        # the api escapes non-ascii links like json strings
+        stand_in.request('GET', quote(json.loads('"{}"'.format(body)), safe="/?&=:;,+$-_.!~*'()#%"))
+        response = stand_in.getresponse()
+        response.read()
+        fetched = time.perf_counter()
+        statuses[response.status] += 1
+        latencies['generate'].append(generated - started)
+        latencies['fetch'].append(fetched - generated)
+        latencies['round_trip'].append(fetched - started)
+    api.close()
+    stand_in.close()
+    return latencies, statuses, api_errors
+
+
+def _percentile(sorted_values: list, fraction: float):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def run_load_test(workers: int, clients: int, duration: float, expires_in: int=3600, query_every: int=0,
+                  nginx_conf: str=NGINX_CONF):
+    """Return latencies by stage, stand-in response statuses and count of failed api requests of all clients."""
+    with open(nginx_conf) as file:
+        conf_text = file.read()
+    stand_in_port = _get_free_port()
+    stand_in = multiprocessing.Process(target=_serve_stand_in, args=(conf_text, stand_in_port), daemon=True)
+    stand_in.start()
+    api_server = api_process = None
+    if workers:
+        api_port = _get_free_port()
+        api_process = subprocess.Popen([sys.executable, 'serve.py', '--host', '127.0.0.1', '--port', str(api_port),
+                                        '--workers', str(workers)], env=dict(os.environ, APP_SETTINGS='production'),
+                                       stderr=subprocess.DEVNULL)
+    else:
+        api_server = ReusePortWSGIServer('127.0.0.1', 0, create_wsgi_application('production'))
+        api_port = api_server.server_port
+        threading.Thread(target=api_server.serve_forever, daemon=True).start()
+    try:
+        _wait_for_server(api_port)
+        _wait_for_server(stand_in_port)
+        with multiprocessing.Pool(clients) as pool:
+            results = pool.starmap(_run_client, [(client, api_port, stand_in_port, duration, expires_in, query_every)
+                                                 for client in range(clients)])
+    finally:
+        if api_process is not None:
+            api_process.terminate()
+            api_process.wait()
+        if api_server is not None:
+            api_server.shutdown()
+            api_server.server_close()
+        stand_in.terminate()
+        stand_in.join()
+    latencies = {stage: sorted(value for client_latencies, _, _ in results for value in client_latencies[stage])
+                 for stage in ('generate', 'fetch', 'round_trip')}
+    statuses = sum((client_statuses for _, client_statuses, _ in results), Counter())
+    return latencies, statuses, sum(api_errors for _, _, api_errors in results)
+
+
+def main(argv=None):
+    cpu_count = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-w', '--workers', type=int, default=0,
+                        help='api worker processes of serve.py (0 serves the api in-process)')
+    parser.add_argument('-c', '--clients', type=int, default=2 * cpu_count, help='client processes count')
+    parser.add_argument('-d', '--duration', type=float, default=5, help='seconds of load')
+    parser.add_argument('-e', '--expires-in', type=int, default=3600, help='links expire in these seconds')
+    # the default profile signs $request_uri, so links to urls with a query fail a location checking $uri
+    parser.add_argument('-q', '--query-every', type=int, default=0,
+                        help='every N-th url has a query (none by default)')
+    parser.add_argument('--nginx-conf', default=NGINX_CONF, help='nginx config with the secure_link location')
+    parser.add_argument('--max-failure-rate', type=float, default=0.0,
+                        help='allowed share of links not accepted by the stand-in (0 by default)')
+    args = parser.parse_args(argv)
+
+    latencies, statuses, api_errors = run_load_test(args.workers, args.clients, args.duration,
+                                                    expires_in=args.expires_in, query_every=args.query_every,
+                                                    nginx_conf=args.nginx_conf)
+    round_trips = len(latencies['round_trip'])
+    print('{}, {} clients'.format('{} workers'.format(args.workers) if args.workers else 'in-process api',
+                                  args.clients))
+    print('round trips: {} ({:.0f}/s)'.format(round_trips, round_trips / args.duration))
+    for stage, values in latencies.items():
+        if values:
+            print('{:<10} p50 {:>9}  p99 {:>9}'.format(stage, format_time(_percentile(values, 0.5)),
+                                                       format_time(_percentile(values, 0.99))))
+    failures = round_trips - statuses[200]
+    failure_rate = failures / round_trips if round_trips else 1.0
+    print('verification failures: {} ({:.2%}) {}'.format(
+        failures, failure_rate, dict((status, count) for status, count in statuses.items() if status != 200)))
+    print('api errors: {}'.format(api_errors))
+    if failure_rate > args.max_failure_rate or api_errors:
+        print('\nE2E FAILURE: {:.2%} of links were not accepted, {} api errors'.format(failure_rate, api_errors),
+              file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,34 @@
+"""Compares per-link signing with fan-out signing of one url for many ip-addresses."""
+from benchmarks import format_time, measure
+from use_cases.generate_secure_link_use_cases import GenerateSecureLinkFanOutUseCase, GenerateSecureLinkUseCase
+from use_cases.request_objects import GenerateSecureLinkFanOutRequestObject, GenerateSecureLinkRequestObject
+
+IP_ADDRESSES = ['10.{}.{}.{}'.format(i >> 16 & 255, i >> 8 & 255, i & 255) for i in range(10000)]
+URL_LENGTHS = (16, 256, 2048)
+
+
+def _per_link(url: str):
+    use_case = GenerateSecureLinkUseCase()
+    for ip_address in IP_ADDRESSES:
+        use_case.execute(GenerateSecureLinkRequestObject(expires=2147483647, url=url, ip_address=ip_address,
+                                                         password='password'))
+
+
+def _fan_out(url: str):
+    GenerateSecureLinkFanOutUseCase().execute(GenerateSecureLinkFanOutRequestObject(
+        expires=2147483647, url=url, ip_addresses=IP_ADDRESSES, password='password'))
+
+
+def main():
+    print('{} ip-addresses per url'.format(len(IP_ADDRESSES)))
+    print('{:>10} {:>12} {:>12} {:>8}'.format('url length', 'per link', 'fan-out', 'speedup'))
+    for url_length in URL_LENGTHS:
+        url = '/s/' + 'a' * (url_length - 3)
+        per_link = measure(lambda: _per_link(url), number=1, repeat=3)
+        fan_out = measure(lambda: _fan_out(url), number=1, repeat=3)
+        print('{:>10} {:>12} {:>12} {:>7.1f}x'.format(url_length, format_time(per_link), format_time(fan_out),
+                                                      per_link / fan_out))
+
+
+if __name__ == '__main__':
+    main()
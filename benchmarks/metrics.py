@@ -0,0 +1,26 @@
+"""Overhead of the metrics instrumentation on the request path."""
+import tempfile
+
+from benchmarks import call_wsgi, format_time, measure
+from api import create_app
+from shared.metrics import REGISTRY, stage_seconds
+
+
+def main():
+    wsgi_app = create_app('testing').wsgi_app
+    modes = [('disabled', lambda: REGISTRY.configure(enabled=False)), ('in-process', lambda: REGISTRY.configure())]
+    with tempfile.TemporaryDirectory() as directory:
+        modes.append(('multiprocess', lambda: REGISTRY.configure(directory=directory)))
+        request_times = {}
+        for mode, configure in modes:
+            configure()
+            observe_time = measure(lambda: stage_seconds.observe('hash', 0.00001), number=100000)
+            request_times[mode] = measure(lambda: call_wsgi(wsgi_app), number=2000)
+            print('{:>12}: observe {:>8}, request {:>8} ({:+.1%})'.format(
+                mode, format_time(observe_time), format_time(request_times[mode]),
+                request_times[mode] / request_times['disabled'] - 1))
+    REGISTRY.configure(enabled=False)
+
+
+if __name__ == '__main__':
+    main()
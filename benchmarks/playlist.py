@@ -0,0 +1,37 @@
+"""Playlist signing: the playlist use case against a request object and the use case per segment,
+as if players requested "/" for every segment. Times are per segment.
+"""
+from collections import deque
+
+from benchmarks import format_time, measure
+from use_cases.generate_secure_link_use_cases import GenerateSecureLinkUseCase, GenerateSignedPlaylistUseCase
+from use_cases.request_objects import GenerateSecureLinkRequestObject, GenerateSignedPlaylistRequestObject
+
+SEGMENTS = 10000
+LINES = ['#EXTM3U\n', '#EXT-X-TARGETDURATION:4\n'] + [
+    line for number in range(SEGMENTS) for line in ('#EXTINF:4.0,\n', 'segment_{:05}.ts\n'.format(number))]
+PARAMS = {'expires': 2147483647, 'ip_address': '127.0.0.1', 'password': 'password'}
+
+
+def _sign_per_segment():
+    use_case = GenerateSecureLinkUseCase()
+    for line in LINES:
+        if not line.startswith('#'):
+            request_object = GenerateSecureLinkRequestObject(url='/s/video/' + line.strip(), **PARAMS)
+            yield use_case.execute(request_object).value
+
+
+def _sign_playlist():
+    request_object = GenerateSignedPlaylistRequestObject(url='/s/video/index.m3u8', lines=LINES, **PARAMS)
+    return GenerateSignedPlaylistUseCase().execute(request_object).value
+
+
+def main():
+    per_segment = measure(lambda: deque(_sign_per_segment(), maxlen=0), number=1) / SEGMENTS
+    playlist = measure(lambda: deque(_sign_playlist(), maxlen=0), number=1) / SEGMENTS
+    print('per segment: {}'.format(format_time(per_segment)))
+    print('playlist:    {} ({:.2f}x)'.format(format_time(playlist), per_segment / playlist))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""Pre-signing: requests of hot links signed by the use case, served from the cache and from pre-signed links,
+and the cost of a refresh, which signs the catalog for a new window. Times are per link.
+"""
+import time
+from collections import deque
+
+from api.presign import CatalogEntry, PresignScheduler
+from benchmarks import format_time, measure
+from shared.cache import ExpiringLRUCache
+from use_cases.generate_secure_link_use_cases import GenerateSecureLinkUseCase
+from use_cases.request_objects import GenerateSecureLinkRequestObject
+from use_cases.secure_link_md5 import compile_secure_link_profiles
+
+BUCKET_SECONDS = 300
+ENTRIES = 1000
+CATALOG = [CatalogEntry('/s/video/{}/index.m3u8'.format(number), 'password', '127.0.0.1', 'default', 3600)
+           for number in range(ENTRIES)]
+
+
+def _create_scheduler(clock=time.time):
+    return PresignScheduler(CATALOG, expires_bucket_seconds=BUCKET_SECONDS, profiles=compile_secure_link_profiles({}),
+                            cpu_share=1, clock=clock)
+
+
+def main():
+    scheduler = _create_scheduler()
+    scheduler.refresh()
+    # without the thread, which would refresh the table while it is measured
+    scheduler._starter.start_once = lambda: None
+    request_objects = [GenerateSecureLinkRequestObject(expires=int(time.time()) + 3600, url=entry.url,
+                                                       ip_address=entry.ip_address, password=entry.password,
+                                                       expires_bucket_seconds=BUCKET_SECONDS)
+                       for entry in CATALOG]
+    use_cases = {
+        'signed': GenerateSecureLinkUseCase(profiles=compile_secure_link_profiles({})),
+        'cached': GenerateSecureLinkUseCase(cache=ExpiringLRUCache(max_size=ENTRIES),
+                                            profiles=compile_secure_link_profiles({})),
+        'pre-signed': GenerateSecureLinkUseCase(profiles=compile_secure_link_profiles({}), presigned=scheduler),
+    }
+    baseline = None
+    for name, use_case in use_cases.items():
+        seconds = measure(lambda: deque(map(use_case.execute, request_objects), maxlen=0), number=10) / ENTRIES
+        baseline = baseline or seconds
+        print('{:<12} {:>10} ({:.2f}x)'.format(name, format_time(seconds), baseline / seconds))
+
+    now = [time.time()]
+
+    def refresh_next_window():
+        now[0] += BUCKET_SECONDS
+        scheduler.refresh()
+
+    scheduler = _create_scheduler(clock=lambda: now[0])
+    scheduler.refresh()
+    print('refresh of a new window: {} per link'.format(
+        format_time(measure(refresh_next_window, number=10) / ENTRIES)))
+
+
+if __name__ == '__main__':
+    main()
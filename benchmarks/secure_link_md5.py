@@ -0,0 +1,43 @@
+"""Hashing with compiled secure_link_md5 expressions against the hardcoded default expression
+and against interpreting the expression on every request.
+"""
+import hashlib
+
+from benchmarks import format_time, measure
+from use_cases.generate_secure_link_use_cases import GenerateSecureLinkUseCase
+from use_cases.request_objects import GenerateSecureLinkRequestObject
+from use_cases.secure_link_md5 import (DEFAULT_EXPRESSION, VARIABLE_PATTERN, compile_secure_link_md5,
+                                       compile_secure_link_profiles)
+
+PARAMS = {'expires': 2147483647, 'url': '/s/link', 'ip_address': '127.0.0.1', 'password': 'password'}
+
+
+def _interpret_secure_link_md5(expression: str, expires: int, url: str, ip_address: str, password: str):
+    values = {'secure_link_expires': str(expires), 'request_uri': url, 'remote_addr': ip_address, 'p': password}
+    return VARIABLE_PATTERN.sub(lambda match: values[match.group(1) or match.group(2)], expression)
+
+
+def _hash(string_for_md5: str):
+    return GenerateSecureLinkUseCase._encode_hash(hashlib.md5(string_for_md5.encode('utf-8')).digest())
+
+
+def main():
+    build_string_for_md5 = compile_secure_link_md5(DEFAULT_EXPRESSION)
+    print('hash')
+    print('  {:>11}: {}'.format('hardcoded', format_time(measure(
+        lambda: GenerateSecureLinkUseCase._generate_hash_for_secure_link(**PARAMS)))))
+    print('  {:>11}: {}'.format('compiled', format_time(measure(lambda: _hash(build_string_for_md5(**PARAMS))))))
+    print('  {:>11}: {}'.format('interpreted', format_time(measure(
+        lambda: _hash(_interpret_secure_link_md5(DEFAULT_EXPRESSION, **PARAMS))))))
+
+    request_object = GenerateSecureLinkRequestObject(**PARAMS)
+    print('use case')
+    print('  {:>11}: {}'.format('hardcoded', format_time(measure(
+        lambda: GenerateSecureLinkUseCase().execute(request_object)))))
+    profiles = compile_secure_link_profiles({})
+    print('  {:>11}: {}'.format('compiled', format_time(measure(
+        lambda: GenerateSecureLinkUseCase(profiles=profiles).execute(request_object)))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Load test of the pre-forking server: throughput for a growing count of workers.
+
+Every workers count is served by a separate `serve.py` process. Client processes send requests over keep-alive
+connections for the given time, so throughput should grow with workers until the cpu cores are exhausted
+(clients share the cores with the server when both run on one host).
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from benchmarks import QUERY_STRING
+
+
+def _get_free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def _wait_for_server(port: int, timeout: float=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port)).close()
+            return
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def _send_requests(port: int, duration: float):
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    requests = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        connection.request('GET', '/?' + QUERY_STRING)
+        connection.getresponse().read()
+        requests += 1
+    connection.close()
+    return requests
+
+
+def measure_throughput(workers: int, clients: int, duration: float):
+    """Return requests per second served by workers for clients sending requests for duration seconds."""
+    port = _get_free_port()
+    server = subprocess.Popen([sys.executable, 'serve.py', '--host', '127.0.0.1', '--port', str(port),
+                               '--workers', str(workers)], env=dict(os.environ, APP_SETTINGS='production'),
+                              stderr=subprocess.DEVNULL)
+    try:
+        _wait_for_server(port)
+        with multiprocessing.Pool(clients) as pool:
+            requests = sum(pool.starmap(_send_requests, [(port, duration)] * clients))
+    finally:
+        server.terminate()
+        server.wait()
+    return requests / duration
+
+
+def main(argv=None):
+    cpu_count = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-w', '--workers', type=int, nargs='+',
+                        default=sorted({2 ** power for power in range(cpu_count.bit_length())} | {cpu_count}),
+                        help='workers counts (powers of two up to cpu count by default)')
+    parser.add_argument('-c', '--clients', type=int, default=2 * cpu_count, help='client processes count')
+    parser.add_argument('-d', '--duration', type=float, default=5, help='seconds of load for every workers count')
+    args = parser.parse_args(argv)
+
+    print('{} cpu cores, {} clients'.format(cpu_count, args.clients))
+    baseline = None
+    for workers in args.workers:
+        throughput = measure_throughput(workers, args.clients, args.duration)
+        baseline = baseline or throughput
+        print('{:>3} workers: {:>8.0f} requests/s ({:.2f}x)'.format(workers, throughput, throughput / baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+"""In-process signing: a request object and the use case per link against a Signer constructed once,
+with validation and with trusted inputs. Times are per link.
+"""
+from collections import deque
+
+from benchmarks import format_time, measure
+from use_cases.generate_secure_link_use_cases import GenerateSecureLinkUseCase
+from use_cases.request_objects import GenerateSecureLinkRequestObject
+from use_cases.signer import Signer
+
+ITEMS = [(2147483647, '/s/video/{}/segment.ts'.format(number), '10.0.{}.{}'.format(number // 256, number % 256))
+         for number in range(1000)]
+
+
+def _sign_per_call(items):
+    for expires, url, ip_address in items:
+        request_object = GenerateSecureLinkRequestObject(expires=expires, url=url, ip_address=ip_address,
+                                                         password='password')
+        yield GenerateSecureLinkUseCase().execute(request_object).value
+
+
+def main():
+    signers = {
+        'per-call use case': _sign_per_call,
+        'Signer': Signer('password').sign_many,
+        'Signer, trusted inputs': Signer('password', validate=False).sign_many,
+    }
+    baseline = None
+    for name, sign_many in signers.items():
+        seconds = measure(lambda: deque(sign_many(ITEMS), maxlen=0), number=10) / len(ITEMS)
+        baseline = baseline or seconds
+        print('{:<24} {:>10} ({:.2f}x)'.format(name, format_time(seconds), baseline / seconds))
+
+
+if __name__ == '__main__':
+    main()
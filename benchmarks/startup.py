@@ -0,0 +1,130 @@
+"""Cold start time: from process launch to the first served request.
+
+Every application is started in a new interpreter, which serves one request in-process and reports it,
+the server is started with one worker and polled until it answers. Results can be saved and compared
+with a baseline like the stage benchmarks:
+
+    python -m benchmarks.startup -o startup.json
+    python -m benchmarks.startup -b startup.json
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks import QUERY_STRING, format_time
+from benchmarks.__main__ import compare_with_baseline
+
+_CALL_WSGI = '''
+import io
+environ = {{'REQUEST_METHOD': 'GET', 'PATH_INFO': '/', 'QUERY_STRING': {query_string!r}, 'SERVER_NAME': 'localhost',
+           'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.url_scheme': 'http',
+           'wsgi.input': io.BytesIO(), 'wsgi.errors': io.StringIO()}}
+body = b''.join(application(environ, lambda status, headers, exc_info=None: None))
+'''.format(query_string=QUERY_STRING)
+
+APPLICATIONS = {
+    'interpreter': 'body = b"/s/link"',
+    'flask': 'from api import create_app\napplication = create_app("production")' + _CALL_WSGI,
+    'lean_wsgi': 'from api.wsgi import create_lean_wsgi_app\napplication = create_lean_wsgi_app("production")' +
+                 _CALL_WSGI,
+    'asgi': '''
+import asyncio
+from api.asgi import create_asgi_app
+application = create_asgi_app('production')
+messages = []
+
+async def receive():
+    return {{'type': 'http.request', 'body': b'', 'more_body': False}}
+
+async def send(message):
+    messages.append(message)
+
+asyncio.get_event_loop().run_until_complete(application(
+    {{'type': 'http', 'method': 'GET', 'path': '/', 'query_string': {query_string!r}}}, receive, send))
+body = messages[-1]['body']
+'''.format(query_string=QUERY_STRING.encode()),
+}
+
+
+def _time_application(code: str):
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-c', code + '\nprint(body.decode(), flush=True)'],
+                               stdout=subprocess.PIPE, env=dict(os.environ, APP_SETTINGS='production'))
+    line = process.stdout.readline()
+    elapsed = time.perf_counter() - started
+    process.wait()
+    if not line.startswith(b'/s/link'):
+        raise RuntimeError('Unexpected response {!r}'.format(line))
+    return elapsed
+
+
+def _time_server():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, 'serve.py', '--host', '127.0.0.1', '--port', str(port),
+                                '--workers', '1'], env=dict(os.environ, APP_SETTINGS='production'),
+                               stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', port)
+                connection.request('GET', '/?' + QUERY_STRING)
+                if connection.getresponse().status == 200:
+                    return time.perf_counter() - started
+            except ConnectionError:
+                time.sleep(0.001)
+            finally:
+                connection.close()
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def run_benchmarks(repeat: int=5):
+    """Return the median time to the first response of every application."""
+    timers = {name: (lambda code=code: _time_application(code)) for name, code in APPLICATIONS.items()}
+    timers['server'] = _time_server
+    return {name: statistics.median(timer() for _ in range(repeat)) for name, timer in timers.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time from process launch to the first served request.')
+    parser.add_argument('-o', '--output', help='save results to the json file')
+    parser.add_argument('-b', '--baseline', help='compare results with the json file saved before')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.25,
+                        help='allowed slowdown against the baseline (0.25 by default)')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='launches of every application')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(repeat=args.repeat)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)['results']
+    for name, seconds in results.items():
+        line = '{:<12} {:>10}'.format(name, format_time(seconds))
+        if name in baseline:
+            line += ' {:>+7.1%}'.format(seconds / baseline[name] - 1)
+        print(line)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'python': platform.python_version(), 'results': results}, file, indent=2, sort_keys=True)
+    regressions = compare_with_baseline(results, baseline, args.tolerance)
+    if regressions:
+        print('\nSTARTUP REGRESSION: {} slower than the baseline by more than {:.0%}'.format(
+            ', '.join(regressions), args.tolerance), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
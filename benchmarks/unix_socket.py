@@ -0,0 +1,71 @@
+"""Throughput of the binary protocol on the Unix socket against the HTTP route of the same server.
+
+One `serve.py` process serves both listeners. Client processes send requests for the given time: over HTTP
+keep-alive connections, over the Unix socket one request at a time and pipelined in batches of --pipeline requests.
+"""
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.server import _get_free_port, _send_requests, _wait_for_server
+from api.unix_socket import UnixSocketSigningClient
+
+REQUEST = (2147483647, '/s/link', '127.0.0.1', 'password')
+
+
+def _send_unix_socket_requests(path: str, duration: float, pipeline: int):
+    requests = 0
+    with UnixSocketSigningClient(path) as client:
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            client.sign_many([REQUEST] * pipeline)
+            requests += pipeline
+    return requests
+
+
+def measure_throughput(workers: int, clients: int, duration: float, pipeline: int):
+    """Return requests per second of every way to sign for clients sending requests for duration seconds."""
+    port = _get_free_port()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'sign.sock')
+        server = subprocess.Popen([sys.executable, 'serve.py', '--host', '127.0.0.1', '--port', str(port),
+                                   '--workers', str(workers), '--unix-socket', path],
+                                  env=dict(os.environ, APP_SETTINGS='production'), stderr=subprocess.DEVNULL)
+        try:
+            _wait_for_server(port)
+            loads = {
+                'http': (_send_requests, (port, duration)),
+                'unix_socket': (_send_unix_socket_requests, (path, duration, 1)),
+                'unix_socket_pipelined': (_send_unix_socket_requests, (path, duration, pipeline)),
+            }
+            results = {}
+            with multiprocessing.Pool(clients) as pool:
+                for name, (func, args) in loads.items():
+                    results[name] = sum(pool.starmap(func, [args] * clients)) / duration
+        finally:
+            server.terminate()
+            server.wait()
+    return results
+
+
+def main(argv=None):
+    cpu_count = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-w', '--workers', type=int, default=cpu_count, help='workers count (cpu count by default)')
+    parser.add_argument('-c', '--clients', type=int, default=2 * cpu_count, help='client processes count')
+    parser.add_argument('-d', '--duration', type=float, default=5, help='seconds of load for every way to sign')
+    parser.add_argument('-p', '--pipeline', type=int, default=64, help='requests sent at once on pipelined load')
+    args = parser.parse_args(argv)
+
+    print('{} workers, {} clients'.format(args.workers, args.clients))
+    results = measure_throughput(args.workers, args.clients, args.duration, args.pipeline)
+    for name, throughput in results.items():
+        print('{:<22} {:>8.0f} requests/s ({:.2f}x)'.format(name, throughput, throughput / results['http']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Secure url building: the direct query appending and base64url translation against the generic
+urlparse/urlencode rebuilding and the former str.replace encoding, which give byte-identical output.
+"""
+import base64
+import hashlib
+
+from benchmarks import format_time, measure
+from shared.response_object import ResponseSuccess
+from use_cases.generate_secure_link_use_cases import GenerateSecureLinkUseCase
+from use_cases.request_objects import GenerateSecureLinkRequestObject
+
+URLS = {
+    'path': '/s/link',
+    'long path': '/s/video/2018/01/28/stream_1080p/' + 'a/' * 1000 + 'segment_00042.ts',
+    'query': '/s/link?lang=en&tag=python',
+}
+
+
+def _former_encode_hash(digest: bytes):
+    return base64.b64encode(digest).decode().replace('+', '-').replace('/', '_').replace('=', '')
+
+
+def _generate_secure_url_generically(request_object):
+    md5 = GenerateSecureLinkUseCase._generate_hash_for_secure_link(expires=request_object.expires,
+                                                                   url=request_object.url,
+                                                                   ip_address=request_object.ip_address,
+                                                                   password=request_object.password)
+    return GenerateSecureLinkUseCase._add_query_to_url(url=request_object.url,
+                                                       query_dict={'md5': md5, 'expires': request_object.expires})
+
+
+def main():
+    use_case = GenerateSecureLinkUseCase()
+    digest = hashlib.md5(b'2147483647/s/link127.0.0.1=password').digest()
+    print('hash encoding: {} (former {})'.format(format_time(measure(lambda: use_case._encode_hash(digest))),
+                                                 format_time(measure(lambda: _former_encode_hash(digest)))))
+
+    print('secure url')
+    for name, url in URLS.items():
+        request_object = GenerateSecureLinkRequestObject(expires=2147483647, url=url, ip_address='127.0.0.1',
+                                                         password='password')
+        print('  {:>9}: {} (generic query rebuilding {})'.format(
+            name, format_time(measure(lambda: use_case._generate_secure_url(request_object))),
+            format_time(measure(lambda: _generate_secure_url_generically(request_object)))))
+
+    print('response object: {}'.format(format_time(measure(lambda: ResponseSuccess('/s/link')))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Validation throughput and worst-case (ReDoS) time of the linear-time validators.
+
+Adversarial urls are also matched with the former backtracking regular expression, its time doubles
+with every few characters, so it is measured only on short inputs.
+"""
+import re
+import time
+
+from benchmarks import format_time, measure
+from use_cases.request_objects import GenerateSecureLinkRequestObject
+from use_cases.validators import is_correct_ip_address, is_correct_url
+
+FORMER_URL_PATTERN = re.compile("^((?:http|ftp)s?://)?[\\w.-]?(?:.[\\w.-]+)+[\\w\\-._:/?#[\\]@!$&'()*+,;=]+$")
+FORMER_ADVERSARIAL_LENGTHS = (8, 10, 12, 14, 16)
+ADVERSARIAL_LENGTHS = (16, 256, 4096, 65536)
+TYPICAL_URLS = {
+    'path': '/s/link',
+    'url': 'https://cdn.example.com/s/video/2018/01/28/stream_1080p/segment_00042.ts?lang=en&tag=python',
+    'long url': 'https://cdn.example.com/s/' + 'a/' * 1000,
+}
+
+
+def _adversarial_url(length: int):
+    return 'a.' * (length // 2) + '"'
+
+
+def _time_once(func):
+    started = time.perf_counter()
+    func()
+    return time.perf_counter() - started
+
+
+def main():
+    print('throughput')
+    for name, url in TYPICAL_URLS.items():
+        print('  {:>10}: {} (regex {})'.format(name, format_time(measure(lambda: is_correct_url(url, max_length=None))),
+                                               format_time(measure(lambda: FORMER_URL_PATTERN.match(url)))))
+    print('  {:>10}: {}'.format('ip-address', format_time(measure(lambda: is_correct_ip_address('192.168.100.254')))))
+    print('  {:>10}: {}'.format('request', format_time(measure(lambda: GenerateSecureLinkRequestObject(
+        expires=2147483647, url=TYPICAL_URLS['url'], ip_address='192.168.100.254', password='password')))))
+
+    print('worst case (adversarial url)')
+    for length in FORMER_ADVERSARIAL_LENGTHS:
+        url = _adversarial_url(length)
+        print('  {:>6} chars: regex {:>10}, linear {:>10}'.format(
+            length, format_time(_time_once(lambda: FORMER_URL_PATTERN.match(url))),
+            format_time(_time_once(lambda: is_correct_url(url)))))
+    for length in ADVERSARIAL_LENGTHS:
+        url = _adversarial_url(length)
+        print('  {:>6} chars: linear {:>10}, rejected by max length {:>10}'.format(
+            length, format_time(_time_once(lambda: is_correct_url(url, max_length=None))),
+            format_time(_time_once(lambda: is_correct_url(url, GenerateSecureLinkRequestObject.URL_MAX_LENGTH)))))
+
+
+if __name__ == '__main__':
+    main()
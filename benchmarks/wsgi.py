@@ -0,0 +1,27 @@
+"""Compares per-request overhead of the Flask application with the lean WSGI application.
+
+Both applications are called in-process with the same environ, so only the framework cost differs.
+"""
+from benchmarks import call_wsgi, format_time, measure
+from api import create_app
+from api.wsgi import create_lean_wsgi_app
+
+QUERY_STRINGS = {
+    'correct': 't=2147483647&u=L3MvbGluaw==&ip=127.0.0.1&p=password',
+    'incorrect': 't=qwerty&u=L3MvbGluaw==&ip=1270.0.1',
+}
+
+
+def main():
+    flask_app = create_app('testing').wsgi_app
+    lean_app = create_lean_wsgi_app('testing')
+    print('{:>10} {:>10} {:>10} {:>8}'.format('request', 'flask', 'lean', 'speedup'))
+    for name, query_string in QUERY_STRINGS.items():
+        flask_time = measure(lambda: call_wsgi(flask_app, query_string), number=2000)
+        lean_time = measure(lambda: call_wsgi(lean_app, query_string), number=2000)
+        print('{:>10} {:>10} {:>10} {:>7.1f}x'.format(name, format_time(flask_time), format_time(lean_time),
+                                                      flask_time / lean_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""Offline signer, which generates secure links for csv or ndjson files without running the web-application."""
+import argparse
+import csv
+import io
+import json
+import mmap
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from shared.response_object import ResponseFailure
+from use_cases.generate_secure_link_use_cases import GenerateSecureLinkUseCase
+from use_cases.request_objects import GenerateSecureLinkRequestObject
+
+FIELDS = ('expires', 'url', 'ip_address', 'password')
+FORMATS = ('csv', 'ndjson')
+
+
+def _iter_lines(path: str):
+    with open(path, 'rb') as file:
+        if not os.fstat(file.fileno()).st_size:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+            yield from iter(mapped_file.readline, b'')
+
+
+def _iter_chunks(iterable, chunk_size: int):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _ordered_map(executor, func, iterable, window: int):
+    """Like executor.map, but keeps at most window tasks in flight instead of consuming the whole iterable."""
+    futures = deque()
+    for item in iterable:
+        if len(futures) >= window:
+            yield futures.popleft().result()
+        futures.append(executor.submit(func, item))
+    while futures:
+        yield futures.popleft().result()
+
+
+def _map_in_processes(func, iterable, workers: int=None):
+    """Lazily map func over iterable across a process pool keeping order (in the current process if workers is 0)."""
+    if workers == 0:
+        yield from map(func, iterable)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from _ordered_map(executor, func, iterable, window=2 * (workers or os.cpu_count() or 1))
+
+
+def _parse_row(line: str, input_format: str):
+    if input_format == 'csv':
+        row = next(csv.reader([line]), [])
+        return dict(zip(FIELDS, row)) if len(row) == len(FIELDS) else None
+    row = json.loads(line)
+    return row if isinstance(row, dict) else None
+
+
+def _create_request_object_from_row(row: dict):
+    expires = row.get('expires')
+    if isinstance(expires, str):
+        try:
+            expires = int(expires)
+        except ValueError:
+            pass
+    return GenerateSecureLinkRequestObject(expires=expires, url=row.get('url'), ip_address=row.get('ip_address'),
+                                           password=row.get('password'))
+
+
+def _sign_line(line: bytes, input_format: str, use_case: GenerateSecureLinkUseCase):
+    try:
+        row = _parse_row(line.decode('utf-8'), input_format)
+    except ValueError:
+        row = None
+    if row is None:
+        return ResponseFailure.build_parameters_error('row: Is not correct {} row'.format(input_format))
+    return use_case.execute(_create_request_object_from_row(row))
+
+
+def _sign_chunk(args):
+    lines, input_format = args
+    use_case = GenerateSecureLinkUseCase()
+    responses = [_sign_line(line, input_format, use_case) for line in lines if line.strip()]
+    if input_format == 'csv':
+        output = io.StringIO()
+        csv.writer(output, lineterminator='\n').writerows(
+            [response.value, ''] if response else ['', response.message] for response in responses)
+        return len(responses), output.getvalue()
+    return len(responses), ''.join(json.dumps(response.value) + '\n' for response in responses)
+
+
+def sign_file(input_path: str, output, input_format: str, workers: int=None, chunk_size: int=10000,
+              skip_header: bool=False, report=None):
+    """Sign every row of the input file and write results to output in input order.
+
+    Rows are signed in chunks across a process pool (in-process if workers is 0).
+    Returns count of signed rows and elapsed seconds.
+    """
+    started = time.perf_counter()
+    lines = _iter_lines(input_path)
+    if skip_header:
+        next(lines, None)
+    chunks = ((chunk, input_format) for chunk in _iter_chunks(lines, chunk_size))
+    rows = 0
+    for count, result in _map_in_processes(_sign_chunk, chunks, workers):
+        output.write(result)
+        rows += count
+        if report:
+            report(rows, time.perf_counter() - started)
+    return rows, time.perf_counter() - started
+
+
+def _report_progress(rows: int, elapsed: float):
+    sys.stderr.write('\r{} rows, {:.0f} rows/s'.format(rows, rows / elapsed if elapsed else 0))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate nginx secure links for csv or ndjson file rows '
+                                                 '(expires, url, ip_address, password).')
+    parser.add_argument('input', help='csv or ndjson file')
+    parser.add_argument('-o', '--output', help='output file (stdout by default)')
+    parser.add_argument('-f', '--format', choices=FORMATS,
+                        help='input and output format (guessed by input file extension by default)')
+    parser.add_argument('-w', '--workers', type=int, help='worker processes count (cpu count by default, '
+                                                          '0 to sign in the current process)')
+    parser.add_argument('-c', '--chunk-size', type=int, default=10000, help='rows per worker task')
+    parser.add_argument('--header', action='store_true', help='skip the first input line')
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not report progress')
+    args = parser.parse_args(argv)
+
+    input_format = args.format or ('csv' if args.input.lower().endswith('.csv') else 'ndjson')
+    output = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        rows, elapsed = sign_file(args.input, output, input_format, workers=args.workers,
+                                  chunk_size=args.chunk_size, skip_header=args.header,
+                                  report=None if args.quiet else _report_progress)
+    finally:
+        if args.output:
+            output.close()
+    if not args.quiet:
+        sys.stderr.write('\r{} rows signed in {:.2f}s, {:.0f} rows/s\n'.format(
+            rows, elapsed, rows / elapsed if elapsed else 0))
+    return 0
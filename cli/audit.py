@@ -0,0 +1,97 @@
+"""Offline auditor, which re-verifies secure links from nginx access logs."""
+import argparse
+import json
+import re
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+from functools import lru_cache, partial
+
+from cli import _iter_chunks, _iter_lines, _map_in_processes
+from use_cases.request_objects import VerifySecureLinkRequestObject
+from use_cases.verify_secure_link_use_cases import VerifySecureLinkUseCase
+
+SKIPPED = 'SKIPPED'
+UNPARSED = 'UNPARSED'
+# Beginning of the nginx "combined" log format: $remote_addr - $remote_user [$time_local] "$request" ...
+log_line_pattern = re.compile(r'(\S+) \S+ \S+ \[([^\]]*)\] "[A-Z]+ (\S+)')
+
+
+@lru_cache(maxsize=4096)
+def _parse_log_time(time_local: str):
+    try:
+        return int(datetime.strptime(time_local, '%d/%b/%Y:%H:%M:%S %z').timestamp())
+    except ValueError:
+        return None
+
+
+def _audit_line(line: bytes, location: str, password: str, now: int, use_case: VerifySecureLinkUseCase):
+    match = log_line_pattern.match(line.decode('utf-8', 'replace'))
+    if not match:
+        return UNPARSED, None
+    ip_address, time_local, url = match.groups()
+    if not url.startswith(location):
+        return SKIPPED, ip_address
+    request_object = VerifySecureLinkRequestObject(url=url, ip_address=ip_address, password=password,
+                                                   now=now if now is not None else _parse_log_time(time_local))
+    response = use_case.execute(request_object)
+    return (response.value if response else UNPARSED), ip_address
+
+
+def _audit_chunk(lines, location: str, password: str, now: int=None):
+    use_case = VerifySecureLinkUseCase()
+    statuses = Counter()
+    bad_ip_addresses = Counter()
+    for line in lines:
+        if not line.strip():
+            continue
+        status, ip_address = _audit_line(line, location, password, now, use_case)
+        statuses[status] += 1
+        if status == VerifySecureLinkUseCase.BAD:
+            bad_ip_addresses[ip_address] += 1
+    return statuses, bad_ip_addresses
+
+
+def audit_log(input_path: str, location: str, password: str, now: int=None, workers: int=None,
+              chunk_size: int=50000):
+    """Verify every secure link request of the log in the location.
+
+    Links are checked against the request time from the log, or against now if it is given.
+    Returns counts of lines by status and counts of bad links by client ip-address.
+    """
+    audit_chunk = partial(_audit_chunk, location=location, password=password, now=now)
+    chunks = _iter_chunks(_iter_lines(input_path), chunk_size)
+    statuses = Counter()
+    bad_ip_addresses = Counter()
+    for chunk_statuses, chunk_bad_ip_addresses in _map_in_processes(audit_chunk, chunks, workers):
+        statuses.update(chunk_statuses)
+        bad_ip_addresses.update(chunk_bad_ip_addresses)
+    return statuses, bad_ip_addresses
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Verify nginx secure links from an access log '
+                                                 '(combined format) and print summary counts.')
+    parser.add_argument('input', help='nginx access log')
+    parser.add_argument('-p', '--password', required=True, help='secure link password')
+    parser.add_argument('-l', '--location', default='/s/', help='secure location prefix (/s/ by default)')
+    parser.add_argument('--now', action='store_true',
+                        help='check expiration against current time instead of request time')
+    parser.add_argument('-w', '--workers', type=int, help='worker processes count (cpu count by default, '
+                                                          '0 to audit in the current process)')
+    parser.add_argument('-c', '--chunk-size', type=int, default=50000, help='lines per worker task')
+    parser.add_argument('-t', '--top', type=int, default=10, help='count of reported ip-addresses with bad links')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    statuses, bad_ip_addresses = audit_log(args.input, location=args.location, password=args.password,
+                                           now=int(time.time()) if args.now else None, workers=args.workers,
+                                           chunk_size=args.chunk_size)
+    elapsed = time.perf_counter() - started
+    lines = sum(statuses.values())
+    json.dump({'statuses': dict(statuses), 'top_bad_ip_addresses': dict(bad_ip_addresses.most_common(args.top)),
+               'lines': lines, 'lines_per_second': int(lines / elapsed) if elapsed else None},
+              sys.stdout, indent=2)
+    sys.stdout.write('\n')
+    return 0
@@ -0,0 +1,76 @@
+import io
+import json
+import os
+import tempfile
+from unittest import TestCase, main
+
+from cli import sign_file
+from cli.audit import audit_log
+
+
+class SignFileTestCase(TestCase):
+    def setUp(self):
+        self.correct_secure_link = '/s/link?md5=FbRZ_kL2P7SJMI6hCxS11Q&expires=2147483647'
+        self.correct_row = {'expires': 2147483647, 'url': '/s/link', 'ip_address': '127.0.0.1', 'password': 'password'}
+
+    def _sign(self, content: str, input_format: str, **kwargs):
+        with tempfile.NamedTemporaryFile('w', suffix='.' + input_format, delete=False) as file:
+            file.write(content)
+        self.addCleanup(os.remove, file.name)
+        output = io.StringIO()
+        rows, _ = sign_file(file.name, output, input_format, **kwargs)
+        return rows, output.getvalue()
+
+    def test_csv_rows(self):
+        content = 'expires,url,ip_address,password\n2147483647,/s/link,127.0.0.1,password\n\nqwerty\n'
+        rows, output = self._sign(content, 'csv', workers=0, skip_header=True)
+
+        self.assertEqual(rows, 2)
+        self.assertEqual(output, '{},\n,row: Is not correct csv row\n'.format(self.correct_secure_link))
+
+    def test_ndjson_rows_keep_order_across_workers(self):
+        content = '\n'.join([json.dumps(self.correct_row), '[]'] * 5)
+        rows, output = self._sign(content, 'ndjson', workers=2, chunk_size=3)
+
+        self.assertEqual(rows, 10)
+        values = [json.loads(line) for line in output.splitlines()]
+        self.assertEqual(values[::2], [self.correct_secure_link] * 5)
+        self.assertEqual([value['type'] for value in values[1::2]], ['PARAMETERS_ERROR'] * 5)
+
+    def test_empty_file(self):
+        rows, output = self._sign('', 'csv', workers=0)
+
+        self.assertEqual(rows, 0)
+        self.assertEqual(output, '')
+
+
+class AuditLogTestCase(TestCase):
+    def setUp(self):
+        request = '"GET /s/link?md5=w46r1uWC-nczDV_3EqBGow&expires=1516741096 HTTP/1.1" 200 3 "-" "curl"'
+        lines = [
+            '127.0.0.1 - - [23/Jan/2018:20:58:15 +0000] ' + request,
+            '127.0.0.2 - - [23/Jan/2018:20:58:15 +0000] ' + request,
+            '127.0.0.1 - - [23/Jan/2018:20:58:17 +0000] ' + request,
+            '127.0.0.1 - - [23/Jan/2018:20:58:15 +0000] "GET /other HTTP/1.1" 200 3 "-" "curl"',
+            'qwerty',
+        ]
+        with tempfile.NamedTemporaryFile('w', suffix='.log', delete=False) as file:
+            file.write('\n'.join(lines))
+        self.addCleanup(os.remove, file.name)
+        self.log_path = file.name
+
+    def test_links_are_checked_at_request_time(self):
+        statuses, bad_ip_addresses = audit_log(self.log_path, location='/s/', password='password', workers=0)
+
+        self.assertEqual(statuses, {'VALID': 1, 'BAD': 1, 'EXPIRED': 1, 'SKIPPED': 1, 'UNPARSED': 1})
+        self.assertEqual(bad_ip_addresses, {'127.0.0.2': 1})
+
+    def test_links_are_checked_at_now_across_workers(self):
+        statuses, _ = audit_log(self.log_path, location='/s/', password='password', now=2147483647, workers=2,
+                                chunk_size=2)
+
+        self.assertEqual(statuses, {'BAD': 1, 'EXPIRED': 2, 'SKIPPED': 1, 'UNPARSED': 1})
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,77 @@ class Config(object):
     """Parent configuration class."""
     DEBUG = False
     SECRET = os.getenv('SECRET')
+    # WSGI application served by wsgi.py: 'flask' or 'lean' (framework-free, serves "/" only)
+    WSGI_APP = 'flask'
+    # Pre-forking server of serve.py: address, workers count (0 is one per cpu), seconds given to workers
+    # to finish requests on restart or shutdown and seconds idle keep-alive connections are kept open
+    SERVER_HOST = '0.0.0.0'
+    SERVER_PORT = 80
+    SERVER_WORKERS = 0
+    SERVER_GRACEFUL_TIMEOUT = 30
+    SERVER_KEEP_ALIVE_TIMEOUT = 5
+    # Unix socket path of the binary signing protocol, which serve.py workers serve next to HTTP (None disables it)
+    UNIX_SOCKET_PATH = None
+    URL_MAX_LENGTH = 4096
+    BATCH_MAX_SIZE = 1000
+    STREAM_CHUNK_SIZE = 64
+    # nginx secure_link_md5 expressions of location profiles, requests choose one with the profile parameter.
+    # The 'default' profile is '$secure_link_expires$request_uri$remote_addr=$p' unless it is overridden
+    SECURE_LINK_PROFILES = {}
+    # Expiration times are rounded up to buckets of this length (0 disables it),
+    # then "/" responses of the Flask application are sent with Cache-Control and ETag headers
+    EXPIRES_BUCKET_SECONDS = 0
+    # "/" requests with redirect=1 get a redirect to the signed link instead of the link in the body,
+    # the link is appended to this base url (e.g. "https://cdn.example.com", empty keeps the Location relative)
+    REDIRECT_BASE_URL = ''
+    # Pre-signing of hot links in the Flask application (needs EXPIRES_BUCKET_SECONDS): ndjson catalog of up to
+    # PRESIGN_MAX_ENTRIES entries with url, password and optional ip_address, profile and expires_in (seconds from
+    # request to expiration time, PRESIGN_EXPIRES_IN by default) at PRESIGN_CATALOG_PATH (None disables it).
+    # Every PRESIGN_INTERVAL seconds a background thread of every worker signs links of the buckets requested within
+    # the next PRESIGN_AHEAD_SECONDS, which are not signed yet, using at most PRESIGN_CPU_SHARE of a cpu
+    PRESIGN_CATALOG_PATH = None
+    PRESIGN_MAX_ENTRIES = 10000
+    PRESIGN_EXPIRES_IN = 3600
+    PRESIGN_AHEAD_SECONDS = 600
+    PRESIGN_INTERVAL = 10
+    PRESIGN_CPU_SHARE = 0.1
+    # Admission control of "/" in the Flask application: token buckets of ADMISSION_RATE requests per second with
+    # bursts of ADMISSION_BURST requests per client (0 disables them), kept for ADMISSION_CLIENT_SLOTS clients
+    # in memory shared by pre-forked workers, and at most ADMISSION_MAX_CONCURRENCY requests in progress per worker
+    # (0 disables it). Clients are told apart by the remote address or by ADMISSION_CLIENT_HEADER behind a proxy
+    ADMISSION_RATE = 0
+    ADMISSION_BURST = 20
+    ADMISSION_CLIENT_SLOTS = 65536
+    ADMISSION_MAX_CONCURRENCY = 0
+    ADMISSION_CLIENT_HEADER = None
+    # Json lines access log of "/" in the Flask application (None disables it), written by a background thread
+    # of every worker: successful requests are sampled with ACCESS_LOG_SAMPLE_RATE, failures are always logged,
+    # records over ACCESS_LOG_QUEUE_SIZE waiting ones are dropped. The file is rotated after ACCESS_LOG_MAX_BYTES
+    # (0 leaves it to logrotate) keeping ACCESS_LOG_BACKUP_COUNT files
+    ACCESS_LOG_PATH = None
+    ACCESS_LOG_SAMPLE_RATE = 1.0
+    ACCESS_LOG_QUEUE_SIZE = 10000
+    ACCESS_LOG_MAX_BYTES = 0
+    ACCESS_LOG_BACKUP_COUNT = 5
+    # Signed links cache: max entries count per worker (0 disables the cache),
+    # slots count of the tier shared by workers on the host (0 disables it)
+    # and its backing file (anonymous memory shared with forked workers by default)
+    CACHE_SIZE = 0
+    CACHE_SHARED_SLOTS = 0
+    CACHE_SHARED_PATH = None
+    # Prometheus metrics on /metrics. Metrics of pre-forked workers are summed in files of the directory,
+    # serve.py uses a temporary directory of the master process unless it is set
+    METRICS_ENABLED = False
+    METRICS_DIR = os.getenv('METRICS_DIR')
+    # On-demand profiler: samples PROFILING_SAMPLE_RATE of requests and profiles all requests for PROFILING_SECONDS
+    # after PROFILING_SIGNAL or POST /admin/profile?seconds=N with X-Secret header, dumps results to PROFILING_DIR
+    # (secure_link_profiles in the temporary directory by default)
+    PROFILING_ENABLED = False
+    PROFILING_SAMPLE_RATE = 0.0
+    PROFILING_SECONDS = 30
+    PROFILING_DUMP_EVERY = 100
+    PROFILING_SIGNAL = 'SIGUSR2'
+    PROFILING_DIR = None
 
 
 class DevelopmentConfig(Config):
@@ -27,6 +98,7 @@ class ProductionConfig(Config):
     """Configurations for Production."""
     DEBUG = False
     TESTING = False
+    METRICS_ENABLED = True
 
 
 app_config = {
@@ -0,0 +1,93 @@
+"""Admission control: per-client token buckets shared by pre-forked workers and a per-worker concurrency limit.
+
+Rejections are decided before any parsing, validation or hashing, so they stay cheap under overload.
+"""
+import hashlib
+import math
+import mmap
+import multiprocessing
+import struct
+import threading
+import time
+
+from shared.metrics import responses_total
+from shared.response_object import ResponseFailure
+
+
+class SharedTokenBuckets(object):
+    """Token buckets of clients in a fixed-size set-associative table in shared memory.
+
+    The table is created before workers are forked, so every worker on the host updates the same buckets.
+    Memory is bounded by the slots count: a client, which was idle long enough for its bucket to refill,
+    is indistinguishable from a new one, so the least recently updated slot of the set is reused for new clients.
+    Sets are updated under striped locks, which are shared with forked workers too.
+    """
+    SLOT = struct.Struct('<Qdd')
+    WAYS = 4
+    LOCK_STRIPES = 64
+
+    def __init__(self, rate: float, burst: int, slots: int, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.sets = max(1, slots // self.WAYS)
+        self._clock = clock
+        self._memory = mmap.mmap(-1, self.sets * self.WAYS * self.SLOT.size)
+        self._locks = [multiprocessing.Lock() for _ in range(min(self.LOCK_STRIPES, self.sets))]
+
+    @classmethod
+    def _digest_client(cls, client: str):
+        # 0 marks empty slots
+        return int.from_bytes(hashlib.blake2b(client.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+
+    def take(self, client: str):
+        """Take a token from the bucket of the client, return False if it is empty."""
+        digest = self._digest_client(client)
+        set_index = digest % self.sets
+        first_offset = set_index * self.WAYS * self.SLOT.size
+        now = self._clock()
+        with self._locks[set_index % len(self._locks)]:
+            victim_offset, victim_updated = None, None
+            for offset in range(first_offset, first_offset + self.WAYS * self.SLOT.size, self.SLOT.size):
+                slot_digest, tokens, updated = self.SLOT.unpack_from(self._memory, offset)
+                if slot_digest == digest:
+                    tokens = min(self.burst, tokens + (now - updated) * self.rate)
+                    if tokens < 1:
+                        self.SLOT.pack_into(self._memory, offset, digest, tokens, now)
+                        return False
+                    self.SLOT.pack_into(self._memory, offset, digest, tokens - 1, now)
+                    return True
+                if victim_offset is None or not slot_digest or updated < victim_updated:
+                    victim_offset, victim_updated = offset, (updated if slot_digest else -math.inf)
+            self.SLOT.pack_into(self._memory, victim_offset, digest, self.burst - 1, now)
+            return True
+
+
+class AdmissionController(object):
+    """Rejects requests of clients over their rate with RATE_LIMIT_ERROR and requests over the concurrency
+    limit of the worker with OVERLOAD_ERROR.
+
+    The concurrency limit is kept per worker: the kernel already balances connections between workers,
+    and permits of a crashed worker can't leak into the limits of the others.
+    """
+
+    def __init__(self, buckets: SharedTokenBuckets=None, max_concurrency: int=0):
+        self.buckets = buckets
+        self._semaphore = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        # when a client runs out of tokens, the next one comes in 1 / rate seconds
+        self.retry_after = math.ceil(1 / buckets.rate) if buckets else 1
+
+    def admit(self, client: str):
+        """Return ResponseFailure for a rejected request, otherwise None and the caller must call release()."""
+        if self._semaphore is not None and not self._semaphore.acquire(blocking=False):
+            response = ResponseFailure.build_overload_error('Too many requests in progress')
+        elif self.buckets is not None and not self.buckets.take(client):
+            self.release()
+            response = ResponseFailure.build_rate_limit_error('Too many requests')
+        else:
+            return None
+        responses_total.inc(response.type)
+        return response
+
+    def release(self):
+        if self._semaphore is not None:
+            self._semaphore.release()
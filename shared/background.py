@@ -0,0 +1,35 @@
+"""Background threads of pre-forked workers.
+
+Threads of the master process do not survive fork, so objects created before workers are forked start their
+threads lazily on the first use in every process.
+"""
+import os
+import threading
+
+
+class ProcessThreadStarter(object):
+    """Calls start on the first start_once of every process, start creates and starts the thread."""
+
+    def __init__(self, start):
+        self._start = start
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def started(self):
+        """Whether the thread was started in this process and not stopped."""
+        return self._pid == os.getpid()
+
+    def start_once(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # the thread of the master process does not survive fork, every worker starts its own
+            self._start()
+            self._pid = os.getpid()
+
+    def stopped(self):
+        """Mark the thread of this process stopped, the next start_once starts a new one."""
+        self._pid = None
@@ -0,0 +1,154 @@
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+
+class SharedMemoryCacheTier(object):
+    """Fixed-size direct-mapped table in shared memory.
+
+    The table is created before workers are forked (or backed by a file, e.g. in /dev/shm), so every worker
+    on the host sees entries stored by the others. Slots are written without locks: every slot holds a checksum
+    of its key and content, so torn or overwritten slots are read as misses.
+    """
+    SLOT_HEADER = struct.Struct('<16sqH')
+    SLOT_SIZE = 256
+    VALUE_SIZE = SLOT_SIZE - SLOT_HEADER.size
+    # expiration times stored in the int64 slot header field, the rest is kept by the local tier only
+    MAX_EXPIRES = 2 ** 63 - 1
+
+    def __init__(self, slots: int, path: str=None):
+        self.slots = slots
+        size = slots * self.SLOT_SIZE
+        if path is None:
+            self._memory = mmap.mmap(-1, size)
+        else:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                if os.fstat(fd).st_size != size:
+                    os.ftruncate(fd, size)
+                self._memory = mmap.mmap(fd, size)
+            finally:
+                os.close(fd)
+
+    @classmethod
+    def _digest_key(cls, key: tuple):
+        return hashlib.md5('\0'.join(map(str, key)).encode('utf-8')).digest()
+
+    def _get_offset(self, key_digest: bytes):
+        return int.from_bytes(key_digest[:8], 'little') % self.slots * self.SLOT_SIZE
+
+    @classmethod
+    def _checksum(cls, key_digest: bytes, expires: int, value: bytes):
+        return hashlib.md5(key_digest + expires.to_bytes(8, 'little', signed=True) + value).digest()
+
+    def get(self, key: tuple, now: float):
+        """Return (value, expires) stored for the key or None."""
+        key_digest = self._digest_key(key)
+        offset = self._get_offset(key_digest)
+        checksum, expires, length = self.SLOT_HEADER.unpack_from(self._memory, offset)
+        if length > self.VALUE_SIZE or expires < now:
+            return None
+        value_offset = offset + self.SLOT_HEADER.size
+        value = self._memory[value_offset:value_offset + length]
+        if checksum != self._checksum(key_digest, expires, value):
+            return None
+        return value.decode('utf-8'), expires
+
+    def set(self, key: tuple, value: str, expires: int):
+        value = value.encode('utf-8')
+        if len(value) > self.VALUE_SIZE or not 0 <= expires <= self.MAX_EXPIRES:
+            return
+        key_digest = self._digest_key(key)
+        offset = self._get_offset(key_digest)
+        value_offset = offset + self.SLOT_HEADER.size
+        self._memory[value_offset:value_offset + len(value)] = value
+        self.SLOT_HEADER.pack_into(self._memory, offset, self._checksum(key_digest, expires, value), expires,
+                                   len(value))
+
+
+class ExpiringLRUCache(object):
+    """Thread-safe LRU cache with bounded size, which drops entries once their expiration timestamp has passed.
+
+    Local misses fall through to the optional shared memory tier.
+    """
+
+    def __init__(self, max_size: int, shared_tier: SharedMemoryCacheTier=None, clock=time.time):
+        self.max_size = max_size
+        self.shared_tier = shared_tier
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._sets_since_sweep = 0
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: tuple):
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] >= now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+                self.expirations += 1
+            if self.shared_tier is None:
+                self.misses += 1
+                return None
+        shared_entry = self.shared_tier.get(key, now)
+        with self._lock:
+            if shared_entry is None:
+                self.misses += 1
+                return None
+            self.shared_hits += 1
+            value, expires = shared_entry
+            self._set(key, value, expires, now)
+            return value
+
+    def set(self, key: tuple, value: str, expires: int):
+        now = self._clock()
+        if expires < now:
+            return
+        with self._lock:
+            self._set(key, value, expires, now)
+        if self.shared_tier is not None:
+            self.shared_tier.set(key, value, expires)
+
+    def _set(self, key: tuple, value: str, expires: int, now: float):
+        self._entries[key] = (expires, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        self._sets_since_sweep += 1
+        if self._sets_since_sweep >= self.max_size:
+            self._sweep(now)
+
+    def _sweep(self, now: float):
+        """Drop all expired entries. Runs once per max_size stores, so costs O(1) per store on average."""
+        self._sets_since_sweep = 0
+        expired_keys = [key for key, (expires, _) in self._entries.items() if expires < now]
+        for key in expired_keys:
+            del self._entries[key]
+        self.expirations += len(expired_keys)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
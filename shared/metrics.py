@@ -0,0 +1,211 @@
+"""Low-overhead counters and latency histograms exported in Prometheus text format.
+
+Metrics are declared up front with all their label values, so every process keeps them in a flat array
+of doubles with the same layout. In multiprocess mode every process keeps its array in its own memory-mapped
+file in the shared directory and the exported values are summed over all files, so the numbers stay correct
+for any count of pre-forked workers.
+"""
+import fcntl
+import mmap
+import os
+import threading
+from array import array
+from bisect import bisect_left
+
+from shared.response_object import ResponseFailure, ResponseSuccess
+
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0)
+
+
+class Counter(object):
+    def __init__(self, registry, offset: int, name: str, documentation: str, label: str, label_values: tuple):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.label_values = label_values
+        self._offsets = {label_value: offset + index for index, label_value in enumerate(label_values)}
+        self.size = len(label_values)
+
+    def inc(self, label_value: str, amount: float=1):
+        offset = self._offsets.get(label_value)
+        if offset is None or not self.registry.enabled:
+            return
+        with self.registry.lock:
+            self.registry.values[offset] += amount
+
+    def render(self, values):
+        lines = ['# HELP {} {}'.format(self.name, self.documentation), '# TYPE {} counter'.format(self.name)]
+        for label_value, offset in self._offsets.items():
+            lines.append('{}{{{}="{}"}} {}'.format(self.name, self.label, label_value, _format_value(values[offset])))
+        return lines
+
+
+class Histogram(object):
+    def __init__(self, registry, offset: int, name: str, documentation: str, label: str, label_values: tuple,
+                 buckets: tuple=DEFAULT_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.label_values = label_values
+        self.buckets = buckets
+        # Every label value keeps a count per bucket (the last one is +Inf), then sum
+        self._step = len(buckets) + 2
+        self._offsets = {label_value: offset + index * self._step for index, label_value in enumerate(label_values)}
+        self.size = len(label_values) * self._step
+
+    def observe(self, label_value: str, value: float):
+        offset = self._offsets.get(label_value)
+        if offset is None or not self.registry.enabled:
+            return
+        bucket = bisect_left(self.buckets, value)
+        with self.registry.lock:
+            values = self.registry.values
+            values[offset + bucket] += 1
+            values[offset + self._step - 1] += value
+
+    def render(self, values):
+        lines = ['# HELP {} {}'.format(self.name, self.documentation), '# TYPE {} histogram'.format(self.name)]
+        for label_value, offset in self._offsets.items():
+            count = 0
+            for bucket, bound in enumerate(self.buckets + ('+Inf',)):
+                count += values[offset + bucket]
+                lines.append('{}_bucket{{{}="{}",le="{}"}} {}'.format(self.name, self.label, label_value, bound,
+                                                                     _format_value(count)))
+            labels = '{{{}="{}"}}'.format(self.label, label_value)
+            lines.append('{}_sum{} {}'.format(self.name, labels, _format_value(values[offset + self._step - 1])))
+            lines.append('{}_count{} {}'.format(self.name, labels, _format_value(count)))
+        return lines
+
+
+def _format_value(value: float):
+    return repr(int(value)) if value.is_integer() else repr(value)
+
+
+class MetricsRegistry(object):
+    FILE_PREFIX = 'metrics_'
+    # values of exited processes are added up here, so counters do not go down when workers are restarted
+    RETIRED_FILE = 'metrics_retired.db'
+    LOCK_FILE = 'metrics.lock'
+
+    def __init__(self):
+        self.enabled = False
+        self.directory = None
+        self.lock = threading.Lock()
+        self._metrics = []
+        self._size = 0
+        self._values = None
+        self._pid = None
+
+    def counter(self, name: str, documentation: str, label: str, label_values: tuple):
+        return self._add(Counter(self, self._size, name, documentation, label, label_values))
+
+    def histogram(self, name: str, documentation: str, label: str, label_values: tuple,
+                  buckets: tuple=DEFAULT_BUCKETS):
+        return self._add(Histogram(self, self._size, name, documentation, label, label_values, buckets))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        self._size += metric.size
+        self._values = None
+        return metric
+
+    def configure(self, enabled: bool=True, directory: str=None):
+        """Enable or disable collection, the directory turns on multiprocess mode."""
+        with self.lock:
+            self.enabled = enabled
+            self.directory = directory
+            self._values = None
+
+    @property
+    def values(self):
+        if self._values is None or (self.directory and self._pid != os.getpid()):
+            self._values = self._create_values()
+        return self._values
+
+    def _create_values(self):
+        self._pid = os.getpid()
+        if not self.directory:
+            return array('d', bytes(8 * self._size))
+        os.makedirs(self.directory, exist_ok=True)
+        fd = os.open(self._get_path(self._pid), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size != 8 * self._size:
+                os.ftruncate(fd, 8 * self._size)
+            return memoryview(mmap.mmap(fd, 8 * self._size)).cast('d')
+        finally:
+            os.close(fd)
+
+    def _get_path(self, pid: int):
+        return os.path.join(self.directory, '{}{}.db'.format(self.FILE_PREFIX, pid))
+
+    def _read_file(self, path: str):
+        values = array('d')
+        with open(path, 'rb') as file:
+            values.frombytes(file.read(8 * self._size))
+        return values
+
+    def _lock_directory(self, operation: int):
+        """Return the locked file, which serializes collecting with retiring of processes."""
+        os.makedirs(self.directory, exist_ok=True)
+        lock_file = open(os.path.join(self.directory, self.LOCK_FILE), 'a')
+        fcntl.flock(lock_file, operation)
+        return lock_file
+
+    def collect(self):
+        """Return values summed over all processes."""
+        if not self.directory:
+            with self.lock:
+                return list(self.values)
+        totals = [0.0] * self._size
+        with self._lock_directory(fcntl.LOCK_SH):
+            for file_name in os.listdir(self.directory):
+                if not file_name.startswith(self.FILE_PREFIX):
+                    continue
+                for index, value in enumerate(self._read_file(os.path.join(self.directory, file_name))):
+                    totals[index] += value
+        return totals
+
+    def retire(self, pid: int):
+        """Add values of the exited process to the retired file and remove its file."""
+        if not self.directory:
+            return
+        path = self._get_path(pid)
+        if not os.path.exists(path):
+            return
+        retired_path = os.path.join(self.directory, self.RETIRED_FILE)
+        # the temporary file does not start with FILE_PREFIX, so it is never collected
+        temporary_path = os.path.join(self.directory, '.' + self.RETIRED_FILE)
+        with self._lock_directory(fcntl.LOCK_EX):
+            totals = self._read_file(path)
+            if os.path.exists(retired_path):
+                for index, value in enumerate(self._read_file(retired_path)):
+                    totals[index] += value
+            with open(temporary_path, 'wb') as file:
+                file.write(totals.tobytes())
+            os.replace(temporary_path, retired_path)
+            os.remove(path)
+
+    def render(self):
+        values = self.collect()
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render(values))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+STAGES = ('parse', 'validate', 'hash', 'url_rebuild', 'serialize')
+stage_seconds = REGISTRY.histogram('secure_link_stage_seconds', 'Time spent in request processing stages.',
+                                   label='stage', label_values=STAGES)
+responses_total = REGISTRY.counter('secure_link_responses_total',
+                                   'Responses by type, batches are counted per link.', label='type',
+                                   label_values=(ResponseSuccess.SUCCESS, ResponseFailure.RESOURCE_ERROR,
+                                                 ResponseFailure.PARAMETERS_ERROR, ResponseFailure.SYSTEM_ERROR,
+                                                 ResponseFailure.RATE_LIMIT_ERROR, ResponseFailure.OVERLOAD_ERROR))
+access_log_dropped_total = REGISTRY.counter('secure_link_access_log_dropped_total',
+                                            'Access log records dropped instead of blocking requests.',
+                                            label='reason', label_values=('queue_full', 'write_error'))
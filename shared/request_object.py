@@ -1,4 +1,5 @@
 class InvalidRequestObject(object):
+    __slots__ = ('errors',)
 
     def __init__(self):
         self.errors = []
@@ -16,6 +17,7 @@ class InvalidRequestObject(object):
 
 
 class ValidRequestObject(object):
+    __slots__ = ()
 
     def __nonzero__(self):
         return True
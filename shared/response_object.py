@@ -1,4 +1,6 @@
 class ResponseSuccess(object):
+    __slots__ = ('type', 'value')
+
     SUCCESS = 'SUCCESS'
 
     def __init__(self, value=None):
@@ -12,9 +14,13 @@ class ResponseSuccess(object):
 
 
 class ResponseFailure(object):
+    __slots__ = ('type', 'message')
+
     RESOURCE_ERROR = 'RESOURCE_ERROR'
     PARAMETERS_ERROR = 'PARAMETERS_ERROR'
     SYSTEM_ERROR = 'SYSTEM_ERROR'
+    RATE_LIMIT_ERROR = 'RATE_LIMIT_ERROR'
+    OVERLOAD_ERROR = 'OVERLOAD_ERROR'
 
     def __init__(self, type_, message):
         self.type = type_
@@ -44,6 +50,14 @@ class ResponseFailure(object):
     def build_parameters_error(cls, message=None):
         return cls(cls.PARAMETERS_ERROR, message)
 
+    @classmethod
+    def build_rate_limit_error(cls, message=None):
+        return cls(cls.RATE_LIMIT_ERROR, message)
+
+    @classmethod
+    def build_overload_error(cls, message=None):
+        return cls(cls.OVERLOAD_ERROR, message)
+
     @classmethod
     def build_from_invalid_request_object(cls, invalid_request_object):
         message = "\n".join(["{}: {}".format(err['parameter'], err['message'])
@@ -1,5 +1,11 @@
+import os
+import tempfile
 from unittest import mock, main, TestCase
 
+from shared.admission import AdmissionController, SharedTokenBuckets
+from shared.background import ProcessThreadStarter
+from shared.cache import ExpiringLRUCache, SharedMemoryCacheTier
+from shared.metrics import MetricsRegistry
 from shared.request_object import InvalidRequestObject, ValidRequestObject
 from shared.response_object import ResponseFailure, ResponseSuccess
 from shared.use_case import UseCase
@@ -135,5 +141,238 @@ class ResponseObjectTestCase(TestCase):
         self.assertEqual(response.message, "test message")
 
 
+class ExpiringLRUCacheTestCase(TestCase):
+    def setUp(self):
+        self.now = 1000
+        self.cache = ExpiringLRUCache(max_size=2, clock=lambda: self.now)
+
+    def test_get_returns_stored_value(self):
+        self.cache.set(('key',), 'value', expires=2000)
+
+        self.assertEqual(self.cache.get(('key',)), 'value')
+        self.assertIsNone(self.cache.get(('another key',)))
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.set(('first',), 'first', expires=2000)
+        self.cache.set(('second',), 'second', expires=2000)
+        self.cache.get(('first',))
+        self.cache.set(('third',), 'third', expires=2000)
+
+        self.assertEqual(self.cache.get(('first',)), 'first')
+        self.assertIsNone(self.cache.get(('second',)))
+        self.assertEqual(self.cache.evictions, 1)
+
+    def test_expired_entry_is_evicted(self):
+        self.cache.set(('key',), 'value', expires=2000)
+        self.now = 2001
+
+        self.assertIsNone(self.cache.get(('key',)))
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.expirations, 1)
+
+    def test_expired_entries_are_swept(self):
+        self.cache.set(('first',), 'first', expires=1500)
+        self.now = 1600
+        self.cache.set(('second',), 'second', expires=2000)
+
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(self.cache.stats()['expirations'], 1)
+
+    def test_already_expired_value_is_not_stored(self):
+        self.cache.set(('key',), 'value', expires=999)
+
+        self.assertEqual(len(self.cache), 0)
+
+
+class SharedMemoryCacheTierTestCase(TestCase):
+    def test_caches_share_entries_through_tier(self):
+        shared_tier = SharedMemoryCacheTier(slots=16)
+        first_cache = ExpiringLRUCache(max_size=2, shared_tier=shared_tier)
+        second_cache = ExpiringLRUCache(max_size=2, shared_tier=shared_tier)
+
+        first_cache.set(('key',), 'value', expires=2147483647)
+
+        self.assertEqual(second_cache.get(('key',)), 'value')
+        self.assertEqual(second_cache.shared_hits, 1)
+        self.assertEqual(second_cache.get(('key',)), 'value')
+        self.assertEqual(second_cache.hits, 1)
+
+    def test_forked_process_stores_entries_for_parent(self):
+        shared_tier = SharedMemoryCacheTier(slots=16)
+        pid = os.fork()
+        if not pid:
+            shared_tier.set(('key',), 'value', expires=2147483647)
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+        self.assertEqual(shared_tier.get(('key',), now=0), ('value', 2147483647))
+
+    def test_file_backed_tier(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'cache')
+            SharedMemoryCacheTier(slots=16, path=path).set(('key',), 'value', expires=2000)
+
+            self.assertEqual(SharedMemoryCacheTier(slots=16, path=path).get(('key',), now=1000), ('value', 2000))
+            self.assertIsNone(SharedMemoryCacheTier(slots=16, path=path).get(('key',), now=2001))
+
+    def test_expires_over_int64_is_not_shared(self):
+        shared_tier = SharedMemoryCacheTier(slots=16)
+        cache = ExpiringLRUCache(max_size=2, shared_tier=shared_tier)
+
+        cache.set(('key',), 'value', expires=2 ** 64)
+
+        self.assertEqual(cache.get(('key',)), 'value')
+        self.assertIsNone(shared_tier.get(('key',), now=0))
+
+    def test_corrupted_slot_is_miss(self):
+        shared_tier = SharedMemoryCacheTier(slots=1)
+        shared_tier.set(('key',), 'value', expires=2000)
+        shared_tier._memory[SharedMemoryCacheTier.SLOT_HEADER.size] = ord('V')
+
+        self.assertIsNone(shared_tier.get(('key',), now=1000))
+
+
+class SharedTokenBucketsTestCase(TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.buckets = SharedTokenBuckets(rate=2, burst=3, slots=8, clock=lambda: self.now)
+
+    def test_burst_is_allowed_then_rate(self):
+        self.assertEqual([self.buckets.take('10.0.0.1') for _ in range(4)], [True, True, True, False])
+        self.assertTrue(self.buckets.take('10.0.0.2'))
+
+        self.now += 0.5
+
+        self.assertEqual([self.buckets.take('10.0.0.1') for _ in range(2)], [True, False])
+
+    def test_idle_clients_are_evicted(self):
+        for number in range(100):
+            self.buckets.take('10.0.0.{}'.format(number))
+
+        self.assertEqual(len(self.buckets._memory), 8 * SharedTokenBuckets.SLOT.size)
+        self.assertEqual([self.buckets.take('10.0.0.99') for _ in range(3)], [True, True, False])
+
+    def test_forked_process_takes_tokens_for_parent(self):
+        pid = os.fork()
+        if not pid:
+            for _ in range(3):
+                self.buckets.take('10.0.0.1')
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+        self.assertFalse(self.buckets.take('10.0.0.1'))
+
+
+class AdmissionControllerTestCase(TestCase):
+    def test_requests_over_concurrency_are_overload_errors(self):
+        admission = AdmissionController(max_concurrency=1)
+
+        self.assertIsNone(admission.admit('10.0.0.1'))
+        self.assertEqual(admission.admit('10.0.0.2').type, ResponseFailure.OVERLOAD_ERROR)
+        admission.release()
+        self.assertIsNone(admission.admit('10.0.0.2'))
+
+    def test_rejected_request_does_not_hold_concurrency(self):
+        admission = AdmissionController(buckets=SharedTokenBuckets(rate=1, burst=1, slots=4), max_concurrency=1)
+
+        self.assertIsNone(admission.admit('10.0.0.1'))
+        admission.release()
+        self.assertEqual(admission.admit('10.0.0.1').type, ResponseFailure.RATE_LIMIT_ERROR)
+        self.assertIsNone(admission.admit('10.0.0.2'))
+
+
+class ProcessThreadStarterTestCase(TestCase):
+    def test_starts_once_in_every_process(self):
+        start = mock.Mock()
+        starter = ProcessThreadStarter(start)
+
+        starter.start_once()
+        starter.start_once()
+        self.assertTrue(starter.started)
+        self.assertEqual(start.call_count, 1)
+        with mock.patch('os.getpid', return_value=os.getpid() + 1):
+            self.assertFalse(starter.started)
+            starter.start_once()
+        self.assertEqual(start.call_count, 2)
+
+    def test_starts_again_after_stopped(self):
+        start = mock.Mock()
+        starter = ProcessThreadStarter(start)
+
+        starter.start_once()
+        starter.stopped()
+        self.assertFalse(starter.started)
+        starter.start_once()
+        self.assertEqual(start.call_count, 2)
+
+
+class MetricsRegistryTestCase(TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+        self.counter = self.registry.counter('test_total', 'Test counter.', label='type', label_values=('a', 'b'))
+        self.histogram = self.registry.histogram('test_seconds', 'Test histogram.', label='stage',
+                                                 label_values=('first',), buckets=(0.1, 1.0))
+        self.registry.configure()
+
+    def test_disabled_registry_collects_nothing(self):
+        self.registry.configure(enabled=False)
+        self.counter.inc('a')
+
+        self.assertEqual(self.registry.collect(), [0] * 6)
+
+    def test_render_counter(self):
+        self.counter.inc('a')
+        self.counter.inc('a', 2)
+        self.counter.inc('unknown')
+
+        rendered = self.registry.render()
+
+        self.assertIn('# TYPE test_total counter\ntest_total{type="a"} 3\ntest_total{type="b"} 0\n', rendered)
+
+    def test_render_histogram(self):
+        self.histogram.observe('first', 0.05)
+        self.histogram.observe('first', 0.5)
+        self.histogram.observe('first', 2)
+
+        rendered = self.registry.render()
+
+        self.assertIn('# TYPE test_seconds histogram\n'
+                      'test_seconds_bucket{stage="first",le="0.1"} 1\n'
+                      'test_seconds_bucket{stage="first",le="1.0"} 2\n'
+                      'test_seconds_bucket{stage="first",le="+Inf"} 3\n'
+                      'test_seconds_sum{stage="first"} 2.55\n'
+                      'test_seconds_count{stage="first"} 3\n', rendered)
+
+    def test_multiprocess_metrics_are_summed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.registry.configure(directory=directory)
+            self.counter.inc('a')
+            pid = os.fork()
+            if not pid:
+                self.counter.inc('a', 2)
+                self.counter.inc('b')
+                os._exit(0)
+            os.waitpid(pid, 0)
+
+            self.assertEqual(self.registry.collect()[:2], [3, 1])
+
+    def test_values_of_retired_processes_are_kept(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.registry.configure(directory=directory)
+            for amount in (1, 2):
+                pid = os.fork()
+                if not pid:
+                    self.counter.inc('a', amount)
+                    os._exit(0)
+                os.waitpid(pid, 0)
+                self.registry.retire(pid)
+
+            self.assertEqual(self.registry.collect()[:2], [3, 0])
+            self.assertEqual(sorted(name for name in os.listdir(directory) if name.startswith('metrics_')),
+                             ['metrics_retired.db'])
+
+
 if __name__ == '__main__':
     main()
@@ -1,16 +1,23 @@
+from shared.metrics import responses_total
 from shared.response_object import ResponseFailure
 
 
 class UseCase(object):
+    # use cases, whose successful responses are made of responses of other use cases, count only their failures
+    count_successes = True
 
     def execute(self, request_object):
         if not request_object:
-            return ResponseFailure.build_from_invalid_request_object(request_object)
-        try:
-            return self.process_request(request_object)
-        except Exception as exc:
-            return ResponseFailure.build_system_error(
-                "{}: {}".format(exc.__class__.__name__, "{}".format(exc)))
+            response = ResponseFailure.build_from_invalid_request_object(request_object)
+        else:
+            try:
+                response = self.process_request(request_object)
+            except Exception as exc:
+                response = ResponseFailure.build_system_error(
+                    "{}: {}".format(exc.__class__.__name__, "{}".format(exc)))
+        if not response or self.count_successes:
+            responses_total.inc(response.type)
+        return response
 
     def process_request(self, request_object):
         raise NotImplementedError(
@@ -1,31 +1,105 @@
-import base64
+import binascii
 import hashlib
-from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+import re
+from time import perf_counter
+from urllib.parse import urljoin, urlparse, parse_qsl, urlencode, urlunparse
 
+from shared.cache import ExpiringLRUCache
+from shared.metrics import responses_total, stage_seconds
 from shared.response_object import ResponseSuccess
 from shared.use_case import UseCase
+from use_cases.request_objects import GenerateSecureLinkRequestObject
+from use_cases.secure_link_md5 import DEFAULT_EXPRESSION, DEFAULT_PROFILE, compile_secure_link_md5
+from use_cases.validators import is_correct_url
 
 
 class GenerateSecureLinkUseCase(UseCase):
+    HASH_MARKER = 'HASH~MARKER'
+    BASE64URL_TABLE = bytes.maketrans(b'+/', b'-_')
+
+    def __init__(self, cache: ExpiringLRUCache=None, profiles: dict=None, presigned=None, record_stages: bool=True):
+        """Profiles map names to functions from compile_secure_link_md5, without them the default expression is used.
+        Presigned links (e.g. api.presign.PresignScheduler) are looked up by get(profile, expires, url, ip_address,
+        password) before the cache. Without record_stages links signed off the request path are not observed
+        in the request stage histograms."""
+        self.cache = cache
+        self.profiles = profiles
+        self.presigned = presigned
+        self.record_stages = record_stages
+
     def process_request(self, request_object):
-        md5 = self._generate_hash_for_secure_link(expires=request_object.expires,
-                                                  url=request_object.url,
-                                                  ip_address=request_object.ip_address,
-                                                  password=request_object.password)
-        new_query_dict = {'md5': md5, 'expires': request_object.expires}
-        secure_url = self._add_query_to_url(url=request_object.url, query_dict=new_query_dict)
-        return ResponseSuccess(secure_url)
+        return ResponseSuccess(self._get_secure_url(request_object.expires, request_object.url,
+                                                    request_object.ip_address, request_object.password,
+                                                    request_object.profile))
+
+    def _get_secure_url(self, expires: int, url: str, ip_address: str, password: str, profile: str):
+        """Return the secure url for valid parameters, from the presigned links or the cache when there are ones."""
+        if self.presigned is not None:
+            secure_url = self.presigned.get(profile, expires, url, ip_address, password)
+            if secure_url is not None:
+                return secure_url
+        if self.cache is None:
+            return self._build_secure_url(expires, url, ip_address, password, profile)
+        key = (profile, expires, url, ip_address, password)
+        secure_url = self.cache.get(key)
+        if secure_url is None:
+            secure_url = self._build_secure_url(expires, url, ip_address, password, profile)
+            self.cache.set(key, secure_url, expires=expires)
+        return secure_url
+
+    def _generate_secure_url(self, request_object):
+        return self._build_secure_url(request_object.expires, request_object.url, request_object.ip_address,
+                                      request_object.password, request_object.profile)
+
+    def _build_secure_url(self, expires: int, url: str, ip_address: str, password: str, profile: str):
+        started = perf_counter()
+        if self.profiles is None:
+            md5 = self._generate_hash_for_secure_link(expires=expires, url=url, ip_address=ip_address,
+                                                      password=password)
+        else:
+            string_for_md5 = self.profiles[profile](expires, url, ip_address, password)
+            md5 = self._encode_hash(hashlib.md5(string_for_md5.encode('utf-8')).digest())
+        hashed = perf_counter()
+        if self._is_path_without_query(url):
+            # md5 is base64url and expires is an integer, so neither needs quoting
+            secure_url = ''.join([url, '?md5=', md5, '&expires=', str(expires)])
+        else:
+            secure_url = self._add_query_to_url(url=url, query_dict={'md5': md5, 'expires': expires})
+        if self.record_stages:
+            stage_seconds.observe('hash', hashed - started)
+            stage_seconds.observe('url_rebuild', perf_counter() - hashed)
+        return secure_url
 
     @classmethod
     def _generate_hash_for_secure_link(cls, expires: int, url: str, ip_address: str, password: str):
         string_for_md5 = ''.join([str(expires), str(url), str(ip_address), '=', str(password)])
         md5 = hashlib.md5(string_for_md5.encode('utf-8'))
-        hash_string = base64.b64encode(md5.digest()).decode()
-        hash_string = hash_string.replace('+', '-')
-        hash_string = hash_string.replace('/', '_')
-        hash_string = hash_string.replace('=', '')
 
-        return hash_string
+        return cls._encode_hash(md5.digest())
+
+    @classmethod
+    def _generate_hashes_for_secure_links(cls, expires: int, url: str, ip_addresses, password: str):
+        """Lazily yield hashes for every ip-address, hashing the shared expires and url prefix only once."""
+        prefix_md5 = hashlib.md5(''.join([str(expires), str(url)]).encode('utf-8'))
+        suffix = ''.join(['=', str(password)]).encode('utf-8')
+        for ip_address in ip_addresses:
+            md5 = prefix_md5.copy()
+            md5.update(str(ip_address).encode('utf-8') + suffix)
+            yield cls._encode_hash(md5.digest())
+
+    @classmethod
+    def _encode_hash(cls, digest: bytes):
+        return binascii.b2a_base64(digest, newline=False).translate(cls.BASE64URL_TABLE).rstrip(b'=').decode()
+
+    @classmethod
+    def _is_path_without_query(cls, url: str):
+        """Check, that urlparse/urlunparse would return the url unchanged and without query.
+
+        Such url is a path without network location, query, fragment and params,
+        and without characters, which urlparse strips.
+        """
+        return (url[:1] == '/' and url[1:2] != '/' and '?' not in url and '#' not in url and ';' not in url and
+                url.isprintable())
 
     @classmethod
     def _add_query_to_url(cls, url: str, query_dict: dict):
@@ -37,6 +111,129 @@ class GenerateSecureLinkUseCase(UseCase):
 
         return new_url
 
+    @classmethod
+    def _get_secure_url_builder(cls, url: str, expires: int):
+        """Return a function, which builds the secure url for a hash.
+
+        The query is rebuilt only once: the url is split around a marker placed instead of the hash.
+        """
+        secure_url = cls._add_query_to_url(url=url, query_dict={'md5': cls.HASH_MARKER, 'expires': expires})
+        if secure_url.count(cls.HASH_MARKER) != 1:
+            return lambda md5: cls._add_query_to_url(url=url, query_dict={'md5': md5, 'expires': expires})
+        prefix, suffix = secure_url.split(cls.HASH_MARKER)
+        return lambda md5: ''.join([prefix, md5, suffix])
+
     @classmethod
     def _get_path_from_url(cls, url: str):
         return urlparse(url).path
+
+
+class GenerateSecureLinkFanOutUseCase(GenerateSecureLinkUseCase):
+    """Signs one url with one expiration time for many ip-addresses."""
+
+    def process_request(self, request_object):
+        build_secure_url = self._get_secure_url_builder(url=request_object.url, expires=request_object.expires)
+        hashes = self._generate_hashes_for_secure_links(expires=request_object.expires,
+                                                        url=request_object.url,
+                                                        ip_addresses=request_object.ip_addresses,
+                                                        password=request_object.password)
+        return ResponseSuccess([build_secure_url(md5) for md5 in hashes])
+
+
+class GenerateSignedPlaylistUseCase(GenerateSecureLinkUseCase):
+    """Signs every URI of an HLS playlist or of a manifest with one path per line, lazily line by line.
+
+    URIs are the lines, which are not tags or comments, and URI attributes of tags (keys, init segments,
+    renditions), relative ones are resolved against the playlist url. All of them share expires, ip-address
+    and password, so the profile expression is compiled for every playlist with them inlined.
+    A line with an incorrect URI is passed unchanged after a comment with the error.
+    The response value is an iterator of lines with their line endings.
+    """
+    URI_ATTRIBUTE_PATTERN = re.compile(r'(URI=")([^"]*)(")')
+
+    def __init__(self, expressions: dict=None, url_max_length: int=GenerateSecureLinkRequestObject.URL_MAX_LENGTH):
+        """Expressions map profiles to secure_link_md5 expressions like the SECURE_LINK_PROFILES setting."""
+        super().__init__()
+        self.expressions = dict({DEFAULT_PROFILE: DEFAULT_EXPRESSION}, **(expressions or {}))
+        self.url_max_length = url_max_length
+
+    def process_request(self, request_object):
+        build_string_for_md5 = compile_secure_link_md5(
+            self.expressions[request_object.profile],
+            constants={'secure_link_expires': request_object.expires, 'remote_addr': request_object.ip_address,
+                       'p': request_object.password})
+        return ResponseSuccess(self._sign_lines(request_object, build_string_for_md5))
+
+    @classmethod
+    def _is_plain_relative_uri(cls, uri: str):
+        """Check, that urljoin would only append the uri to the directory of the base url.
+
+        Such uri has no scheme, query, fragment, dot segments and params, does not start with a path,
+        and has no characters, which urlsplit strips (surrounding whitespace and control characters).
+        """
+        return (uri[:1] not in '/.' and ':' not in uri and '/.' not in uri and ';' not in uri and '?' not in uri and
+                '#' not in uri and uri.isprintable() and uri == uri.strip())
+
+    def _sign_lines(self, request_object, build_string_for_md5):
+        expires, base_url = request_object.expires, request_object.url
+        ip_address, password = request_object.ip_address, request_object.password
+        query_suffix = '&expires=' + str(expires)
+        # urljoin is slower than hashing, so segment names are appended to the directory of the playlist
+        base_directory = urljoin(base_url, 'x')[:-1]
+
+        def sign_uri(uri: str):
+            url = base_directory + uri if self._is_plain_relative_uri(uri) else urljoin(base_url, uri)
+            if not is_correct_url(url, self.url_max_length):
+                raise ValueError(uri)
+            string_for_md5 = build_string_for_md5(expires, url, ip_address, password)
+            md5 = self._encode_hash(hashlib.md5(string_for_md5.encode('utf-8')).digest())
+            if self._is_path_without_query(url):
+                return ''.join([url, '?md5=', md5, query_suffix])
+            return self._add_query_to_url(url=url, query_dict={'md5': md5, 'expires': expires})
+
+        for line in request_object.lines:
+            text = line.rstrip('\r\n')
+            try:
+                if text.startswith('#'):
+                    signed_text = text if 'URI="' not in text else self.URI_ATTRIBUTE_PATTERN.sub(
+                        lambda match: match.group(1) + sign_uri(match.group(2)) + match.group(3), text)
+                elif text.strip():
+                    signed_text = sign_uri(text.strip())
+                else:
+                    signed_text = text
+            except ValueError:
+                yield '# url: Is not correct url or path\n'
+                yield line
+                continue
+            yield signed_text + line[len(text):]
+
+
+class GenerateSecureLinkBatchUseCase(UseCase):
+    # links are counted by the item use case
+    count_successes = False
+
+    def __init__(self, item_use_case: GenerateSecureLinkUseCase=None):
+        self.item_use_case = item_use_case or GenerateSecureLinkUseCase()
+
+    def process_request(self, request_object):
+        responses = self.process_items(request_object.items, responses={})
+        return ResponseSuccess([response.value for response in responses])
+
+    def process_items(self, request_objects, responses: dict=None):
+        """Lazily yield one response object per request object, in order.
+
+        When a responses dict is given, identical valid items are signed only once.
+        """
+        for request_object in request_objects:
+            if responses is None or not request_object:
+                yield self.item_use_case.execute(request_object)
+                continue
+            key = (request_object.profile, request_object.expires, request_object.url, request_object.ip_address,
+                   request_object.password)
+            response = responses.get(key)
+            if response is None:
+                response = responses[key] = self.item_use_case.execute(request_object)
+            else:
+                # every link of the batch is counted, even if it is signed once
+                responses_total.inc(response.type)
+            yield response
@@ -1,41 +1,206 @@
-import re
-from datetime import datetime
-
 from shared.request_object import ValidRequestObject, InvalidRequestObject
+from use_cases.secure_link_md5 import DEFAULT_PROFILE
+from use_cases.validators import is_correct_ip_address, is_correct_url
+
+
+def round_up_expires(expires: int, bucket_seconds: int):
+    """Round the expiration time up to the bucket, so requests within one bucket get the same link."""
+    if not bucket_seconds:
+        return expires
+    return -(-expires // bucket_seconds) * bucket_seconds
 
 
 class GenerateSecureLinkRequestObject(ValidRequestObject):
-    url_pattern = re.compile("^((?:http|ftp)s?://)?[\w.-]?(?:.[\w.-]+)+[\w\-._:/?#[\]@!$&'()*+,;=]+$")
-    ip_address_pattern = re.compile('^(?:(?:25[0-5]|2[0-4]\d|[01]?\d\d?)\.){3}(?:25[0-5]|2[0-4]\d|[01]?\d\d?)$')
+    __slots__ = ('expires', 'url', 'ip_address', 'password', 'profile')
+
+    URL_MAX_LENGTH = 4096
+    PROFILES = (DEFAULT_PROFILE,)
 
-    def __new__(cls, expires: int=None, url: str=None, ip_address: str=None, password: str=None):
+    def __new__(cls, expires: int=None, url: str=None, ip_address: str=None, password: str=None,
+                url_max_length: int=URL_MAX_LENGTH, profile: str=DEFAULT_PROFILE, profiles=PROFILES,
+                expires_bucket_seconds: int=0):
         invalid_request = InvalidRequestObject()
         instance = super().__new__(cls)
 
-        if not (isinstance(expires, int) and expires >= 0):
+        if not cls._is_correct_expires(expires):
             invalid_request.add_error('expires', 'Is not correct timestamp (positive integer)')
         # В задании ничего не сказано про то, как в дальнейшем планируется использовать сгенерированные ссылки,
         # поэтому не понятно, нужна ди проверка на срок валидности
         # elif expires < datetime.now().timestamp():
         #     invalid_request.add_error('expires', 'Is expired timestamp')
+        else:
+            instance.expires = round_up_expires(expires, expires_bucket_seconds)
+
+        if not cls._is_correct_url(url, url_max_length):
+            invalid_request.add_error('url', 'Is not correct url or path')
+        else:
+            instance.url = url
+
+        if not cls._is_correct_ip_address(ip_address):
+            invalid_request.add_error('ip_address', 'Is not correct ip-address')
+        else:
+            instance.ip_address = ip_address
+
+        if not cls._is_correct_password(password):
+            invalid_request.add_error('password', 'Is not string')
+        else:
+            instance.password = password
+
+        if not isinstance(profile, str) or profile not in profiles:
+            invalid_request.add_error('profile', 'Is not configured profile')
+        else:
+            instance.profile = profile
+
+        if invalid_request.has_errors():
+            return invalid_request
+
+        return instance
+
+    @classmethod
+    def _is_correct_expires(cls, expires):
+        return isinstance(expires, int) and not isinstance(expires, bool) and expires >= 0
+
+    @classmethod
+    def _is_correct_url(cls, url, max_length: int=URL_MAX_LENGTH):
+        return is_correct_url(url, max_length)
+
+    @classmethod
+    def _is_correct_ip_address(cls, ip_address):
+        return is_correct_ip_address(ip_address)
+
+    @classmethod
+    def _is_correct_password(cls, password):
+        return isinstance(password, str)
+
+
+class VerifySecureLinkRequestObject(ValidRequestObject):
+    __slots__ = ('url', 'ip_address', 'password', 'now')
+
+    def __new__(cls, url: str=None, ip_address: str=None, password: str=None, now: int=None):
+        invalid_request = InvalidRequestObject()
+        instance = super().__new__(cls)
+
+        if not isinstance(url, str):
+            invalid_request.add_error('url', 'Is not string')
+        else:
+            instance.url = url
+
+        if not GenerateSecureLinkRequestObject._is_correct_ip_address(ip_address):
+            invalid_request.add_error('ip_address', 'Is not correct ip-address')
+        else:
+            instance.ip_address = ip_address
+
+        if not GenerateSecureLinkRequestObject._is_correct_password(password):
+            invalid_request.add_error('password', 'Is not string')
+        else:
+            instance.password = password
+
+        if not (now is None or GenerateSecureLinkRequestObject._is_correct_expires(now)):
+            invalid_request.add_error('now', 'Is not correct timestamp (positive integer)')
+        else:
+            instance.now = now
+
+        if invalid_request.has_errors():
+            return invalid_request
+
+        return instance
+
+
+class GenerateSecureLinkFanOutRequestObject(ValidRequestObject):
+    __slots__ = ('expires', 'url', 'ip_addresses', 'password')
+
+    def __new__(cls, expires: int=None, url: str=None, ip_addresses: list=None, password: str=None,
+                url_max_length: int=GenerateSecureLinkRequestObject.URL_MAX_LENGTH):
+        invalid_request = InvalidRequestObject()
+        instance = super().__new__(cls)
+
+        if not GenerateSecureLinkRequestObject._is_correct_expires(expires):
+            invalid_request.add_error('expires', 'Is not correct timestamp (positive integer)')
         else:
             instance.expires = expires
 
-        if not (isinstance(url, str) and cls.url_pattern.match(url)):
+        if not GenerateSecureLinkRequestObject._is_correct_url(url, url_max_length):
+            invalid_request.add_error('url', 'Is not correct url or path')
+        else:
+            instance.url = url
+
+        if not (isinstance(ip_addresses, list) and
+                all(GenerateSecureLinkRequestObject._is_correct_ip_address(ip) for ip in ip_addresses)):
+            invalid_request.add_error('ip_addresses', 'Is not list of correct ip-addresses')
+        else:
+            instance.ip_addresses = ip_addresses
+
+        if not GenerateSecureLinkRequestObject._is_correct_password(password):
+            invalid_request.add_error('password', 'Is not string')
+        else:
+            instance.password = password
+
+        if invalid_request.has_errors():
+            return invalid_request
+
+        return instance
+
+
+class GenerateSignedPlaylistRequestObject(ValidRequestObject):
+    __slots__ = ('expires', 'url', 'ip_address', 'password', 'profile', 'lines')
+
+    def __new__(cls, expires: int=None, url: str=None, ip_address: str=None, password: str=None, lines=None,
+                url_max_length: int=GenerateSecureLinkRequestObject.URL_MAX_LENGTH, profile: str=DEFAULT_PROFILE,
+                profiles=GenerateSecureLinkRequestObject.PROFILES, expires_bucket_seconds: int=0):
+        """url is the url of the playlist, lines are lines of its text, which are read lazily."""
+        invalid_request = InvalidRequestObject()
+        instance = super().__new__(cls)
+
+        if not GenerateSecureLinkRequestObject._is_correct_expires(expires):
+            invalid_request.add_error('expires', 'Is not correct timestamp (positive integer)')
+        else:
+            instance.expires = round_up_expires(expires, expires_bucket_seconds)
+
+        if not GenerateSecureLinkRequestObject._is_correct_url(url, url_max_length):
             invalid_request.add_error('url', 'Is not correct url or path')
         else:
             instance.url = url
 
-        if not (isinstance(ip_address, str) and cls.ip_address_pattern.match(ip_address)):
+        if not GenerateSecureLinkRequestObject._is_correct_ip_address(ip_address):
             invalid_request.add_error('ip_address', 'Is not correct ip-address')
         else:
             instance.ip_address = ip_address
 
-        if not isinstance(password, str):
+        if not GenerateSecureLinkRequestObject._is_correct_password(password):
             invalid_request.add_error('password', 'Is not string')
         else:
             instance.password = password
 
+        if not isinstance(profile, str) or profile not in profiles:
+            invalid_request.add_error('profile', 'Is not configured profile')
+        else:
+            instance.profile = profile
+
+        if isinstance(lines, (str, bytes)) or not hasattr(lines, '__iter__'):
+            invalid_request.add_error('lines', 'Is not iterable of lines')
+        else:
+            instance.lines = lines
+
+        if invalid_request.has_errors():
+            return invalid_request
+
+        return instance
+
+
+class GenerateSecureLinkBatchRequestObject(ValidRequestObject):
+    __slots__ = ('items',)
+
+    def __new__(cls, items: list=None, max_size: int=None):
+        invalid_request = InvalidRequestObject()
+        instance = super().__new__(cls)
+
+        if not isinstance(items, list):
+            invalid_request.add_error('items', 'Is not list')
+        elif max_size is not None and len(items) > max_size:
+            invalid_request.add_error('items', 'Is longer than {} items'.format(max_size))
+        else:
+            instance.items = items
+
         if invalid_request.has_errors():
             return invalid_request
 
@@ -0,0 +1,63 @@
+"""nginx secure_link_md5 expressions compiled into functions, which build the string for md5 of a link.
+
+Supported variables:
+    $secure_link_expires - expiration time
+    $request_uri - signed url as it is given
+    $uri - decoded path of the signed url
+    $remote_addr - ip-address
+    $p - password
+Everything else in the expression is kept as literal text.
+"""
+import re
+from urllib.parse import unquote, urlparse
+
+DEFAULT_PROFILE = 'default'
+DEFAULT_EXPRESSION = '$secure_link_expires$request_uri$remote_addr=$p'
+
+VARIABLES = {
+    'secure_link_expires': 'str(expires)',
+    'request_uri': 'url',
+    'uri': 'unquote(urlparse(url).path)',
+    'remote_addr': 'ip_address',
+    'p': 'password',
+}
+VARIABLE_PATTERN = re.compile(r'\$(?:\{(\w+)\}|(\w+))')
+
+
+def compile_secure_link_md5(expression: str, constants: dict=None):
+    """Return a function of (expires, url, ip_address, password), which builds the string for md5.
+
+    The expression is translated to a single concatenation, so it is interpreted only once.
+    Variables given in constants (e.g. {'p': password}, they may be any variables set in nginx config)
+    are replaced with their values and joined with the adjacent literal text at compile time.
+    Raises ValueError for unknown variables.
+    """
+    constants = constants or {}
+    parts = []
+    literal = ''
+    position = 0
+    for match in VARIABLE_PATTERN.finditer(expression):
+        name = match.group(1) or match.group(2)
+        if name not in VARIABLES and name not in constants:
+            raise ValueError('Unknown variable ${} in secure_link_md5 expression {!r}'.format(name, expression))
+        literal += expression[position:match.start()]
+        position = match.end()
+        if name in constants:
+            literal += str(constants[name])
+            continue
+        if literal:
+            parts.append(repr(literal))
+            literal = ''
+        parts.append(VARIABLES[name])
+    literal += expression[position:]
+    if literal:
+        parts.append(repr(literal))
+    source = 'lambda expires, url, ip_address, password: {}'.format(' + '.join(parts) or "''")
+    return eval(compile(source, '<secure_link_md5 {!r}>'.format(expression), 'eval'),
+                {'str': str, 'unquote': unquote, 'urlparse': urlparse})
+
+
+def compile_secure_link_profiles(expressions: dict):
+    """Compile expressions of location profiles, the default profile uses DEFAULT_EXPRESSION unless it is given."""
+    expressions = dict({DEFAULT_PROFILE: DEFAULT_EXPRESSION}, **expressions)
+    return {profile: compile_secure_link_md5(expression) for profile, expression in expressions.items()}
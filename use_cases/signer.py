@@ -0,0 +1,55 @@
+from shared.cache import ExpiringLRUCache
+from shared.response_object import ResponseFailure
+from use_cases.generate_secure_link_use_cases import GenerateSecureLinkUseCase
+from use_cases.request_objects import GenerateSecureLinkRequestObject, round_up_expires
+from use_cases.secure_link_md5 import DEFAULT_EXPRESSION, DEFAULT_PROFILE, compile_secure_link_md5
+
+
+class Signer(object):
+    """Signs links in-process with one password and one secure_link_md5 profile.
+
+    The profile expression is compiled once with the password inlined, so the constant parts of the string for md5
+    (like '=' + password) are joined only once. Signers keep no per-call state, so one instance can be shared
+    by threads. With validate=False the inputs are trusted and signed without request objects.
+    """
+
+    def __init__(self, password: str, profile: str=DEFAULT_PROFILE, expressions: dict=None, validate: bool=True,
+                 cache: ExpiringLRUCache=None, url_max_length: int=GenerateSecureLinkRequestObject.URL_MAX_LENGTH,
+                 expires_bucket_seconds: int=0):
+        """Expressions map profiles to secure_link_md5 expressions like the SECURE_LINK_PROFILES setting.
+
+        Raises ValueError for a password, which is not a string, or a profile, which is not configured.
+        """
+        expressions = dict({DEFAULT_PROFILE: DEFAULT_EXPRESSION}, **(expressions or {}))
+        if not isinstance(password, str):
+            raise ValueError('password: Is not string')
+        if profile not in expressions:
+            raise ValueError('profile: Is not configured profile')
+        self.password = password
+        self.profile = profile
+        self.validate = validate
+        self.url_max_length = url_max_length
+        self.expires_bucket_seconds = expires_bucket_seconds
+        build_string_for_md5 = compile_secure_link_md5(expressions[profile], constants={'p': password})
+        self.use_case = GenerateSecureLinkUseCase(cache=cache, profiles={profile: build_string_for_md5})
+
+    def sign(self, expires: int, url: str, ip_address: str):
+        """Return the secure url, raise ValueError with the errors of invalid parameters."""
+        if self.validate:
+            response = self.use_case.execute(GenerateSecureLinkRequestObject(
+                expires=expires, url=url, ip_address=ip_address, password=self.password,
+                url_max_length=self.url_max_length, profile=self.profile, profiles=(self.profile,),
+                expires_bucket_seconds=self.expires_bucket_seconds))
+            if response.type == ResponseFailure.PARAMETERS_ERROR:
+                raise ValueError(response.message)
+            if not response:
+                raise RuntimeError(response.message)
+            return response.value
+        return self.use_case._get_secure_url(round_up_expires(expires, self.expires_bucket_seconds), url, ip_address,
+                                             self.password, self.profile)
+
+    def sign_many(self, items):
+        """Lazily yield secure urls of (expires, url, ip_address) items."""
+        sign = self.sign
+        for expires, url, ip_address in items:
+            yield sign(expires, url, ip_address)
@@ -1,8 +1,21 @@
-from unittest import TestCase
-from urllib.parse import urlparse, parse_qsl
-
-from use_cases.request_objects import GenerateSecureLinkRequestObject
-from use_cases.generate_secure_link_use_cases import GenerateSecureLinkUseCase
+import base64
+import hashlib
+import random
+import re
+import time
+from unittest import TestCase, mock
+from urllib.parse import urljoin, urlparse, parse_qsl
+
+from shared.cache import ExpiringLRUCache
+from use_cases.request_objects import (GenerateSecureLinkBatchRequestObject, GenerateSecureLinkFanOutRequestObject,
+                                      GenerateSecureLinkRequestObject, GenerateSignedPlaylistRequestObject,
+                                      VerifySecureLinkRequestObject, round_up_expires)
+from use_cases.secure_link_md5 import DEFAULT_EXPRESSION, compile_secure_link_md5, compile_secure_link_profiles
+from use_cases.signer import Signer
+from use_cases.validators import is_correct_ip_address, is_correct_url
+from use_cases.verify_secure_link_use_cases import VerifySecureLinkUseCase
+from use_cases.generate_secure_link_use_cases import (GenerateSecureLinkBatchUseCase, GenerateSecureLinkFanOutUseCase,
+                                                      GenerateSecureLinkUseCase, GenerateSignedPlaylistUseCase)
 
 
 class BuildGenerateSecureLinkRequestObjectTestCase(TestCase):
@@ -39,6 +52,15 @@ class BuildGenerateSecureLinkRequestObjectTestCase(TestCase):
         self.assertFalse(request_object)
         self.assertEqual(request_object.errors[0]['parameter'], 'expires')
 
+    def test_expires_param_must_be_integer(self):
+        for expires in (True, 1.9):
+            self.correct_params_dict['expires'] = expires
+
+            request_object = GenerateSecureLinkRequestObject(**self.correct_params_dict)
+
+            self.assertFalse(request_object)
+            self.assertEqual(request_object.errors[0]['parameter'], 'expires')
+
     # В задании ничего не сказано про то, как в дальнейшем планируется использовать сгенерированные ссылки,
     # поэтому не понятно, нужна ди проверка на срок валидности
     # def test_expires_param_must_be_not_expired_timestamp(self):
@@ -50,6 +72,17 @@ class BuildGenerateSecureLinkRequestObjectTestCase(TestCase):
     #     self.assertFalse(request_object)
     #     self.assertEqual(request_object.errors[0]['parameter'], 'expires')
 
+    def test_expires_param_is_rounded_up_to_bucket(self):
+        for expires, rounded_expires in ((1000, 1200), (1200, 1200), (1201, 1500)):
+            self.correct_params_dict['expires'] = expires
+            request = GenerateSecureLinkRequestObject(expires_bucket_seconds=300, **self.correct_params_dict)
+
+            self.assertEqual(request.expires, rounded_expires)
+
+    def test_round_up_expires(self):
+        self.assertEqual([round_up_expires(expires, 300) for expires in (1000, 1200, 1201)], [1200, 1200, 1500])
+        self.assertEqual(round_up_expires(1201, 0), 1201)
+
     def test_url_param_is_required(self):
         self.correct_params_dict.pop('url')
 
@@ -131,6 +164,26 @@ class GenerateSecureLinkUseCaseTestCase(TestCase):
         self.assertEqual(parsed_url_with_new_query.fragment, parsed_correct_url_with_new_query.fragment)
         self.assertDictEqual(correct_url_with_new_query_query_dict, url_with_new_query_query_dict)
 
+    def test_secure_url_matches_generic_query_rebuilding(self):
+        urls = ['/s/link', '/', '/s/li nk', '/s/%D0%BF', '/s/путь', '/s/link?', '/s/link?a=1&md5=x', '/s/link#top',
+                '/s/link;params', '//host/s/link', '/s/li\tnk', '/s/link\n', '/s/li\x00nk', 'http://host/s/link',
+                's/link', '']
+        for url in urls:
+            request_object = mock.Mock(expires=2147483647, url=url, ip_address='127.0.0.1', password='password')
+            md5 = GenerateSecureLinkUseCase._generate_hash_for_secure_link(2147483647, url, '127.0.0.1', 'password')
+
+            self.assertEqual(self.secure_link_use_case._generate_secure_url(request_object),
+                             GenerateSecureLinkUseCase._add_query_to_url(url, {'md5': md5, 'expires': 2147483647}),
+                             url)
+
+    def test_encode_hash_matches_base64_replacing(self):
+        random_generator = random.Random(0)
+        for length in [0, 1, 2, 20, 32] + [16] * 100:
+            digest = bytes(random_generator.randrange(256) for _ in range(length))
+            hash_string = base64.b64encode(digest).decode().replace('+', '-').replace('/', '_').replace('=', '')
+
+            self.assertEqual(GenerateSecureLinkUseCase._encode_hash(digest), hash_string)
+
     def test_get_path_from_url(self):
         correct_url_without_query = '/s/link'
         url_without_query = GenerateSecureLinkUseCase._get_path_from_url(self.url)
@@ -168,3 +221,362 @@ class GenerateSecureLinkUseCaseTestCase(TestCase):
         self.assertEqual(parsed_correct_secure_link.params, parsed_secure_link.params)
         self.assertEqual(parsed_correct_secure_link.fragment, parsed_secure_link.fragment)
         self.assertDictEqual(correct_secure_link_query_dict, secure_link_query_dict)
+
+
+class GenerateSecureLinkUseCaseWithCacheTestCase(TestCase):
+    def setUp(self):
+        self.cache = ExpiringLRUCache(max_size=10)
+        self.secure_link_use_case = GenerateSecureLinkUseCase(cache=self.cache)
+        self.request_object = GenerateSecureLinkRequestObject(expires=2147483647, url='/s/link',
+                                                              ip_address='127.0.0.1', password='password')
+
+    def test_repeated_request_is_served_from_cache(self):
+        with mock.patch.object(GenerateSecureLinkUseCase, '_generate_hash_for_secure_link',
+                               wraps=GenerateSecureLinkUseCase._generate_hash_for_secure_link) as generate_hash:
+            first_response = self.secure_link_use_case.execute(self.request_object)
+            second_response = self.secure_link_use_case.execute(self.request_object)
+
+        self.assertEqual(generate_hash.call_count, 1)
+        self.assertEqual(first_response.value, '/s/link?md5=FbRZ_kL2P7SJMI6hCxS11Q&expires=2147483647')
+        self.assertEqual(second_response.value, first_response.value)
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_presigned_links_are_looked_up_before_cache(self):
+        presigned = mock.Mock()
+        presigned.get.side_effect = lambda profile, expires, url, ip_address, password: (
+            '/presigned' if url == '/s/link' else None)
+        use_case = GenerateSecureLinkUseCase(cache=self.cache, presigned=presigned)
+
+        self.assertEqual(use_case.execute(self.request_object).value, '/presigned')
+        presigned.get.assert_called_once_with('default', 2147483647, '/s/link', '127.0.0.1', 'password')
+        self.assertEqual(len(self.cache), 0)
+        request_object = GenerateSecureLinkRequestObject(expires=2147483647, url='/s/other', ip_address='127.0.0.1',
+                                                         password='password')
+        self.assertEqual(use_case.execute(request_object).value,
+                         '/s/other?md5=2HhQhypLLoTZLpMIPeEahA&expires=2147483647')
+        self.assertEqual(len(self.cache), 1)
+
+
+class SecureLinkMd5ExpressionTestCase(TestCase):
+    def setUp(self):
+        self.params = {'expires': 2147483647, 'url': '/s/путь/link?lang=en', 'ip_address': '127.0.0.1',
+                       'password': 'password'}
+
+    def test_default_expression_matches_hardcoded_hash(self):
+        build_string_for_md5 = compile_secure_link_md5(DEFAULT_EXPRESSION)
+
+        self.assertEqual(build_string_for_md5(**self.params), '2147483647/s/путь/link?lang=en127.0.0.1=password')
+
+    def test_uri_is_decoded_path(self):
+        build_string_for_md5 = compile_secure_link_md5('${secure_link_expires}:$uri secret')
+
+        self.assertEqual(build_string_for_md5(**dict(self.params, url='/s/%D0%BF/link?lang=en')),
+                         '2147483647:/s/п/link secret')
+
+    def test_constants_are_joined_with_literal_text(self):
+        build_string_for_md5 = compile_secure_link_md5(DEFAULT_EXPRESSION, constants={'p': 'secret'})
+
+        self.assertEqual(build_string_for_md5(**self.params), '2147483647/s/путь/link?lang=en127.0.0.1=secret')
+        self.assertIn('=secret', build_string_for_md5.__code__.co_consts)
+        self.assertEqual(compile_secure_link_md5('$uri$host', constants={'host': 'cdn'})(**self.params),
+                         '/s/путь/linkcdn')
+
+    def test_unknown_variable_is_rejected(self):
+        with self.assertRaises(ValueError):
+            compile_secure_link_md5('$secure_link_expires$host')
+
+    def test_request_object_profile_must_be_configured(self):
+        request_object = GenerateSecureLinkRequestObject(profile='private', **self.params)
+
+        self.assertFalse(request_object)
+        self.assertEqual(request_object.errors[0]['parameter'], 'profile')
+
+    def test_profiles_are_signed_and_cached_separately(self):
+        profiles = compile_secure_link_profiles({'private': '$secure_link_expires$uri=$p'})
+        use_case = GenerateSecureLinkUseCase(cache=ExpiringLRUCache(max_size=10), profiles=profiles)
+        request_objects = [GenerateSecureLinkRequestObject(profile=profile, profiles=profiles, **self.params)
+                           for profile in ('default', 'private')]
+        string_for_md5 = '2147483647/s/путь/link=password'
+        md5 = GenerateSecureLinkUseCase._encode_hash(hashlib.md5(string_for_md5.encode()).digest())
+
+        default_response, private_response = [use_case.execute(request_object) for request_object in request_objects]
+
+        self.assertEqual(default_response.value, GenerateSecureLinkUseCase().execute(request_objects[0]).value)
+        self.assertEqual(private_response.value, '/s/путь/link?lang=en&md5={}&expires=2147483647'.format(md5))
+
+
+class SignerTestCase(TestCase):
+    def setUp(self):
+        self.items = [(2147483647, '/s/link', '127.0.0.1'), (2147483647, '/s/путь/link?lang=en', '10.0.0.1')]
+
+    def _sign_with_use_case(self, expires: int, url: str, ip_address: str, **params):
+        request_object = GenerateSecureLinkRequestObject(expires=expires, url=url, ip_address=ip_address,
+                                                         password='password', **params)
+        return GenerateSecureLinkUseCase(profiles=params.get('profiles')).execute(request_object).value
+
+    def test_links_match_use_case(self):
+        for validate in (True, False):
+            signer = Signer('password', validate=validate)
+
+            self.assertEqual(list(signer.sign_many(self.items)),
+                             [self._sign_with_use_case(*item) for item in self.items])
+
+    def test_links_of_profile_match_use_case(self):
+        expressions = {'private': '$secure_link_expires$uri=$p'}
+        profiles = compile_secure_link_profiles(expressions)
+        signer = Signer('password', profile='private', expressions=expressions, validate=False)
+
+        self.assertEqual(signer.sign(*self.items[1]),
+                         self._sign_with_use_case(*self.items[1], profile='private', profiles=profiles))
+
+    def test_sign_many_is_lazy(self):
+        links = Signer('password').sign_many(iter([self.items[0], (None, '/s/link', '127.0.0.1')]))
+
+        self.assertEqual(next(links), '/s/link?md5=FbRZ_kL2P7SJMI6hCxS11Q&expires=2147483647')
+        with self.assertRaisesRegex(ValueError, '^expires: '):
+            next(links)
+
+    def test_expires_are_rounded_to_buckets(self):
+        for validate in (True, False):
+            signer = Signer('password', validate=validate, expires_bucket_seconds=3600)
+
+            self.assertTrue(signer.sign(1000, '/s/link', '127.0.0.1').endswith('&expires=3600'))
+
+    def test_profile_must_be_configured(self):
+        with self.assertRaises(ValueError):
+            Signer('password', profile='private')
+
+
+class GenerateSecureLinkBatchTestCase(TestCase):
+    def setUp(self):
+        self.correct_request_object = GenerateSecureLinkRequestObject(expires=2147483647, url='/s/link',
+                                                                      ip_address='127.0.0.1', password='password')
+        self.incorrect_request_object = GenerateSecureLinkRequestObject()
+
+    def test_items_must_be_list(self):
+        request_object = GenerateSecureLinkBatchRequestObject(items=None)
+
+        self.assertFalse(request_object)
+        self.assertEqual(request_object.errors[0]['parameter'], 'items')
+
+    def test_items_count_is_limited(self):
+        request_object = GenerateSecureLinkBatchRequestObject(items=[self.correct_request_object] * 3, max_size=2)
+
+        self.assertFalse(request_object)
+        self.assertEqual(request_object.errors[0]['parameter'], 'items')
+
+    def test_process_request_keeps_items_order(self):
+        request_object = GenerateSecureLinkBatchRequestObject(
+            items=[self.correct_request_object, self.incorrect_request_object, self.correct_request_object])
+
+        response_object = GenerateSecureLinkBatchUseCase().execute(request_object)
+
+        self.assertTrue(bool(response_object))
+        self.assertEqual(len(response_object.value), 3)
+        self.assertEqual(response_object.value[0], '/s/link?md5=FbRZ_kL2P7SJMI6hCxS11Q&expires=2147483647')
+        self.assertEqual(response_object.value[1]['type'], 'PARAMETERS_ERROR')
+        self.assertEqual(response_object.value[2], response_object.value[0])
+
+
+class GenerateSecureLinkFanOutTestCase(TestCase):
+    def setUp(self):
+        self.correct_params_dict = {
+            'expires': 2147483647,
+            'url': '/s/link?lang=en',
+            'ip_addresses': ['127.0.0.1', '10.0.0.1', '192.168.1.254'],
+            'password': 'password'
+        }
+
+    def test_ip_addresses_must_be_correct(self):
+        self.correct_params_dict['ip_addresses'].append('1270.0.1')
+
+        request_object = GenerateSecureLinkFanOutRequestObject(**self.correct_params_dict)
+
+        self.assertFalse(request_object)
+        self.assertEqual(request_object.errors[0]['parameter'], 'ip_addresses')
+
+    def test_process_request_matches_per_link_signing(self):
+        request_object = GenerateSecureLinkFanOutRequestObject(**self.correct_params_dict)
+
+        response_object = GenerateSecureLinkFanOutUseCase().execute(request_object)
+
+        ip_addresses = self.correct_params_dict.pop('ip_addresses')
+        correct_secure_links = [
+            GenerateSecureLinkUseCase().execute(
+                GenerateSecureLinkRequestObject(ip_address=ip_address, **self.correct_params_dict)).value
+            for ip_address in ip_addresses]
+        self.assertTrue(bool(response_object))
+        self.assertEqual(response_object.value, correct_secure_links)
+
+    def test_secure_url_builder_with_existing_md5_query(self):
+        url = '/s/link?md5=HASH~MARKER'
+
+        build_secure_url = GenerateSecureLinkUseCase._get_secure_url_builder(url=url, expires=1)
+
+        self.assertEqual(build_secure_url('FbRZ_kL2P7SJMI6hCxS11Q'),
+                         GenerateSecureLinkUseCase._add_query_to_url(
+                             url=url, query_dict={'md5': 'FbRZ_kL2P7SJMI6hCxS11Q', 'expires': 1}))
+
+
+class GenerateSignedPlaylistTestCase(TestCase):
+    def setUp(self):
+        self.params = {'expires': 2147483647, 'url': '/s/video/index.m3u8?lang=en', 'ip_address': '127.0.0.1',
+                       'password': 'password'}
+
+    def _sign(self, url: str, **params):
+        request_object = GenerateSecureLinkRequestObject(**dict(self.params, url=url, **params))
+        return GenerateSecureLinkUseCase(profiles=params.get('profiles')).execute(request_object).value
+
+    def _sign_playlist(self, lines, use_case=None, **params):
+        request_object = GenerateSignedPlaylistRequestObject(lines=lines, **dict(self.params, **params))
+        return (use_case or GenerateSignedPlaylistUseCase()).execute(request_object).value
+
+    def test_lines_must_be_iterable(self):
+        request_object = GenerateSignedPlaylistRequestObject(lines='#EXTM3U', **self.params)
+
+        self.assertFalse(request_object)
+        self.assertEqual(request_object.errors[0]['parameter'], 'lines')
+
+    def test_every_uri_is_signed(self):
+        lines = ['#EXTM3U\n', '#EXT-X-KEY:METHOD=AES-128,URI="key.bin",IV=0x1\n', '#EXTINF:4.0,\r\n',
+                 'segment_1.ts\r\n', '\n', '#EXTINF:4.0,\n', '/s/other/segment_2.ts?a=1\n',
+                 'https://cdn.example.com/s/segment_3.ts']
+
+        self.assertEqual(list(self._sign_playlist(lines)), [
+            '#EXTM3U\n',
+            '#EXT-X-KEY:METHOD=AES-128,URI="{}",IV=0x1\n'.format(self._sign('/s/video/key.bin')),
+            '#EXTINF:4.0,\r\n',
+            self._sign('/s/video/segment_1.ts') + '\r\n',
+            '\n',
+            '#EXTINF:4.0,\n',
+            self._sign('/s/other/segment_2.ts?a=1') + '\n',
+            self._sign('https://cdn.example.com/s/segment_3.ts'),
+        ])
+
+    def test_uris_are_signed_with_profile(self):
+        expressions = {'private': '$secure_link_expires$uri=$p'}
+        use_case = GenerateSignedPlaylistUseCase(expressions=expressions)
+
+        self.assertEqual(list(self._sign_playlist(['segment.ts?a=1'], use_case=use_case, profile='private',
+                                                  profiles=expressions)),
+                         [self._sign('/s/video/segment.ts?a=1', profile='private',
+                                     profiles=compile_secure_link_profiles(expressions))])
+
+    def test_plain_relative_uris_are_joined_like_urljoin(self):
+        uris = ['segment.ts', 'a/segment.ts?x=1#y', 'a/../segment.ts', './segment.ts', '../segment.ts',
+                '//cdn/segment.ts', 'http:segment.ts', 'segment.ts;p', '?x=1', '#y', 'seg\tment.ts', 'п.ts',
+                'segment.ts#', 'segment.ts?#', 'segment.ts?', ' segment.ts', 'segment.ts ', ' segment.ts?#']
+        self.assertTrue(GenerateSignedPlaylistUseCase._is_plain_relative_uri('a/segment.ts'))
+        for base_url in ('/s/video/index.m3u8?lang=en', '/s/video/', 'http://cdn', 'https://cdn/s/v/index.m3u8'):
+            base_directory = urljoin(base_url, 'x')[:-1]
+            for uri in uris:
+                if GenerateSignedPlaylistUseCase._is_plain_relative_uri(uri):
+                    self.assertEqual(base_directory + uri, urljoin(base_url, uri))
+
+    def test_incorrect_uri_is_kept_after_comment(self):
+        self.assertEqual(list(self._sign_playlist(['/s/"segment".ts\n'])),
+                         ['# url: Is not correct url or path\n', '/s/"segment".ts\n'])
+
+    def test_lines_are_read_lazily(self):
+        lines = iter(['#EXTM3U\n', 'segment.ts\n'])
+
+        signed_lines = self._sign_playlist(lines)
+
+        self.assertEqual(next(signed_lines), '#EXTM3U\n')
+        self.assertEqual(next(lines), 'segment.ts\n')
+
+
+class VerifySecureLinkUseCaseTestCase(TestCase):
+    def setUp(self):
+        self.verify_use_case = VerifySecureLinkUseCase()
+        self.correct_params_dict = {
+            'url': '/s/link?md5=FbRZ_kL2P7SJMI6hCxS11Q&expires=2147483647',
+            'ip_address': '127.0.0.1',
+            'password': 'password',
+            'now': 1516741096,
+        }
+
+    def _verify(self, **params):
+        request_object = VerifySecureLinkRequestObject(**dict(self.correct_params_dict, **params))
+        return self.verify_use_case.execute(request_object).value
+
+    def test_generated_link_is_valid(self):
+        secure_link = GenerateSecureLinkUseCase().execute(GenerateSecureLinkRequestObject(
+            expires=2147483647, url='/s/video/1.ts', ip_address='127.0.0.1', password='password')).value
+
+        self.assertEqual(self._verify(), VerifySecureLinkUseCase.VALID)
+        self.assertEqual(self._verify(url=secure_link), VerifySecureLinkUseCase.VALID)
+
+    def test_link_with_past_expiration_time_is_expired(self):
+        self.assertEqual(self._verify(now=2147483648), VerifySecureLinkUseCase.EXPIRED)
+
+    def test_link_for_another_ip_address_is_bad(self):
+        self.assertEqual(self._verify(ip_address='127.0.0.2'), VerifySecureLinkUseCase.BAD)
+
+    def test_link_with_another_expiration_time_is_bad(self):
+        self.assertEqual(self._verify(url='/s/link?md5=FbRZ_kL2P7SJMI6hCxS11Q&expires=2147483646'),
+                         VerifySecureLinkUseCase.BAD)
+
+    def test_link_with_incorrect_args_is_bad(self):
+        for url in ['/s/link', '/s/link?md5=FbRZ_kL2P7SJMI6hCxS11Q', '/s/link?expires=2147483647',
+                    '/s/link?md5=FbRZ_kL2P7SJMI6hCxS11Q&expires=0', '/s/link?md5=FbRZ_kL2P7SJMI6hCxS11Q&expires=-1',
+                    '/s/link?md5=FbRZ+kL2P7SJMI6hCxS11Q&expires=2147483647',
+                    '/s/link?md5=FbRZ_kL2P7SJMI6hCxS1&expires=2147483647']:
+            self.assertEqual(self._verify(url=url), VerifySecureLinkUseCase.BAD, url)
+
+    def test_link_is_verified_with_expression(self):
+        expression = '$secure_link_expires$uri secret $remote_addr'
+        profiles = compile_secure_link_profiles({'private': expression})
+        secure_link = GenerateSecureLinkUseCase(profiles=profiles).execute(GenerateSecureLinkRequestObject(
+            expires=2147483647, url='/s/путь/1.ts', ip_address='127.0.0.1', password='password', profile='private',
+            profiles=profiles)).value
+        self.verify_use_case = VerifySecureLinkUseCase(build_string_for_md5=compile_secure_link_md5(expression))
+
+        self.assertEqual(self._verify(url=secure_link.replace('путь', '%D0%BF%D1%83%D1%82%D1%8C')),
+                         VerifySecureLinkUseCase.VALID)
+        self.assertEqual(self._verify(), VerifySecureLinkUseCase.BAD)
+
+    def test_ip_address_must_be_correct(self):
+        request_object = VerifySecureLinkRequestObject(**dict(self.correct_params_dict, ip_address='1270.0.1'))
+
+        self.assertFalse(request_object)
+        self.assertEqual(request_object.errors[0]['parameter'], 'ip_address')
+
+
+class ValidatorsTestCase(TestCase):
+    former_url_pattern = re.compile("^((?:http|ftp)s?://)?[\\w.-]?(?:.[\\w.-]+)+[\\w\\-._:/?#[\\]@!$&'()*+,;=]+$")
+    former_ip_address_pattern = re.compile(
+        '^(?:(?:25[0-5]|2[0-4]\\d|[01]?\\d\\d?)\\.){3}(?:25[0-5]|2[0-4]\\d|[01]?\\d\\d?)$')
+
+    def setUp(self):
+        self.random = random.Random(0)
+
+    def test_url_validation_matches_former_regular_expression(self):
+        characters = "ab1_.-/:?#[]@!$&'()*+,;= \"\\x00\u0439\u0663%~\t"
+        for _ in range(20000):
+            url = self.random.choice(['', 'http://', 'https://', 'ftp://', 'ftps:/', 'HTTP://']) + ''.join(
+                self.random.choice(characters) for _ in range(self.random.randint(0, 8)))
+            self.assertEqual(is_correct_url(url), bool(self.former_url_pattern.match(url)), repr(url))
+
+    def test_ip_address_validation_matches_former_regular_expression(self):
+        for _ in range(20000):
+            ip_address = '.'.join(str(self.random.randint(0, 300)).zfill(self.random.randint(0, 3))
+                                  for _ in range(self.random.choice([3, 4, 4, 5])))
+            self.assertEqual(is_correct_ip_address(ip_address),
+                             bool(self.former_ip_address_pattern.match(ip_address)), ip_address)
+
+    def test_url_with_newline_is_incorrect(self):
+        self.assertFalse(is_correct_url('/s/link\n'))
+
+    def test_url_length_is_limited(self):
+        self.assertTrue(is_correct_url('/s/link', max_length=7))
+        self.assertFalse(is_correct_url('/s/link', max_length=6))
+        self.assertFalse(GenerateSecureLinkRequestObject(expires=1, url='/s/link', ip_address='127.0.0.1',
+                                                         password='password', url_max_length=6))
+
+    def test_adversarial_url_is_validated_in_linear_time(self):
+        started = time.perf_counter()
+
+        self.assertFalse(is_correct_url('a.' * 2000 + '"', max_length=None))
+
+        self.assertLess(time.perf_counter() - started, 0.5)
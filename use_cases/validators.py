@@ -0,0 +1,65 @@
+"""Linear-time validators of request parameters.
+
+url is checked against the same language as the former regular expression
+
+    ^((?:http|ftp)s?://)?[\\w.-]?(?:.[\\w.-]+)+[\\w\\-._:/?#[\\]@!$&'()*+,;=]+$
+
+whose nested quantifiers backtrack exponentially on inputs like 'a.a.a.a.a."'. Every character is first
+mapped to its class: w for [\\w.-], t for the rest of the tail characters, o for any other character and
+n for newline. The class string is matched by a pattern derived from the minimal automaton of the language,
+where every step is decided by the next class, so matching never backtracks more than one step.
+"""
+import re
+
+URL_SCHEMES = ('http://', 'https://', 'ftp://', 'ftps://')
+URL_TAIL_CHARACTERS = frozenset(":/?#[]@!$&'()*+,;=")
+DIGITS = '0123456789'
+
+_URL_CLASSES_TAIL = b'(?:w|[ot]w)*(?:w|tw|t|tt[wt]*)'
+url_classes_pattern = re.compile(b'(?:ww|w[to]w|[to]w)' + _URL_CLASSES_TAIL)
+url_classes_after_scheme_pattern = re.compile(b'(?:' + _URL_CLASSES_TAIL + b')?')
+
+
+def _get_character_class(character: str):
+    if character == '\n':
+        return 'n'
+    if character.isalnum() or character in '_.-':
+        return 'w'
+    if character in URL_TAIL_CHARACTERS:
+        return 't'
+    return 'o'
+
+
+class _CharacterClasses(dict):
+    def __missing__(self, code: int):
+        return _get_character_class(chr(code))
+
+
+_ascii_classes_table = bytes(ord(_get_character_class(chr(code))) for code in range(128)) + b'o' * 128
+_character_classes = _CharacterClasses()
+
+
+def _get_url_classes(url: str):
+    try:
+        return url.encode('ascii').translate(_ascii_classes_table)
+    except UnicodeEncodeError:
+        return url.translate(_character_classes).encode('ascii')
+
+
+def is_correct_url(url, max_length: int=None):
+    if not isinstance(url, str) or (max_length is not None and len(url) > max_length):
+        return False
+    url_classes = _get_url_classes(url)
+    for scheme in URL_SCHEMES:
+        if url.startswith(scheme):
+            return url_classes_after_scheme_pattern.fullmatch(url_classes, len(scheme)) is not None
+    return url_classes_pattern.fullmatch(url_classes) is not None
+
+
+def is_correct_ip_address(ip_address):
+    """Check dotted decimal ip v4 address, octets may have leading zeros but no more than 3 digits."""
+    if not isinstance(ip_address, str) or len(ip_address) > 15:
+        return False
+    octets = ip_address.split('.')
+    return len(octets) == 4 and all(0 < len(octet) <= 3 and not octet.strip(DIGITS) and int(octet) <= 255
+                                    for octet in octets)
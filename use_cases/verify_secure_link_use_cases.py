@@ -0,0 +1,76 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import time
+from urllib.parse import unquote, urlparse
+
+from shared.response_object import ResponseSuccess
+from shared.use_case import UseCase
+from use_cases.generate_secure_link_use_cases import GenerateSecureLinkUseCase
+
+
+class VerifySecureLinkUseCase(UseCase):
+    """Checks secure links the way nginx does with
+
+        secure_link $arg_md5,$arg_expires;
+        secure_link_md5 "$secure_link_expires$uri$remote_addr=$p";
+    """
+    VALID = 'VALID'
+    EXPIRED = 'EXPIRED'
+    BAD = 'BAD'
+
+    def __init__(self, build_string_for_md5=None):
+        """build_string_for_md5 from compile_secure_link_md5 replaces the expression above. It gets the path
+        of the link (not decoded and without query) as url, so $uri is the decoded path like in nginx."""
+        self.build_string_for_md5 = build_string_for_md5
+
+    def process_request(self, request_object):
+        now = request_object.now if request_object.now is not None else int(time.time())
+        return ResponseSuccess(self._verify_secure_link(url=request_object.url,
+                                                        ip_address=request_object.ip_address,
+                                                        password=request_object.password,
+                                                        now=now))
+
+    def _verify_secure_link(self, url: str, ip_address: str, password: str, now: int):
+        url_parts = urlparse(url)
+        md5 = self._get_arg_from_query(url_parts.query, 'md5')
+        expires = self._get_arg_from_query(url_parts.query, 'expires')
+        if md5 is None or not expires or expires.strip('0123456789') or not int(expires):
+            return self.BAD
+        digest = self._decode_hash(md5)
+        if digest is None:
+            return self.BAD
+        if self.build_string_for_md5 is None:
+            correct_md5 = GenerateSecureLinkUseCase._generate_hash_for_secure_link(expires=expires,
+                                                                                   url=unquote(url_parts.path),
+                                                                                   ip_address=ip_address,
+                                                                                   password=password)
+        else:
+            string_for_md5 = self.build_string_for_md5(expires, url_parts.path, ip_address, password)
+            correct_md5 = GenerateSecureLinkUseCase._encode_hash(hashlib.md5(string_for_md5.encode('utf-8')).digest())
+        if not hmac.compare_digest(GenerateSecureLinkUseCase._encode_hash(digest), correct_md5):
+            return self.BAD
+        if int(expires) < now:
+            return self.EXPIRED
+        return self.VALID
+
+    @classmethod
+    def _get_arg_from_query(cls, query: str, name: str):
+        """Return the first raw (not decoded) value of the query argument like nginx $arg_name does."""
+        prefix = name + '='
+        for arg in query.split('&'):
+            if arg.startswith(prefix):
+                return arg[len(prefix):]
+        return None
+
+    @classmethod
+    def _decode_hash(cls, md5: str):
+        md5 = md5.split('=', 1)[0]
+        if len(md5) > 24 or len(md5) % 4 == 1 or '+' in md5 or '/' in md5:
+            return None
+        try:
+            digest = base64.b64decode(md5 + '=' * (-len(md5) % 4), altchars=b'-_', validate=True)
+        except (binascii.Error, ValueError):
+            return None
+        return digest if len(digest) == 16 else None
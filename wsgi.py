@@ -0,0 +1,6 @@
+import os
+
+from api import create_wsgi_application
+
+config_name = os.getenv('APP_SETTINGS')
+application = create_wsgi_application(config_name)